@@ -20,8 +20,13 @@ from .concierge import NoAvailableDataError
 from . import utils
 from . import irisseismic
 from . import irismustangmetrics
+from . import native_psd
 from . import PDF_aggregator
 
+# Native PSDs are calculated for batches of about this many samples at most, which
+# bounds the merged float64 copies held for a batch to about 256 MB
+_NATIVE_BATCH_SAMPLES = 2**25
+
 
 #from astropy.io.ascii.tests.test_connect import files
 
@@ -70,11 +75,98 @@ def PSD_metrics(concierge):
 
         # Apply the channelFilter and drop multiple metadata epochs
         availability = availability[availability.channel.str.contains(channelFilter)].drop_duplicates(['snclId'])
+
+        # Request this day's waveforms together where the data source supports it
+        concierge.prefetch_dataselect([(av.network, av.station, av.location, av.channel, starttime, endtime)
+                                       for av in availability.itertuples()])
         # Loop over rows of the availability dataframe
         logger.info('Calculating PSD values for %d SNCLs on %s' % (availability.shape[0],str(starttime).split('T')[0]))
 
-        for (index, av) in availability.iterrows():
+        # Instrument response from a local RESP file, PH5 or the evalresp web service, cached by getSpectra
+        def get_evalresp(r_stream):
+            sampling_rate = utils.get_slot(r_stream, 'sampling_rate')
+            return utils.getSpectra(r_stream, sampling_rate, "PSD", concierge)
+
+        # Write out the metrics and corrected PSDs of a SNCL, or log the exception raised for it
+        def write_psd(index, av, result):
             logger.info('%03d Calculating PSD values for %s' % (index, av.snclId))
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                (df, PSDcorrected, PDF) = result
+
+                if not df.empty:
+                    dataframes.append(df)
+
+                if "psd_corrected" in concierge.metric_names :
+                    # Write out the corrected PSDs
+                    # Do it this way to have each individual day file properly named with starttime.date
+                    subFolder = '%s/%s/%s/' % (concierge.psd_dir, av.network, av.station)
+                    filename = '%s_%s_PSDCorrected.csv' % (av.snclId, starttime.date)
+                    filepath = subFolder + filename
+                    
+                    if concierge.output == 'csv':
+                        
+                        if not os.path.isdir(subFolder):
+                            logger.info("psd_dir %s does not exist, creating directory" % subFolder)
+                            os.makedirs(subFolder)
+                        logger.info('Writing corrected PSD values to %s' % filepath)
+                    elif concierge.output == 'db':
+                        logger.info('Writing corrected PSD values to %s' % concierge.db_name)
+
+                    try:
+                        # Add target
+                        PSDcorrected['target'] = av.snclId
+                        PSDcorrected.rename(columns={'freq':'frequency'}, inplace=True)
+                        PSDcorrected = PSDcorrected[['target','starttime','endtime','frequency','power']]
+                        utils.write_numeric_df(PSDcorrected, filepath, concierge, sigfigs=concierge.sigfigs)
+                    except Exception as e:
+                        logger.debug(e)
+                        logger.error('Unable to write %s' % (filepath))
+                        raise
+
+                
+            except Exception as e:
+                if str(e).lower().find('could not resolve host: service.iris.edu') > -1:
+                    logger.debug(e)
+                    logger.error('getEvalresp failed to find service.iris.edu')
+                elif str(e).lower().find('no psds returned') > -1:
+                    logger.warning("IRISMustangMetrics: No PSDs returned for %s" % (av.snclId))
+                else:
+                    logger.error(e)
+                logger.warning('"PSD" metric calculation failed for %s' % (av.snclId))
+
+        # Native PSDs of the SNCLs of a station are calculated together, transforming the
+        # segments of SNCLs that share a sampling rate at once. Errors are kept to be
+        # reported per SNCL.
+        def write_native_psds(channels):
+            pending = []
+            results = {}
+            for (index, av, r_stream) in channels:
+                try:
+                    pending.append((index, r_stream, get_evalresp(r_stream)))
+                except Exception as e:
+                    results[index] = e
+            r_streams = [r_stream for (_, r_stream, _) in pending]
+            evalresps = [evalresp for (_, _, evalresp) in pending]
+            for ((index, _, _), result) in zip(pending, native_psd.apply_PSD_metrics(r_streams, evalresps)):
+                results[index] = result
+            for (index, av, r_stream) in channels:
+                write_psd(index, av, results[index])
+
+        calculate_psd = any(key in function_metadata for key in ("PSD","PSDText"))
+        native = concierge.psd_engine == 'native' and calculate_psd
+        channels = []
+        channel_samples = 0
+
+        for (index, av) in availability.iterrows():
+
+            # Close a native batch at the end of a station or when it holds enough samples
+            if channels and (channels[-1][1].network != av.network or channels[-1][1].station != av.station or
+                             channel_samples >= _NATIVE_BATCH_SAMPLES):
+                write_native_psds(channels)
+                channels = []
+                channel_samples = 0
 
             # Get the data ----------------------------------------------
 
@@ -93,62 +185,19 @@ def PSD_metrics(concierge):
                 continue
 
             # Run the PSD metric ----------------------------------------
-            if any(key in function_metadata for key in ("PSD","PSDText")) :
+            if native:
+                channels.append((index, av, r_stream))
+                channel_samples += (endtime - starttime) * utils.get_slot(r_stream, 'sampling_rate')
+            elif calculate_psd:
                 try:
-                    evalresp = None
-                    if (concierge.resp_dir):   # if resp_dir: run evalresp on local RESP file instead of web service
-                        sampling_rate = utils.get_slot(r_stream, 'sampling_rate')
-                        evalresp = utils.getSpectra(r_stream, sampling_rate, "PSD", concierge)
-                    if (concierge.dataselect_type == "ph5ws"):
-                        sampling_rate = utils.get_slot(r_stream, 'sampling_rate')
-                        evalresp = utils.getSpectra(r_stream, sampling_rate, "PSD", concierge)
-                    # get corrected PSD
-                    try:
-                        (df, PSDcorrected, PDF) = irismustangmetrics.apply_PSD_metric(r_stream, evalresp=evalresp)
-                    except Exception as e:
-                        raise
-
-                    if not df.empty:
-                        dataframes.append(df)
-
-                    if "psd_corrected" in concierge.metric_names :
-                        # Write out the corrected PSDs
-                        # Do it this way to have each individual day file properly named with starttime.date
-                        subFolder = '%s/%s/%s/' % (concierge.psd_dir, av.network, av.station)
-                        filename = '%s_%s_PSDCorrected.csv' % (av.snclId, starttime.date)
-                        filepath = subFolder + filename
-                        
-                        if concierge.output == 'csv':
-                            
-                            if not os.path.isdir(subFolder):
-                                logger.info("psd_dir %s does not exist, creating directory" % subFolder)
-                                os.makedirs(subFolder)
-                            logger.info('Writing corrected PSD values to %s' % filepath)
-                        elif concierge.output == 'db':
-                            logger.info('Writing corrected PSD values to %s' % concierge.db_name)
-
-                        try:
-                            # Add target
-                            PSDcorrected['target'] = av.snclId
-                            PSDcorrected.rename(columns={'freq':'frequency'}, inplace=True)
-                            PSDcorrected = PSDcorrected[['target','starttime','endtime','frequency','power']]
-                            utils.write_numeric_df(PSDcorrected, filepath, concierge, sigfigs=concierge.sigfigs)
-                        except Exception as e:
-                            logger.debug(e)
-                            logger.error('Unable to write %s' % (filepath))
-                            raise
-
-                    
+                    evalresp = get_evalresp(r_stream)
+                    result = irismustangmetrics.apply_PSD_metric(r_stream, evalresp=evalresp)
                 except Exception as e:
-                    if str(e).lower().find('could not resolve host: service.iris.edu') > -1:
-                        logger.debug(e)
-                        logger.error('getEvalresp failed to find service.iris.edu')
-                    elif str(e).lower().find('no psds returned') > -1:
-                        logger.warning("IRISMustangMetrics: No PSDs returned for %s" % (av.snclId))
-                    else:
-                        logger.error(e)
-                    logger.warning('"PSD" metric calculation failed for %s' % (av.snclId))
-                    continue
+                    result = e
+                write_psd(index, av, result)
+
+        if channels:
+            write_native_psds(channels)
             
 
     #########################
@@ -17,7 +17,6 @@ import pandas as pd
 from .concierge import NoAvailableDataError
 
 from . import utils
-from . import irisseismic
 from . import irismustangmetrics
 
 
@@ -125,8 +124,8 @@ def SNR_metrics(concierge):
 
             # get the travel time between the event and the station
             try:
-                tt = irisseismic.getTraveltime(event.latitude, event.longitude, event.depth, 
-                                               av.latitude, av.longitude)
+                tt = concierge.get_traveltime(event.latitude, event.longitude, event.depth, 
+                                             av.latitude, av.longitude)
             except Exception as e:
                 logger.warning('Skipping because getTravelTime failed: %s' % (e))
                 continue
@@ -0,0 +1,351 @@
+"""
+ISPAQ local miniSEED archive access.
+
+A :class:`FileIndex` keeps track of the day files found below a local
+``dataselect_url`` so that the Concierge never has to walk the directory
+tree to answer availability and dataselect requests.  When the archive
+follows a known directory layout (e.g. SDS), an :class:`ArchiveLayout`
+computes file paths directly instead.
+
+:copyright:
+    Mazama Science
+:license:
+    GNU Lesser General Public License, Version 3
+    (http://www.gnu.org/copyleft/lesser.html)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+import re
+import glob
+import string
+import hashlib
+import sqlite3
+from collections import namedtuple
+
+
+# miniSEED day file names:  code1.code2.code3.code4.YYYY.JJJ[.Q]
+# The four codes are stored in file name order.  Mapping them onto
+# network/station/location/channel is left to the caller (see sncl_format).
+_FILENAME = re.compile(r'^([^.]*)\.([^.]*)\.([^.]*)\.([^.]*)\.([12][0-9]{3})\.([0-9]{3})(?:\.([A-Z]))?$')
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS directories (
+        path text PRIMARY KEY,
+        parent text,
+        mtime integer NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS files (
+        path text PRIMARY KEY,
+        directory text NOT NULL,
+        code1 text NOT NULL,
+        code2 text NOT NULL,
+        code3 text NOT NULL,
+        code4 text NOT NULL,
+        year integer NOT NULL,
+        jday integer NOT NULL,
+        quality text
+    );
+    CREATE INDEX IF NOT EXISTS files_by_sncl ON files (code1, code2, code3, code4, year, jday);
+    CREATE INDEX IF NOT EXISTS files_by_directory ON files (directory);
+"""
+
+IndexedFile = namedtuple('IndexedFile', ['path', 'snclId', 'year', 'jday', 'quality'])
+
+# SeisComP Data Structure:  YEAR/NET/STA/CHAN.TYPE/NET.STA.LOC.CHAN.TYPE.YEAR.DAY
+SDS_TEMPLATE = '{year}/{network}/{station}/{channel}.D/{network}.{station}.{location}.{channel}.D.{year}.{jday}'
+
+
+class FileIndex(object):
+    """
+    Index of the miniSEED day files found below a local data directory.
+
+    The index lives in a SQLite database.  When ``cache_dir`` is given the
+    database is kept there as a sidecar file and reused by later runs;
+    otherwise it is built in memory once per run.  :meth:`refresh` only
+    lists directories whose modification time has changed since the last
+    scan so an unchanged archive costs one ``stat()`` per directory.
+
+    :type root: str
+    :param root: Directory containing miniSEED files (``dataselect_url``).
+    :type cache_dir: str
+    :param cache_dir: Directory in which to persist the index, or ``None``.
+    :type logger: :class:`logging.Logger`
+    :param logger: Logger used for progress messages.
+    """
+    def __init__(self, root, cache_dir=None, logger=None):
+        self.root = os.path.abspath(root)
+        self.logger = logger
+        self.db_path = ':memory:'
+        if cache_dir is not None:
+            name = hashlib.md5(self.root.encode('utf-8')).hexdigest()[:12]
+            self.db_path = os.path.join(cache_dir, 'file_index_%s.sqlite' % name)
+        try:
+            self.conn = sqlite3.connect(self.db_path)
+            self.conn.executescript(_SCHEMA)
+        except sqlite3.Error as e:
+            if self.logger:
+                self.logger.warning("Cannot use file index %s, building index in memory: %s" % (self.db_path, e))
+            self.db_path = ':memory:'
+            self.conn = sqlite3.connect(self.db_path)
+            self.conn.executescript(_SCHEMA)
+
+    def refresh(self):
+        """
+        Brings the index up to date with the contents of :attr:`root`.
+
+        Only directories whose mtime differs from the stored value are listed
+        again; directories that have disappeared are removed from the index.
+
+        :rtype: int
+        :return: Number of directories that were (re)scanned.
+        """
+        known = {}
+        children = {}
+        for path, parent, mtime in self.conn.execute('SELECT path, parent, mtime FROM directories'):
+            known[path] = mtime
+            children.setdefault(parent, []).append(path)
+
+        seen = set()
+        scanned = 0
+        stack = [self.root]
+        with self.conn:
+            while stack:
+                directory = stack.pop()
+                try:
+                    mtime = os.stat(directory).st_mtime_ns
+                except OSError:
+                    continue
+                seen.add(directory)
+
+                if known.get(directory) == mtime:
+                    stack.extend(children.get(directory, []))
+                    continue
+
+                # Directory is new or its entries have changed -- list it again
+                scanned += 1
+                subdirs = []
+                rows = []
+                try:
+                    entries = list(os.scandir(directory))
+                except OSError:
+                    entries = []
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    match = _FILENAME.match(entry.name)
+                    if match:
+                        code1, code2, code3, code4, year, jday, quality = match.groups()
+                        rows.append((entry.path, directory, code1, code2, code3, code4,
+                                     int(year), int(jday), quality))
+
+                parent = os.path.dirname(directory) if directory != self.root else None
+                self.conn.execute('DELETE FROM files WHERE directory = ?', (directory,))
+                self.conn.executemany('INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?)', rows)
+                self.conn.execute('INSERT OR REPLACE INTO directories VALUES (?,?,?)', (directory, parent, mtime))
+                stack.extend(subdirs)
+
+            # Forget directories that no longer exist
+            for directory in set(known) - seen:
+                self.conn.execute('DELETE FROM files WHERE directory = ?', (directory,))
+                self.conn.execute('DELETE FROM directories WHERE path = ?', (directory,))
+
+        if self.logger:
+            self.logger.debug("File index %s: rescanned %d of %d directories" % (self.db_path, scanned, len(seen)))
+        return scanned
+
+    def _where(self, sncl_pattern, starttime=None, endtime=None):
+        """
+        Builds a SQL WHERE clause for a SNCL pattern and an inclusive day range.
+
+        Wildcards ``*``, ``?`` and ``[...]`` have the same meaning as in
+        :mod:`fnmatch` and are matched per code with SQLite ``GLOB``.
+        An optional fifth element of the pattern selects the quality code.
+        """
+        codes = sncl_pattern.split('.')
+        if len(codes) not in (4, 5):
+            raise ValueError("Could not parse sncl_pattern %s" % sncl_pattern)
+
+        clauses = []
+        params = []
+        columns = ['code1', 'code2', 'code3', 'code4', 'quality']
+        for column, code in zip(columns, codes):
+            if code == '*':
+                continue
+            elif any(c in code for c in '*?['):
+                clauses.append('%s GLOB ?' % column)
+            else:
+                clauses.append('%s = ?' % column)
+            params.append(code)
+
+        if starttime is not None:
+            clauses.append('year * 1000 + jday >= ?')
+            params.append(starttime.year * 1000 + starttime.julday)
+        if endtime is not None:
+            clauses.append('year * 1000 + jday <= ?')
+            params.append(endtime.year * 1000 + endtime.julday)
+
+        if len(clauses) == 0:
+            return '', params
+        return ' WHERE ' + ' AND '.join(clauses), params
+
+    def find(self, sncl_pattern, starttime=None, endtime=None):
+        """
+        Returns the indexed files matching a SNCL pattern.
+
+        :type sncl_pattern: str
+        :param sncl_pattern: SNCL pattern in file name order, optionally
+            followed by a quality code (e.g. ``IU.ANMO.00.BH?`` or ``IU.ANMO.00.BHZ.M``).
+        :type starttime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+        :param starttime: First day to include, or ``None``.
+        :type endtime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+        :param endtime: Last day to include (inclusive), or ``None``.
+        :rtype: list of :class:`IndexedFile`
+        :return: Matching files sorted by SNCL and day, files without a
+            quality code first.
+        """
+        where, params = self._where(sncl_pattern, starttime, endtime)
+        sql = ('SELECT path, code1, code2, code3, code4, year, jday, quality FROM files' + where +
+               ' ORDER BY code1, code2, code3, code4, year, jday, quality')
+        return [IndexedFile(path, '.'.join((c1, c2, c3, c4)), year, jday, quality)
+                for path, c1, c2, c3, c4, year, jday, quality in self.conn.execute(sql, params)]
+
+    def sncls(self, sncl_pattern, starttime=None, endtime=None):
+        """
+        Returns the distinct SNCL ids (file name order) with files matching
+        a SNCL pattern and optional inclusive day range.
+        """
+        where, params = self._where(sncl_pattern, starttime, endtime)
+        sql = ('SELECT DISTINCT code1, code2, code3, code4 FROM files' + where +
+               ' ORDER BY code1, code2, code3, code4')
+        return ['.'.join(row) for row in self.conn.execute(sql, params)]
+
+    def close(self):
+        self.conn.close()
+
+
+
+class ArchiveLayout(object):
+    """
+    Local archive whose file paths follow a fixed template.
+
+    Paths are computed from the SNCL and day so lookups need one ``stat()``
+    per file, or a ``glob()`` restricted to the template when the SNCL
+    pattern contains wildcards.  Provides the same query methods as
+    :class:`FileIndex`.
+
+    :type root: str
+    :param root: Directory containing the archive (``dataselect_url``).
+    :type layout: str
+    :param layout: ``SDS`` or a template relative to ``root`` using the
+        fields ``{network}``, ``{station}``, ``{location}``, ``{channel}``,
+        ``{year}``, ``{jday}`` and optionally ``{quality}``.
+    :type sncl_format: str
+    :param sncl_format: Order of the codes in SNCL patterns (e.g. ``N.S.L.C``).
+    """
+    _FIELDS = {'N': 'network', 'S': 'station', 'L': 'location', 'C': 'channel'}
+    _REGEX = {'network': '[^/.]*', 'station': '[^/.]*', 'location': '[^/.]*', 'channel': '[^/.]*',
+              'year': '[12][0-9]{3}', 'jday': '[0-9]{3}', 'quality': '[A-Z]'}
+
+    def __init__(self, root, layout, sncl_format='N.S.L.C', logger=None):
+        self.root = os.path.abspath(root)
+        self.logger = logger
+        if layout.upper() == 'SDS':
+            self.template = SDS_TEMPLATE
+        else:
+            self.template = layout.strip('/')
+        self.order = [self._FIELDS[code] for code in sncl_format.split('.')]
+
+        # Regular expression used to read the codes back out of a matching path
+        pattern = ''
+        seen = set()
+        try:
+            for literal, field, spec, conversion in string.Formatter().parse(self.template):
+                pattern += re.escape(literal)
+                if field is None:
+                    continue
+                if field not in self._REGEX:
+                    raise KeyError(field)
+                if field in seen:
+                    pattern += '(?P=%s)' % field
+                else:
+                    pattern += '(?P<%s>%s)' % (field, self._REGEX[field])
+                    seen.add(field)
+        except (KeyError, ValueError) as e:
+            raise ValueError("Invalid archive_layout template '%s': %s" % (layout, e))
+        if not set(('network', 'station', 'location', 'channel', 'year', 'jday')).issubset(seen):
+            raise ValueError("archive_layout template '%s' must contain {network}, {station}, {location}, "
+                             "{channel}, {year} and {jday}" % layout)
+        self.regex = re.compile('^' + pattern + '$')
+
+    def refresh(self):
+        """Nothing to do -- paths are computed on demand."""
+        return 0
+
+    def find(self, sncl_pattern, starttime=None, endtime=None):
+        """
+        Returns the files matching a SNCL pattern.
+
+        See :meth:`FileIndex.find` for parameters.
+        """
+        codes = sncl_pattern.split('.')
+        if len(codes) not in (4, 5):
+            raise ValueError("Could not parse sncl_pattern %s" % sncl_pattern)
+        fields = dict(zip(self.order, codes[:4]))
+        if len(codes) == 5:
+            fields['quality'] = codes[4]
+        else:
+            fields['quality'] = '[A-Z]'
+
+        if starttime is None or endtime is None:
+            days = [('[12][0-9][0-9][0-9]', '[0-9][0-9][0-9]')]
+        else:
+            days = []
+            day = starttime
+            while day.year * 1000 + day.julday <= endtime.year * 1000 + endtime.julday:
+                days.append(('%04d' % day.year, '%03d' % day.julday))
+                day += 86400
+
+        found = []
+        for year, jday in days:
+            fields['year'] = year
+            fields['jday'] = jday
+            path = os.path.join(self.root, self.template.format(**fields))
+            if glob.has_magic(path):
+                paths = glob.glob(path)
+            elif os.path.isfile(path):
+                paths = [path]
+            else:
+                paths = []
+            for path in paths:
+                match = self.regex.match(os.path.relpath(path, self.root))
+                if match is None:
+                    continue
+                parts = match.groupdict()
+                snclId = '.'.join([parts[field] for field in self.order])
+                found.append(IndexedFile(path, snclId, int(parts['year']), int(parts['jday']), parts.get('quality')))
+
+        found.sort(key=lambda f: (f.snclId, f.year, f.jday, f.quality or ''))
+        return found
+
+    def sncls(self, sncl_pattern, starttime=None, endtime=None):
+        """
+        Returns the distinct SNCL ids with files matching a SNCL pattern and
+        optional inclusive day range.
+        """
+        return sorted(set([f.snclId for f in self.find(sncl_pattern, starttime, endtime)]))
+
+    def close(self):
+        pass
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(exclude_empty=True)
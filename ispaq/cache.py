@@ -0,0 +1,188 @@
+"""
+Caches used by the ISPAQ Concierge.
+
+:copyright:
+    Mazama Science
+:license:
+    GNU Lesser General Public License, Version 3
+    (http://www.gnu.org/copyleft/lesser.html)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Least-recently-used cache bounded by the total size of its entries.
+
+    Every entry is stored with a size (bytes for waveforms, 1 for a simple
+    entry count).  When the total exceeds ``maxsize`` the least recently used
+    entries are discarded.  An entry larger than ``maxsize`` is not stored.
+
+    :type maxsize: int
+    :param maxsize: Maximum total size of all entries; 0 disables the cache.
+
+    .. rubric:: Example
+
+    >>> cache = LRUCache(10)
+    >>> cache.put('a', 'A', size=6)
+    >>> cache.put('b', 'B', size=4)
+    >>> cache.get('a')
+    'A'
+    >>> cache.put('c', 'C', size=3)
+    >>> cache.get('b') is None
+    True
+    >>> sorted(cache.keys())
+    ['a', 'c']
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for ``key`` and marks it as most recently used.
+        """
+        with self._lock:
+            try:
+                value, size = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = (value, size)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size=1):
+        """
+        Stores ``value`` under ``key``, evicting old entries as needed.
+        """
+        with self._lock:
+            self.pop(key)
+            if size > self.maxsize:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.maxsize:
+                old_key, (old_value, old_size) = self._entries.popitem(last=False)
+                self.size -= old_size
+
+    def pop(self, key, default=None):
+        """
+        Removes ``key`` from the cache and returns its value.
+        """
+        with self._lock:
+            try:
+                value, size = self._entries.pop(key)
+            except KeyError:
+                return default
+            self.size -= size
+            return value
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache(object):
+    """
+    Pickle-file cache that persists between ISPAQ runs.
+
+    Each entry is written to ``<directory>/<namespace>_<sha1 of key>.pickle``.
+    Keys should include whatever identifies the source of the value (file
+    path, size, modification time, ...) so that stale entries are never hit.
+    Entries that cannot be read are treated as misses and files that cannot
+    be written are skipped; the cache never stops processing.
+
+    :type directory: str
+    :param directory: Cache directory, or ``None`` to disable the cache.
+    :type namespace: str
+    :param namespace: Prefix that separates different kinds of entries.
+
+    .. rubric:: Example
+
+    >>> import shutil
+    >>> directory = tempfile.mkdtemp()
+    >>> cache = DiskCache(directory, 'example')
+    >>> cache.get(('a', 1)) is None
+    True
+    >>> cache.put(('a', 1), [1, 2, 3])
+    >>> DiskCache(directory, 'example').get(('a', 1))
+    [1, 2, 3]
+    >>> shutil.rmtree(directory)
+    """
+    def __init__(self, directory, namespace, logger=None):
+        self.directory = directory
+        self.namespace = namespace
+        self.logger = logger
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '%s_%s.pickle' % (self.namespace, digest))
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for ``key`` or ``default``.
+        """
+        if self.directory is None:
+            return default
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return default
+        try:
+            with open(path, 'rb') as f:
+                stored_key, value = pickle.load(f)
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.debug("Ignoring unreadable cache file %s: %s" % (path, e))
+            return default
+        if stored_key != key:
+            return default
+        return value
+
+    def put(self, key, value):
+        """
+        Stores ``value`` under ``key``, replacing any previous entry.
+        """
+        if self.directory is None:
+            return
+        path = self._path(key)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.debug("Unable to write cache file %s: %s" % (path, e))
+            try:
+                os.remove(tmp_path)
+            except Exception:
+                pass
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(exclude_empty=True)
@@ -10,21 +10,18 @@ ISPAQ Data Access Expediter.
 
 from __future__ import (absolute_import, division, print_function)
 
+import io
 import os
 import sys
 import re
-import glob
-import math
 import fileinput
 import fnmatch
-import tempfile
 
 import pandas as pd
 import numpy as np
 
-from distutils.version import StrictVersion 
-
 import obspy
+import obspy.io.mseed.util
 from obspy.clients.fdsn import Client
 from obspy.clients.fdsn.header import URL_MAPPINGS
 from obspy import UTCDateTime
@@ -33,6 +30,12 @@ from obspy import UTCDateTime
 from .user_request import UserRequest
 from . import irisseismic
 from . import utils
+from . import archive
+from . import cache
+from . import geodetics
+from . import mseed
+from . import prefetch
+from . import traveltime
 
 
 # Custom exceptions
@@ -41,6 +44,29 @@ class NoAvailableDataError(Exception):
     """No matching data are available."""
     
 
+# Columns of the availability dataframe returned by Concierge.get_availability()
+_CHANNEL_COLUMNS = ("network", "station", "location", "channel",
+                    "latitude", "longitude", "elevation", "depth",
+                    "azimuth", "dip", "instrument",
+                    "scale", "scalefreq", "scaleunits", "samplerate",
+                    "starttime", "endtime", "snclId")
+
+# Columns stored as categoricals in the internal channel table
+_CATEGORY_COLUMNS = ("network", "station", "location", "channel", "instrument", "scaleunits", "snclId")
+
+# Marks a query that is not in the availability cache (None is a valid result)
+_NOT_CACHED = object()
+
+# Number of SNCL windows requested in each FDSN dataselect bulk POST
+_BULK_BATCH_SIZE = 100
+
+# Nominal sampling rates of SEED band codes and an upper bound on the size of
+# a Steim compressed sample, used to estimate the miniSEED bytes of a window
+_BAND_SAMPLING_RATES = {'F': 1000, 'G': 1000, 'D': 250, 'C': 250, 'E': 100, 'H': 100,
+                        'S': 80, 'B': 80, 'M': 10, 'L': 1, 'V': 0.1, 'U': 0.01}
+_BULK_BYTES_PER_SAMPLE = 4
+
+
 class Concierge(object):
     """
     ISPAQ Data Access Expediter.
@@ -116,17 +142,59 @@ class Concierge(object):
         self.plot_include = user_request.plot_include
         self.sigfigs = user_request.sigfigs
         self.sncl_format = user_request.sncl_format
+        self.metric_engine = user_request.metric_engine
+        self.psd_engine = user_request.psd_engine
 
         self.netOrder = int(int(self.sncl_format.index("N"))/2)
         self.staOrder = int(int(self.sncl_format.index("S"))/2)
         self.locOrder = int(int(self.sncl_format.index("L"))/2)
         self.chanOrder = int(int(self.sncl_format.index("C"))/2)
  
+        # Directory for files that persist between runs (None = keep caches in memory)
+        self.cache_dir = user_request.cache_dir
+        if self.cache_dir is not None and not os.path.isdir(self.cache_dir):
+            self.logger.warning("cache_dir %s does not exist, creating directory" % self.cache_dir)
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError as exc:
+                self.logger.warning("Cannot create cache_dir %s, caches will not be saved" % self.cache_dir)
+                self.cache_dir = None
+
+        # R Streams already read by one metric group are kept for the others (size in MB)
+        self.waveform_cache = cache.LRUCache(int(float(user_request.waveform_cache_size) * 1024**2))
+
+        # miniSEED records of FDSN bulk requests, converted to R Streams when requested (size in MB)
+        self._bulk_records = cache.LRUCache(self.waveform_cache.maxsize)
+
+        # Local waveforms are read ahead on a thread pool while R metrics run
+        self.prefetcher = prefetch.Prefetcher(user_request.prefetch_depth,
+                                              int(float(user_request.prefetch_memory) * 1024**2),
+                                              size=lambda result: sum(tr.data.nbytes for tr in result[1]),
+                                              logger=self.logger)
+
+        # Travel times for event metrics, memoized per event and distance bin
+        try:
+            self.traveltimes = traveltime.TravelTimes(user_request.traveltime_provider, logger=self.logger)
+        except ValueError as e:
+            self.logger.critical(e)
+            raise SystemExit
+
+        # Channel tables parsed from local StationXML files, kept in cache_dir between runs
+        self.inventory_cache = cache.DiskCache(self.cache_dir, 'inventory', self.logger)
+
+        # Record indexes of local miniSEED files, so that short windows only read the records they need
+        self.record_index = mseed.RecordIndex(self.cache_dir, logger=self.logger)
+
+        # Instrument responses evaluated by utils.getSpectra, by channel epoch and frequency grid
+        self.evalresp_cache = cache.LRUCache(1000)
+        self.evalresp_disk_cache = cache.DiskCache(self.cache_dir, 'evalresp', self.logger)
+
         # Keep a /dev/null pipe handy in case we want to bit-dump output
         self.dev_null = open(os.devnull,"w")
         
         # Add dataselect clients and URLs or reference a local file
         self.dataselect_type = None
+        self.file_index = None
         if user_request.dataselect_url in URL_MAPPINGS.keys():
             # Get data from FDSN dataselect service
             self.dataselect_url = URL_MAPPINGS[user_request.dataselect_url]
@@ -173,6 +241,18 @@ class Concierge(object):
                 # Get data from local miniseed files
                 self.dataselect_url = os.path.abspath(user_request.dataselect_url)
                 self.dataselect_client = None
+                # Compute file paths from the archive layout or index the local miniSEED files once
+                # instead of walking the directory tree for every request
+                if user_request.archive_layout is not None:
+                    try:
+                        self.file_index = archive.ArchiveLayout(self.dataselect_url, user_request.archive_layout,
+                                                                self.sncl_format, self.logger)
+                    except ValueError as e:
+                        self.logger.critical(e)
+                        raise SystemExit
+                else:
+                    self.file_index = archive.FileIndex(self.dataselect_url, self.cache_dir, self.logger)
+                self.file_index.refresh()
             else:
                 err_msg = "Cannot find dataselect_url: '%s'" % user_request.dataselect_url
                 self.logger.critical(err_msg)
@@ -292,27 +372,8 @@ class Concierge(object):
                self.logger.info("No start time requested. Start time will be determined from local data file extents")
             self.fileDates = []
             for sncl_pattern in self.sncl_patterns:
-                matching_files = []
-                fpattern1 = '%s' % (sncl_pattern + '.[12][0-9][0-9][0-9].[0-9][0-9][0-9]')
-                fpattern2 = '%s' % (fpattern1 + '.[A-Z]')
-                for root, dirnames, fnames in os.walk(self.dataselect_url):
-                    for fname in fnmatch.filter(fnames, fpattern1) + fnmatch.filter(fnames, fpattern2):
-                        matching_files.append(os.path.join(root,fname))
-                if (len(matching_files) == 0):
-                    continue
-                else:
-                    #self.logger.debug("Found files: \n %s" % '\n '.join(matching_files))
-                    for _file in matching_files:
-                        try:
-                            _fileSNCL = _file.split("/")[-1]
-                            _fileYear = _fileSNCL.split(".")[4]
-                            _fileJday = _fileSNCL.split(".")[5]
-                            _fileDate = UTCDateTime("-".join([_fileYear,_fileJday]))
-                            self.fileDates.append([_fileDate])
-                        except Exception as e:
-                            self.logger.debug(e)
-                            self.logger.debug("Can't extract date from %s, %s" % (_file,e))
-                            continue
+                for _file in self.file_index.find(sncl_pattern):
+                    self.fileDates.append([UTCDateTime("%04d-%03d" % (_file.year, _file.jday))])
             if (len(self.fileDates) == 0):
                 self.logger.critical("No start date could be determined. No files found")
                 raise SystemExit
@@ -358,6 +419,11 @@ class Concierge(object):
         # Filtered availability dataframe is stored for potential reuse
         self.filtered_availability = None
 
+        # Results of get_availability() by normalized query, and FDSN channel tables by
+        # pattern and radius search together with the time window they were requested for
+        self._availability_cache = cache.LRUCache(256)
+        self._fdsn_channel_tables = cache.LRUCache(256)
+
         # Add local response files if used
         if user_request.resp_dir is None:                  # use irisws/evalresp
             self.resp_dir = None                           # use irisws/evalresp
@@ -377,6 +443,7 @@ class Concierge(object):
         self.logger.debug("sncl_patterns %s", self.sncl_patterns)
         self.logger.debug("dataselect_url %s", self.dataselect_url)
         self.logger.debug("dataselect_type %s", self.dataselect_type)
+        self.logger.debug("archive_layout %s", self.user_request.archive_layout)
         self.logger.debug("station_url %s", self.station_url)
         self.logger.debug("event_url %s", self.event_url)
         self.logger.debug("resp_dir %s", self.resp_dir)
@@ -389,6 +456,13 @@ class Concierge(object):
         self.logger.debug("pdf_interval %s", self.pdf_interval)
         self.logger.debug("plot_include %s", self.plot_include)
         self.logger.debug("sigfigs %s", self.sigfigs)
+        self.logger.debug("cache_dir %s", self.cache_dir)
+        self.logger.debug("waveform_cache_size %s", user_request.waveform_cache_size)
+        self.logger.debug("traveltime_provider %s", user_request.traveltime_provider)
+        self.logger.debug("prefetch_depth %s", user_request.prefetch_depth)
+        self.logger.debug("prefetch_memory %s", user_request.prefetch_memory)
+        self.logger.debug("metric_engine %s", self.metric_engine)
+        self.logger.debug("psd_engine %s", self.psd_engine)
         self.logger.debug("sncl_format %s", self.sncl_format)
 
     def get_sncl_pattern(self, netIn, staIn, locIn, chanIn):  
@@ -401,6 +475,107 @@ class Concierge(object):
         sncl_pattern = "%s.%s.%s.%s" % tuple(snclList)
         return(sncl_pattern)
 
+    def _inventory_columns(self, inventory):
+        """
+        Collects the channel epochs of an ObsPy Inventory into column lists.
+
+        Epoch start and end times are stored as POSIX timestamps, with
+        ``None`` for epochs that have no end.
+
+        :type inventory: :class:`~obspy.core.inventory.inventory.Inventory`
+        :param inventory: Inventory read at the channel level, or ``None``.
+        :rtype: dict
+        :return: Dictionary of lists keyed by availability column name.
+        """
+        columns = dict((name, []) for name in _CHANNEL_COLUMNS)
+        if inventory is None:
+            return columns
+
+        for n in inventory.networks:
+            for s in n.stations:
+                for c in s.channels:
+                    sensitivity = None
+                    if c.response is not None:
+                        sensitivity = c.response.instrument_sensitivity
+                    columns['network'].append(n.code)
+                    columns['station'].append(s.code)
+                    columns['location'].append(c.location_code)
+                    columns['channel'].append(c.code)
+                    columns['latitude'].append(c.latitude)
+                    columns['longitude'].append(c.longitude)
+                    columns['elevation'].append(c.elevation)
+                    columns['depth'].append(c.depth)
+                    columns['azimuth'].append(c.azimuth)
+                    columns['dip'].append(c.dip)
+                    columns['instrument'].append(c.sensor.description if c.sensor is not None else None)
+                    columns['scale'].append(sensitivity.value if sensitivity is not None else None)
+                    columns['scalefreq'].append(sensitivity.frequency if sensitivity is not None else None)
+                    columns['scaleunits'].append(sensitivity.input_units if sensitivity is not None else None)
+                    columns['samplerate'].append(c.sample_rate)
+                    columns['starttime'].append(c.start_date.timestamp)
+                    columns['endtime'].append(c.end_date.timestamp if c.end_date is not None else None)
+                    columns['snclId'].append(self.get_sncl_pattern(n.code, s.code, c.location_code, c.code))
+
+        return columns
+
+    def _channel_table(self, columns):
+        """
+        Builds the typed internal channel table from column lists.
+
+        Codes are stored as categoricals, measurements as floats and epochs as
+        POSIX timestamps (NaN for open epochs) so that the table can be
+        filtered repeatedly without string or object comparisons.
+
+        .. note::
+
+        Epochs are not stored as ``datetime64[ns]`` because open epochs in
+        StationXML are commonly closed at 2599-12-31, beyond its range.
+        """
+        table = pd.DataFrame(columns, columns=_CHANNEL_COLUMNS)
+        for name in _CHANNEL_COLUMNS:
+            if name in _CATEGORY_COLUMNS:
+                table[name] = table[name].astype('category')
+            else:
+                table[name] = pd.to_numeric(table[name], errors='coerce').astype('float64')
+        return table
+
+    def _filter_channel_table(self, table, sncl_pattern, starttime=None, endtime=None):
+        """
+        Subsets a channel table by SNCL pattern and, optionally, time window.
+
+        Wildcards are matched once against the categories of each code rather
+        than against every row.
+        """
+        mask = np.ones(len(table), dtype=bool)
+        for name, code in zip(('network', 'station', 'location', 'channel'),
+                              [sncl_pattern.split('.')[i] for i in (self.netOrder, self.staOrder, self.locOrder, self.chanOrder)]):
+            if code == '*':
+                continue
+            categories = table[name].cat.categories
+            matching = [i for i, c in enumerate(categories) if fnmatch.fnmatchcase(c, code)]
+            mask &= np.isin(table[name].cat.codes.values, matching)
+        if endtime is not None:
+            mask &= (table['starttime'] < (endtime - 1).timestamp).values
+        if starttime is not None:
+            mask &= ((table['endtime'] > starttime.timestamp) | table['endtime'].isnull()).values
+        return table[mask]
+
+    def _availability_frame(self, table):
+        """
+        Converts a channel table into the availability dataframe returned by
+        :meth:`get_availability`, with string codes and UTCDateTime epochs.
+        """
+        df = pd.DataFrame(index=range(len(table)))
+        for name in _CHANNEL_COLUMNS:
+            values = table[name].values
+            if name in _CATEGORY_COLUMNS:
+                values = np.asarray(values.astype(object))
+                values[pd.isnull(values)] = None
+            elif name in ('starttime', 'endtime'):
+                values = [None if np.isnan(t) else UTCDateTime(t) for t in values]
+            df[name] = values
+        return df
+
     def get_availability(self, 
                          network=None, station=None, location=None, channel=None,
                          starttime=None, endtime=None, 
@@ -489,6 +664,38 @@ class Concierge(object):
         #[u'US.OXF..BHE', u'US.OXF..BHN', u'US.OXF..BHZ']
         """
 
+        # Resolve defaults so that equivalent requests share a cache entry
+        _starttime = self.requested_starttime if starttime is None else starttime
+        _endtime = self.requested_endtime if endtime is None else endtime
+        key = (network, station, location, channel,
+               None if _starttime is None else _starttime.timestamp,
+               None if _endtime is None else _endtime.timestamp,
+               None if latitude is None else float(latitude),
+               None if longitude is None else float(longitude),
+               None if minradius is None else float(minradius),
+               None if maxradius is None else float(maxradius),
+               tuple(self.sncl_patterns))
+
+        availability = self._availability_cache.get(key, _NOT_CACHED)
+        if availability is _NOT_CACHED:
+            availability = self._get_availability(network, station, location, channel,
+                                                  starttime, endtime,
+                                                  latitude, longitude, minradius, maxradius)
+            self._availability_cache.put(key, availability)
+
+        # Callers are free to modify what they are given
+        if availability is None:
+            return None
+        return availability.copy()
+
+    def _get_availability(self, network, station, location, channel,
+                          starttime, endtime,
+                          latitude, longitude, minradius, maxradius):
+        """
+        Builds the availability dataframe for :meth:`get_availability`, which
+        caches the result.
+        """
+
         # NOTE:  Building the availability dataframe from a large StationXML is time consuming.
         # NOTE:  If we are using local station data then we should only do this once.
         
@@ -510,150 +717,67 @@ class Concierge(object):
             # Only read/parse if we haven't already done so
 
             if self.initial_availability is None:
-                try:
-                    # Get list of all sncls we have metadata for
-                    if self.station_url is not None:            
-                        self.logger.info("Reading StationXML file %s" % self.station_url)
-                        sncl_inventory = obspy.read_inventory(self.station_url, format="STATIONXML")
-                        
-                except Exception as e:
-                    err_msg = "The StationXML file: '%s' is not valid" % self.station_url
-                    self.logger.debug(e)
-                    self.logger.error(err_msg)   
-                    raise ValueError
-                
-                self.logger.debug('Building availability dataframe...')
+                columns = None
+                inventory_key = None
+                if self.station_url is not None:
+                    # Parsed channel tables are reused until the StationXML file changes
+                    try:
+                        stat = os.stat(self.station_url)
+                        inventory_key = (self.station_url, stat.st_size, stat.st_mtime, self.sncl_format)
+                        columns = self.inventory_cache.get(inventory_key)
+                    except OSError:
+                        pass
+                    if columns is not None:
+                        self.logger.info("Using cached channel table for StationXML file %s" % self.station_url)
+
+                if columns is None:
+                    sncl_inventory = None
+                    try:
+                        # Get list of all sncls we have metadata for
+                        if self.station_url is not None:            
+                            self.logger.info("Reading StationXML file %s" % self.station_url)
+                            sncl_inventory = obspy.read_inventory(self.station_url, format="STATIONXML")
+                            
+                    except Exception as e:
+                        err_msg = "The StationXML file: '%s' is not valid" % self.station_url
+                        self.logger.debug(e)
+                        self.logger.error(err_msg)   
+                        raise ValueError
+                    
+                    # Collect all channel epochs from the Inventory object, they are filtered by time for each request
+                    columns = self._inventory_columns(sncl_inventory)
+                    del sncl_inventory
+                    if inventory_key is not None:
+                        self.inventory_cache.put(inventory_key, columns)
 
-                # Allow arguments to override UserRequest parameters
-                if starttime is None:
-                    _starttime = self.requested_starttime
-                else:
-                    _starttime = starttime
-                if endtime is None:
-                    _endtime = self.requested_endtime
-                else:
-                    _endtime = endtime
-                
-                # Set up empty dataframe
-                df = pd.DataFrame(columns=("network", "station", "location", "channel",
-                                           "latitude", "longitude", "elevation", "depth" ,
-                                           "azimuth", "dip", "instrument",
-                                           "scale", "scalefreq", "scaleunits", "samplerate",
-                                           "starttime", "endtime", "snclId"))
-
-
-                # Walk through the Inventory object and fill the dataframe with metadata
-                if 'sncl_inventory' in locals():
-                    for n in sncl_inventory.networks:
-                        for s in n.stations:
-                            for c in s.channels:
-                                if (c.start_date < _endtime) and ((c.end_date > _starttime) or (c.end_date is None)):
-                                    if c.end_date is None:
-                                        tmpend = UTCDateTime("2599-12-31T23:59:59")
-                                    else:
-                                        tmpend = c.end_date
-                                    snclId = self.get_sncl_pattern(n.code, s.code, c.location_code, c.code)
-                                    if c.response.instrument_sensitivity is None:
-                                        df.loc[len(df)] = [n.code, s.code, c.location_code, c.code,
-                                                          c.latitude, c.longitude, c.elevation, c.depth,
-                                                          c.azimuth, c.dip, c.sensor.description,
-                                                          None,
-                                                          None,
-                                                          None,
-                                                          c.sample_rate,
-                                                          c.start_date, c.end_date, snclId]
-                                    else:
-                                        df.loc[len(df)] = [n.code, s.code, c.location_code, c.code,
-                                                          c.latitude, c.longitude, c.elevation, c.depth,
-                                                          c.azimuth, c.dip, c.sensor.description,
-                                                          c.response.instrument_sensitivity.value,
-                                                          c.response.instrument_sensitivity.frequency,
-                                                          c.response.instrument_sensitivity.input_units,
-                                                          c.sample_rate,
-                                                          c.start_date, c.end_date, snclId]
+                self.logger.debug('Building availability dataframe...')
                             
                 # Add local data to the dataframe, even if we don't have metadata
                 # Loop through all sncl_patterns in the preferences file ---------------
                 self.logger.debug("Searching for data in %s" % self.dataselect_url)
 
+                known_sncls = set(columns['snclId'])
                 for sncl_pattern in self.sncl_patterns:
-                    try: 
-                        UR_network = sncl_pattern.split('.')[self.netOrder]
-                        UR_station = sncl_pattern.split('.')[self.staOrder]
-                        UR_location = sncl_pattern.split('.')[self.locOrder]
-                        UR_channel = sncl_pattern.split('.')[self.chanOrder]
-                        
-                    except Exception as e:
-                        err_msg = "Could not parse sncl_pattern %s" % (sncl_pattern)
-                        self.logger.error(err_msg)
-                        raise ValueError
-
-                    # Allow arguments to override UserRequest parameters
-                    if network is None:
-                        _network = UR_network
-                    else:
-                        _network = network
-                    if station is None:
-                        _station = UR_station
-                    else:
-                        _station = station
-                    if location is None:
-                        _location = UR_location
-                    else:
-                        _location = location
-                    if channel is None:
-                        _channel = UR_channel
-                    else:
-                        _channel = channel
-
-                    _sncl_pattern = self.get_sncl_pattern(_network,_station,_location,_channel)
-                    self.logger.debug("Adding %s to availability dataframe" % _sncl_pattern)
-
-                    if self.station_client is None:	# Local metadata
-                        if self.dataselect_client is None:	# Local data
-                            # Loop over the available data and add to dataframe if they aren't yet
-                            if len(sncl_pattern.split('.')) > 4:
-                                tmp_sncl_pattern = os.path.splitext(sncl_pattern)[0]
-                                q = os.path.splitext(sncl_pattern)[1][1]
-                                
-                                fpattern1 = '%s' % (tmp_sncl_pattern + '.[12][0-9][0-9][0-9].[0-9][0-9][0-9]')
-                                if q.isalpha():
-                                    fpattern2 = '%s' % (fpattern1 + '.' + q)
-                                else:
-                                    fpattern2 = '%s' % (fpattern1 + '.[A-Z]')
-
-                            else:
-                                fpattern1 = '%s' % (sncl_pattern + '.[12][0-9][0-9][0-9].[0-9][0-9][0-9]')
-                                fpattern2 = '%s' % (fpattern1 + '.[A-Z]')
-
-                            matching_files = []
-
-                            for root, dirnames, fnames in os.walk(self.dataselect_url):
-                                for fname in fnmatch.filter(fnames, fpattern1) + fnmatch.filter(fnames, fpattern2):
-                                    matching_files.append(os.path.join(root,fname))
-
-
-                            #self.logger.debug("Found files: \n %s" % '\n '.join(matching_files))
-
-                            if (len(matching_files) == 0):
-                                continue
-                            else:
-                                # Loop over all files that we have matching our desired sncls
-                                for _file in matching_files:
-                                    fileSNCL = _file.split("/")[-1]
-                                    snclId = fileSNCL.split(".")[0] + "." + fileSNCL.split(".")[1] + "." + fileSNCL.split(".")[2] + "." + fileSNCL.split(".")[3] 
-                                    if not any(df.snclId.str.contains(snclId)):	
-                                        # Only add if not already in the df
-                                        df.loc[len(df)] = [fileSNCL.split(".")[self.netOrder], fileSNCL.split(".")[self.staOrder], 
-                                                           fileSNCL.split(".")[self.locOrder], fileSNCL.split(".")[self.chanOrder],
-                                                           None, None, None, None,
-                                                           None, None, None,
-                                                           None, None, None,
-                                                           None, UTCDateTime("1900-01-01"), UTCDateTime("2599-12-31"),
-                                                           snclId]
-
-                # Now save the dataframe internally
-                self.initial_availability = df
+                    self.logger.debug("Adding %s to availability dataframe" % sncl_pattern)
+
+                    if self.dataselect_client is None:	# Local data
+                        # Loop over the available data and add to dataframe if they aren't yet
+                        for snclId in self.file_index.sncls(sncl_pattern):
+                            if snclId not in known_sncls:
+                                # Only add if not already in the df
+                                known_sncls.add(snclId)
+                                fileSNCL = snclId.split(".")
+                                row = dict.fromkeys(_CHANNEL_COLUMNS)
+                                row.update(network=fileSNCL[self.netOrder], station=fileSNCL[self.staOrder],
+                                           location=fileSNCL[self.locOrder], channel=fileSNCL[self.chanOrder],
+                                           starttime=UTCDateTime("1900-01-01").timestamp,
+                                           endtime=UTCDateTime("2599-12-31").timestamp,
+                                           snclId=snclId)
+                                for name in _CHANNEL_COLUMNS:
+                                    columns[name].append(row[name])
+
+                # Now save the channel table internally
+                self.initial_availability = self._channel_table(columns)
 
         # Container for all of the individual sncl_pattern dataframes generated
         sncl_pattern_dataframes = []
@@ -710,14 +834,9 @@ class Concierge(object):
             
             # Get availability dataframe ---------------------------------------
             if self.station_client is None:
-                # Use pre-existing internal dataframe if we are using local data, filtered by time 
-                df = self.initial_availability
-                if not df['endtime'] is None:
-                    df = df[(df['starttime'] < _endtime-1) & (df['endtime'] > _starttime)]
-                else:
-                    df = df[(df['starttime'] < _endtime-1)]
-                if df is None:
-                    continue 
+                # Use pre-existing internal channel table if we are using local data, filtered by time and pattern
+                table = self._filter_channel_table(self.initial_availability, _sncl_pattern, _starttime, _endtime)
+                df = self._availability_frame(table)
             elif self.station_client == "PH5":
                 self.logger.debug("read IRISPH5 station web services %s/%s for %s,%s,%s,%s,%s,%s" % (self.station_url,self.station_type,_network, _station, _location, _channel, _starttime.strftime('%Y.%j'), _endtime.strftime('%Y.%j')))
                 try:
@@ -745,126 +864,76 @@ class Concierge(object):
 
                 self.logger.debug('Adding %s to the availability dataframe' % _sncl_pattern)
 
+                # Subset availability dataframe based on _sncl_pattern -------------
+
+                # NOTE:  Local and FDSN channel tables are subset by _filter_channel_table()
+
+                # Create python regex from _sncl_pattern
+                # NOTE:  Replace '.' first before introducing '.*' or '.'!
+                py_pattern = _sncl_pattern.replace('.','\\.').replace('*','.*').replace('?','.')
+
+                # Filter dataframe
+                df = df[df.snclId.str.contains(py_pattern)]
+
             else:
                 # Read from FDSN web services
-                self.logger.debug("read FDSN station web services %s for %s,%s,%s,%s,%s,%s" % (self.station_url,_network, _station, _location, _channel, _starttime.strftime('%Y.%j'), _endtime.strftime('%Y.%j')))
-                try:
-                    sncl_inventory = self.station_client.get_stations(starttime=_starttime, endtime=_endtime,
-                                                                      network=_network, station=_station,
-                                                                      location=_location, channel=_channel,
-                                                                      includerestricted=True,
-                                                                      latitude=latitude, longitude=longitude,
-                                                                      minradius=minradius, maxradius=maxradius,                                                                
-                                                                      level="channel",matchtimeseries=True)
-                except Exception as e:
-                    if (minradius):
-                        err_msg = "No stations found for %s within radius %s-%s degrees of latitude,longitude %s,%s" % (_sncl_pattern,minradius,maxradius,latitude,longitude)
-                    else:
-                        err_msg = "No stations found for %s" % (_sncl_pattern)
-                    self.logger.debug(str(e).strip('\n'))
-                    self.logger.info(err_msg)
-                    continue
+                # A window inside one already requested for this pattern is served by epoch filtering.
+                # NOTE:  Such channels matched the time series of the wider window (matchtimeseries),
+                # NOTE:  missing data in the narrower window are reported by get_dataselect().
+                fdsn_key = (_sncl_pattern, latitude, longitude, minradius, maxradius)
+                fetched = self._fdsn_channel_tables.get(fdsn_key)
+                if (fetched is not None and
+                    fetched[0] <= _starttime.timestamp and _endtime.timestamp <= fetched[1]):
+                    self.logger.debug("Using FDSN station results already read for %s" % _sncl_pattern)
+                    table = self._filter_channel_table(fetched[2], _sncl_pattern, _starttime, _endtime)
+                else:
+                    self.logger.debug("read FDSN station web services %s for %s,%s,%s,%s,%s,%s" % (self.station_url,_network, _station, _location, _channel, _starttime.strftime('%Y.%j'), _endtime.strftime('%Y.%j')))
+                    try:
+                        sncl_inventory = self.station_client.get_stations(starttime=_starttime, endtime=_endtime,
+                                                                          network=_network, station=_station,
+                                                                          location=_location, channel=_channel,
+                                                                          includerestricted=True,
+                                                                          latitude=latitude, longitude=longitude,
+                                                                          minradius=minradius, maxradius=maxradius,                                                                
+                                                                          level="channel",matchtimeseries=True)
+                    except Exception as e:
+                        if (minradius):
+                            err_msg = "No stations found for %s within radius %s-%s degrees of latitude,longitude %s,%s" % (_sncl_pattern,minradius,maxradius,latitude,longitude)
+                        else:
+                            err_msg = "No stations found for %s" % (_sncl_pattern)
+                        self.logger.debug(str(e).strip('\n'))
+                        self.logger.info(err_msg)
+                        continue
 
-                self.logger.debug('Adding %s to the availability dataframe' % _sncl_pattern)
+                    # Build the channel table from the Inventory object in one pass
+                    table = self._channel_table(self._inventory_columns(sncl_inventory))
+                    self._fdsn_channel_tables.put(fdsn_key, (_starttime.timestamp, _endtime.timestamp, table))
+                    table = self._filter_channel_table(table, _sncl_pattern)
 
-                # Set up empty dataframe
-                df = pd.DataFrame(columns=("network", "station", "location", "channel",
-                                           "latitude", "longitude", "elevation", "depth" ,
-                                           "azimuth", "dip", "instrument",
-                                           "scale", "scalefreq", "scaleunits", "samplerate",
-                                           "starttime", "endtime", "snclId"))
-
-                # Walk through the Inventory object
-                for n in sncl_inventory.networks:
-                    for s in n.stations:
-                        for c in s.channels:
-                            snclId = self.get_sncl_pattern(n.code, s.code, c.location_code, c.code)
-                            if c.response.instrument_sensitivity is None:
-                                df.loc[len(df)] = [n.code, s.code, c.location_code, c.code,
-                                               c.latitude, c.longitude, c.elevation, c.depth,
-                                               c.azimuth, c.dip, c.sensor.description,
-                                               None,
-                                               None,
-                                               None,
-                                               c.sample_rate,
-                                               c.start_date, c.end_date, snclId]
-                            else:
-                                df.loc[len(df)] = [n.code, s.code, c.location_code, c.code,
-                                               c.latitude, c.longitude, c.elevation, c.depth,
-                                               c.azimuth, c.dip, c.sensor.description,
-                                               c.response.instrument_sensitivity.value,
-                                               c.response.instrument_sensitivity.frequency,
-                                               c.response.instrument_sensitivity.input_units,
-                                               c.sample_rate,
-                                               c.start_date, c.end_date, snclId]
-
-
-            # Subset availability dataframe based on _sncl_pattern -------------
-
-            # NOTE:  This shouldn't be necessary for dataframes obtained from FDSN
-            # NOTE:  but it's quick so we always do it
-            
-            # Create python regex from _sncl_pattern
-            # NOTE:  Replace '.' first before introducing '.*' or '.'!
-            py_pattern = _sncl_pattern.replace('.','\\.').replace('*','.*').replace('?','.')
+                self.logger.debug('Adding %s to the availability dataframe' % _sncl_pattern)
+                df = self._availability_frame(table)
 
-            # Filter dataframe
-            df = df[df.snclId.str.contains(py_pattern)]
 
             # Subset based on locally available data ---------------------------
             if self.dataselect_client is None:
-                fpattern1 = '%s.%s' % (_sncl_pattern,_starttime.strftime('%Y.%j'))
-                fpattern2 = '%s' % (fpattern1 + '.[A-Z]')
-                
-                matching_files = []
-                for root, dirnames, fnames in os.walk(self.dataselect_url):
-                    for fname in fnmatch.filter(fnames, fpattern1) + fnmatch.filter(fnames, fpattern2):
-                        matching_files.append(os.path.join(root,fname))
-                if (len(matching_files) == 0):
-                    err_msg = "No local waveforms matching %s" % fpattern1
+                matching_sncls = self.file_index.sncls(_sncl_pattern, _starttime, _starttime)
+                if (len(matching_sncls) == 0):
+                    err_msg = "No local waveforms matching %s.%s" % (_sncl_pattern,_starttime.strftime('%Y.%j'))
                     self.logger.debug(err_msg)
                     continue
                 else:
                     # Create a mask based on available file names
-                    mask = df.snclId.str.contains("MASK WITH ALL FALSE")
-
-                    for i in range(len(matching_files)):
-                        basename = os.path.basename(matching_files[i])
-                        match = re.match('[^\\.]*\\.[^\\.]*\\.[^\\.]*\\.[^\\.]*',basename)
-                        sncl = match.group(0)
-                        py_pattern = sncl.replace('.','\\.')
-                        mask = mask | df.snclId.str.contains(py_pattern)
+                    mask = df.snclId.isin(matching_sncls)
                         
                 # Subset based on the mask
                 df = df[mask]
 
-            # Subset based on distance
-            # Create a temporary column that has the distances, use to subset
-            df.insert(0,'dist',"EMPTY")
+            # Subset based on distance from the radius search point, all candidates at once
             if maxradius is not None or minradius is not None:
-                # There are distance constraints
-                for ii in range(len(df)):
-                    lat = df['latitude'].iloc[ii]; 
-                    lon = df['longitude'].iloc[ii]; 
-                    if (lat and lon):
-                        if not (math.isnan(lon) or math.isnan(lat)):
-                            [dist,AB,BA] = obspy.geodetics.base.gps2dist_azimuth(latitude, longitude, lat, lon)
-                            dist = obspy.geodetics.base.kilometer2degrees(dist/1000)
-                            if (minradius is None) and (maxradius is not None):
-                                if abs(dist) <= maxradius:
-                                    df["dist"].iloc[ii] = "KEEP"
-                            elif (maxradius is None) and (minradius is not None):
-                                if abs(dist) >= minradius:
-                                    df["dist"].iloc[ii] = "KEEP"
-                            elif (maxradius is not None) and (minradius is not None):
-                                if abs(dist) <= maxradius and  abs(dist) >= minradius:
-                                    df["dist"].iloc[ii] = "KEEP"
-                        else:
-                            next
-                    else:
-                        next
-                df = df[df.dist.str.contains("KEEP")]
-            df = df.drop('dist', 1)
+                mask = geodetics.within_radius(latitude, longitude,
+                                               df['latitude'].values, df['longitude'].values,
+                                               minradius, maxradius)
+                df = df[mask]
 
             # Append this dataframe
             if df.shape[0] == 0:
@@ -898,6 +967,356 @@ class Concierge(object):
                 self.filtered_availability = availability
                 return availability
 
+    def _stream_metadata(self, network, station, location, channel, starttime, endtime, ignoreEpoch=False):
+        """
+        Returns the channel metadata stored with an R Stream and the number
+        of metadata epochs for the channel in the requested window.
+
+        :return: ``([sensor, scale, scalefreq, scaleunits, latitude, longitude,
+            elevation, depth, azimuth, dip], epochs)``
+        """
+        # NOTE:  ObsPy does not store station metadata with each trace.
+        # NOTE:  We need to read them in separately from station metadata.
+        availability = self.get_availability(network, station, location, channel, starttime, endtime)
+        epochs = len(availability)
+
+        if(ignoreEpoch == False):
+            if (len(availability) > 1):
+                raise Exception("Multiple metadata epochs found for %s" % self.get_sncl_pattern(network, station, location, channel))
+
+        sensor = availability.instrument[0]
+        scale = availability.scale[0]
+        scalefreq = availability.scalefreq[0]
+        scaleunits = availability.scaleunits[0]
+        if sensor is None: sensor = ""
+        if scale is None: scale = np.nan
+        if scalefreq is None: scalefreq = np.nan
+        if scaleunits is None: scaleunits = ""
+        metadata = [sensor, scale, scalefreq, scaleunits,
+                    availability.latitude[0], availability.longitude[0], availability.elevation[0],
+                    availability.depth[0], availability.azimuth[0], availability.dip[0]]
+
+        return (metadata, epochs)
+
+    def get_channel_epoch(self, network, station, location, channel, time):
+        """
+        Returns the metadata epoch of a channel that contains ``time``.
+
+        Only channel tables that have already been read are searched, so
+        this never requests metadata.
+
+        :return: ``(starttime, endtime)`` POSIX timestamps, with ``None`` for
+            an open epoch, or ``None`` if the epoch is not known.
+        """
+        tables = [] if self.initial_availability is None else [self.initial_availability]
+        for key in self._fdsn_channel_tables.keys():
+            fetched = self._fdsn_channel_tables.get(key)
+            if fetched is not None:
+                tables.append(fetched[2])
+
+        location = '' if location == '--' else location
+        for table in tables:
+            mask = ((table['network'] == network) & (table['station'] == station) &
+                    (table['location'].astype(object).replace('--', '') == location) & (table['channel'] == channel) &
+                    (table['starttime'] <= time.timestamp) &
+                    ((table['endtime'] > time.timestamp) | table['endtime'].isnull())).values
+            if mask.any():
+                row = table[mask].iloc[0]
+                return (float(row.starttime), None if np.isnan(row.endtime) else float(row.endtime))
+        return None
+
+    def prefetch_dataselect(self, windows, quality=None, repository=None, inclusiveEnd=False, headonly=False):
+        """
+        Reads waveforms for many SNCL windows ahead of a metric loop.
+
+        With a FDSN dataselect service the windows are requested in batched
+        POST requests with ObsPy ``get_waveforms_bulk``. The miniSEED records
+        are kept, compressed, in a cache the size of the waveform cache and
+        :meth:`get_dataselect` converts them to an R Stream when called with
+        the same arguments. Later metric groups convert the records again
+        rather than download them again. Only the windows estimated to fit in
+        that cache are requested; the others, windows that are not returned
+        and PH5 data are read by :meth:`get_dataselect` when requested.
+
+        With local miniSEED files, up to ``prefetch_depth`` windows are read
+        with ObsPy on background threads, in the order given, while the
+        metrics for earlier windows run. Conversion to R Streams stays with
+        :meth:`get_dataselect` on the main thread.
+
+        .. note::
+
+        Channel metadata of prefetched FDSN streams come from ``station_url``,
+        in the same way as for local miniSEED files.
+
+        :type windows: list
+        :param windows: ``(network, station, location, channel, starttime, endtime)``
+            tuples, in the order the metric loop will request them.
+        :type headonly: bool
+        :param headonly: The windows will be requested with
+            :meth:`get_py_dataselect` for their trace headers only, which
+            are read from local files as needed.
+        """
+        if self.dataselect_type is None:
+            if not headonly:
+                self._prefetch_local(windows, quality, repository, inclusiveEnd)
+            return
+
+        if (self.dataselect_type != "fdsnws" or repository is not None or
+            self.waveform_cache.maxsize == 0):
+            return
+
+        # Skip windows that are already cached or requested twice and stop
+        # before the records would push the first windows out of the cache
+        pending = []
+        seen = set()
+        budget = self._bulk_records.maxsize
+        for window in windows:
+            cache_key = tuple(window[:4]) + (window[4].timestamp, window[5].timestamp,
+                                             quality, repository, inclusiveEnd)
+            if cache_key in self.waveform_cache or cache_key in self._bulk_records or cache_key in seen:
+                continue
+            sampling_rate = _BAND_SAMPLING_RATES.get(window[3][:1], 100)
+            budget -= (window[5] - window[4]) * sampling_rate * _BULK_BYTES_PER_SAMPLE
+            if budget < 0:
+                break
+            seen.add(cache_key)
+            pending.append((cache_key, window))
+        if len(pending) == 0:
+            return
+
+        self.logger.debug("Requesting %d waveforms from %s in bulk" % (len(pending), self.dataselect_url))
+
+        for first in range(0, len(pending), _BULK_BATCH_SIZE):
+            batch = pending[first:first + _BULK_BATCH_SIZE]
+            bulk = []
+            for (cache_key, (network, station, location, channel, starttime, endtime)) in batch:
+                if not inclusiveEnd:
+                    endtime = endtime - 0.000001
+                bulk.append((network, station, location, channel, starttime, endtime))
+
+            buf = io.BytesIO()
+            try:
+                self.dataselect_client.get_waveforms_bulk(bulk, quality=quality, filename=buf)
+            except Exception as e:
+                self.logger.debug("Bulk dataselect request failed, waveforms will be requested individually: %s" % str(e).strip('\n'))
+                continue
+
+            records = self._split_records(buf.getvalue())
+            buf = None
+
+            # A SNCL may have several windows in a batch, each keeps the records it overlaps
+            for ((cache_key, window), request) in zip(batch, bulk):
+                (network, station, location, channel, starttime, endtime) = request
+                data = b''.join(record for (record_start, record_end, slack, record) in
+                                records.get((network, station, (location or '').strip(), channel), [])
+                                if record_end + slack >= starttime.timestamp and
+                                record_start - slack <= endtime.timestamp)
+                if len(data) > 0:
+                    self._bulk_records.put(cache_key, data, len(data))
+
+    def _read_bulk(self, data, network, station, location, channel, starttime, endtime):
+        """
+        Converts the miniSEED records of a bulk request to an R Stream cut to a window.
+
+        As for local files, state-of-health flags are counted over all records.
+
+        :return: ``(r_stream, epochs)`` or ``None`` if the records hold no data in the window.
+        """
+        py_stream = obspy.read(io.BytesIO(data), format="MSEED")
+        py_stream = py_stream.slice(starttime, endtime, nearest_sample=False)
+        if len(py_stream) == 0:
+            return None
+        (act_flags, io_flags, dq_flags, timing_qual) = mseed.read_flags(io.BytesIO(data))
+        metadata, epochs = self._stream_metadata(network, station, location, channel, starttime, endtime, ignoreEpoch=True)
+        r_stream = irisseismic.R_Stream(py_stream, starttime, endtime, act_flags, io_flags, dq_flags, timing_qual, *metadata)
+        return (r_stream, epochs)
+
+    def _prefetch_local(self, windows, quality=None, repository=None, inclusiveEnd=False):
+        """
+        Plans background reads of local miniSEED files for the windows of
+        :meth:`prefetch_dataselect`, in the order they will be requested.
+        """
+        if self.prefetcher.depth <= 0:
+            return
+        tasks = []
+        for (network, station, location, channel, starttime, endtime) in windows:
+            cache_key = (network, station, location, channel, starttime.timestamp, endtime.timestamp,
+                         quality, repository, inclusiveEnd)
+            if cache_key in self.waveform_cache:
+                continue
+            try:
+                filepaths = self._local_files(network, station, location, channel, starttime, endtime)
+            except Exception as e:
+                # get_dataselect() reports missing files
+                continue
+            if not inclusiveEnd:
+                endtime = endtime - 0.000001
+            tasks.append((cache_key, self._read_local, (filepaths, starttime, endtime)))
+        self.prefetcher.schedule(tasks)
+
+    def _split_records(self, data):
+        """
+        Splits miniSEED records by channel.
+
+        :return: Dictionary keyed by ``(network, station, location, channel)``
+            of lists of ``(starttime, endtime, delta, record)`` tuples, with
+            the epoch seconds of the first and last samples, the sample
+            interval and the bytes of every record, in order.
+        """
+        chunks = {}
+        stream = io.BytesIO(data)
+        offset = 0
+        while offset < len(data):
+            info = obspy.io.mseed.util.get_record_information(stream, offset)
+            length = info.get('record_length')
+            if not length:
+                break
+            key = (info['network'], info['station'], info['location'], info['channel'])
+            delta = 1.0 / info['samp_rate'] if info.get('samp_rate') else 0.0
+            chunks.setdefault(key, []).append((info['starttime'].timestamp, info['endtime'].timestamp, delta,
+                                               data[offset:offset + length]))
+            offset += length
+        return chunks
+
+    def _local_files(self, network, station, location, channel, starttime, endtime):
+        """
+        Returns the local miniSEED file for each day of a window.
+
+        Raises an exception if a day has no file.
+        """
+        _sncl_pattern = self.get_sncl_pattern(network, station, location, channel)
+        nday = int((endtime - .00001).julday - starttime.julday) + 1   # subtract a short amount of time for 00:00:00 endtimes
+
+        filepaths = []
+        for day in range(nday):
+            start = (starttime + day * 86400)
+            start = start - (start.hour * 3600 + start.minute * 60 + start.second + start.microsecond * .000001)
+            if start <= starttime:
+                start = starttime
+
+            fpattern1 = '%s.%s' % (_sncl_pattern,start.strftime('%Y.%j'))
+            self.logger.debug("read local miniseed file for %s..." % fpattern1)
+            matching_files = [f.path for f in self.file_index.find(_sncl_pattern, start, start)]
+
+            if (len(matching_files) == 0):
+                err_msg = "No files found matching '%s'" % (fpattern1)
+                raise Exception(err_msg)
+
+            filepath = matching_files[0]
+            if (len(matching_files) > 1):
+                self.logger.debug("Multiple files found: %s" % " ".join(matching_files))
+                self.logger.warning("Multiple files found matching " '%s -- using %s' % (fpattern1, filepath))
+            filepaths.append(filepath)
+
+        return filepaths
+
+    def _read_local(self, filepaths, starttime, endtime, headonly=False):
+        """
+        Reads local miniSEED files into an ObsPy Stream cut to a window.
+
+        Each day file is read in turn and only the records that overlap the
+        window are read and decoded, so memory use stays close to the size of
+        the window. Only ObsPy is used so that this can run on the prefetch
+        threads.
+
+        With ``headonly`` only the trace headers are read, as by
+        :func:`mseed.read_headers`, and no flags are returned.
+
+        :return: ``(filepaths, py_stream, (act_flags, io_flags, dq_flags, timing_qual))``
+        """
+        py_stream = obspy.Stream()
+        flags = None
+        for filepath in filepaths:
+            if headonly:
+                day_stream = mseed.read_headers(filepath, starttime, endtime)
+            else:
+                (day_stream, flags) = self.record_index.read(filepath, starttime, endtime)
+                day_stream = day_stream.slice(starttime, endtime, nearest_sample=False)
+            for tr in day_stream:
+                # Join traces that continue across midnight, as libmseed
+                # does when the day files are read as one
+                previous = py_stream[-1] if len(py_stream) > 0 else None
+                if (previous is not None and previous.id == tr.id and
+                        previous.stats.sampling_rate == tr.stats.sampling_rate and
+                        previous.data.dtype == tr.data.dtype and
+                        abs(tr.stats.starttime - previous.stats.endtime - tr.stats.delta) <= 0.5 * tr.stats.delta):
+                    if headonly:
+                        previous.data = np.broadcast_to(previous.data[:1], (previous.stats.npts + tr.stats.npts,))
+                    else:
+                        previous.data = np.concatenate((previous.data, tr.data))
+                else:
+                    py_stream.append(tr)
+
+        # NOTE:  ObsPy does not store state-of-health flags with each stream;
+        # NOTE:  those of the last file are kept.
+        return (filepaths, py_stream, flags)
+
+    def get_py_dataselect(self,
+                          network=None, station=None, location=None, channel=None,
+                          starttime=None, endtime=None, quality=None, repository=None,
+                          inclusiveEnd=False, ignoreEpoch=False, headonly=False):
+        """
+        Returns the waveforms of :meth:`get_dataselect` as an ObsPy Stream,
+        for metrics that are calculated without R.
+
+        Local miniSEED files and the records of a bulk request made by
+        :meth:`prefetch_dataselect` are read without creating an R Stream.
+        Streams that are already in the waveform cache or that can only be
+        read with R are converted from the R Stream of :meth:`get_dataselect`.
+
+        Arguments are those of :meth:`get_dataselect`.
+
+        :type headonly: bool
+        :param headonly: Only read trace headers where the samples are not
+            already available. The data of such traces are meaningless.
+        :return: ``(py_stream, requestedStarttime, requestedEndtime)`` as
+            returned by :func:`irisseismic.py_Stream`.
+        """
+        if starttime is None:
+            _starttime = self.requested_starttime
+        else:
+            _starttime = starttime
+        if endtime is None:
+            _endtime = self.requested_endtime
+        else:
+            _endtime = endtime
+
+        cache_key = (network, station, location, channel, _starttime.timestamp, _endtime.timestamp,
+                     quality, repository, inclusiveEnd)
+        data = None if self.dataselect_type is None else self._bulk_records.get(cache_key)
+        if cache_key in self.waveform_cache or (self.dataselect_type is not None and data is None):
+            r_stream = self.get_dataselect(network, station, location, channel, starttime, endtime,
+                                           quality, repository, inclusiveEnd, ignoreEpoch)
+            return irisseismic.py_Stream(r_stream, headonly=headonly)
+
+        if self.dataselect_type is None:
+            # The ObsPy stream may already have been read by the prefetcher
+            prefetched = self.prefetcher.take(cache_key)
+            if prefetched is None:
+                filepaths = self._local_files(network, station, location, channel, _starttime, _endtime)
+
+        if not inclusiveEnd:
+            _endtime = _endtime - 0.000001
+
+        if self.dataselect_type is None:
+            if prefetched is None:
+                prefetched = self._read_local(filepaths, _starttime, _endtime, headonly)
+            py_stream = prefetched[1]
+        elif headonly:
+            py_stream = mseed.read_headers(io.BytesIO(data), _starttime, _endtime)
+        else:
+            py_stream = obspy.read(io.BytesIO(data), format="MSEED")
+            py_stream = py_stream.slice(_starttime, _endtime, nearest_sample=False)
+
+        if len(py_stream) == 0:
+            raise Exception("no data available")
+
+        if not ignoreEpoch:
+            # Raises an exception for multiple epochs, as get_dataselect() does
+            self._stream_metadata(network, station, location, channel, _starttime, _endtime)
+
+        return (py_stream, _starttime, _endtime)
+
     def get_dataselect(self,
                        network=None, station=None, location=None, channel=None,
                        starttime=None, endtime=None, quality=None, repository=None,
@@ -942,206 +1361,75 @@ class Concierge(object):
         else:
             _endtime = endtime
 
-        
-        if self.dataselect_type is None:
-            # Read local MiniSEED file and convert to R_Stream
-            nday = int((_endtime - .00001).julday - _starttime.julday) + 1   # subtract a short amount of time for 00:00:00 endtimes
+        # Reuse a stream that was already read by this or another metric group
+        _sncl_pattern = self.get_sncl_pattern(network, station, location, channel)
+        cache_key = (network, station, location, channel, _starttime.timestamp, _endtime.timestamp,
+                     quality, repository, inclusiveEnd)
+        cached = self.waveform_cache.get(cache_key)
+        if cached is not None:
+            r_stream, epochs = cached
+            if not ignoreEpoch:
+                if epochs is None:
+                    # Stream was requested with ignoreEpoch=True, count the epochs now
+                    availability = self.get_availability(network, station, location, channel, _starttime, _endtime)
+                    epochs = 0 if availability is None else len(availability)
+                    cached[1] = epochs
+                if epochs > 1:
+                    raise Exception("Multiple metadata epochs found for %s" % _sncl_pattern)
+            self.logger.debug("Using cached waveform for %s" % _sncl_pattern)
+            return r_stream
 
-            if (nday == 1):
-                _sncl_pattern = self.get_sncl_pattern(network, station, location, channel)
-                fpattern1 = '%s.%s' % (_sncl_pattern,_starttime.strftime('%Y.%j'))
-                fpattern2 = '%s' % (fpattern1 + '.[A-Z]')
+        if self.dataselect_type is None:
+            # Read local MiniSEED files and convert to R_Stream
+            # The ObsPy stream may already have been read by the prefetcher
+            prefetched = self.prefetcher.take(cache_key)
+            if prefetched is None:
+                filepaths = self._local_files(network, station, location, channel, _starttime, _endtime)
+            else:
+                filepaths = prefetched[0]
 
-                matching_files = []
-                for root, dirnames, fnames in os.walk(self.dataselect_url):
-                    for fname in fnmatch.filter(fnames, fpattern1) + fnmatch.filter(fnames, fpattern2):
-                        matching_files.append(os.path.join(root,fname))
+            if not inclusiveEnd:
+                _endtime = _endtime - 0.000001
 
-                if (len(matching_files) == 0):
-                    self.logger.info("No files found matching '%s'" % (fpattern1))
-                else:
-                    filepath=matching_files[0]
-
-                    if (len(matching_files) > 1):
-                        self.logger.debug("Multiple files found: %s" % " ".join(matching_files))
-                        self.logger.warning("Multiple files found matching " '%s -- using %s' % (fpattern1, filepath))
-                    
-                    try:
-                        # Get the ObsPy version of the stream
-                        if not inclusiveEnd:
-                            _endtime = _endtime - 0.000001
-                        py_stream = obspy.read(filepath)
-                        py_stream = py_stream.slice(_starttime, _endtime, nearest_sample=False)
-                       
-                        
-                        if (StrictVersion(obspy.__version__) < StrictVersion("1.1.0")): 
-                            flag_dict = obspy.io.mseed.util.get_timing_and_data_quality(filepath)
-                            act_flags = [0,0,0,0,0,0,0,0] # not supported before 1.1.0  
-                            io_flags = [0,0,0,0,0,0,0,0]  # not supported before 1.1.0
-                            dq_flags = flag_dict['data_quality_flags']
-                        else:
-                            flag_dict = obspy.io.mseed.util.get_flags(filepath)
-                            act_flags = []
-                            io_flags = []
-                            dq_flags = []
-                            for k,v in flag_dict['activity_flags_counts'].items():
-                                act_flags.append(v) 
-                            for k,v in flag_dict['io_and_clock_flags_counts'].items():
-                                io_flags.append(v)
-                            for k,v in flag_dict['data_quality_flags_counts'].items():
-                                dq_flags.append(v)
-                        
-                        if flag_dict["timing_quality"]:
-                            timing_qual=flag_dict["timing_quality"]["mean"]
-                        else:
-                            timing_qual=None
-
-                        # NOTE:  ObsPy does not store station metadata with each trace.
-                        # NOTE:  We need to read them in separately from station metadata.
-                        availability = self.get_availability(network, station, location, channel, _starttime, _endtime)
-                        
-                        if(ignoreEpoch == False):
-                            if (len(availability) > 1):
-                                raise Exception("Multiple metadata epochs found for %s" % _sncl_pattern)
-
-
-                        sensor = availability.instrument[0]
-                        scale = availability.scale[0]
-                        scalefreq = availability.scalefreq[0]
-                        scaleunits = availability.scaleunits[0]
-                        if sensor is None: sensor = ""          
-                        if scale is None: scale = np.NaN            
-                        if scalefreq is None: scalefreq = np.NaN    
-                        if scaleunits is None: scaleunits = ""  
-                        latitude = availability.latitude[0]
-                        longitude = availability.longitude[0]
-                        elevation = availability.elevation[0]
-                        depth = availability.depth[0]
-                        azimuth = availability.azimuth[0]
-                        dip = availability.dip[0]
-                        
-                       
-                        # Create the IRISSeismic version of the stream
-                        r_stream = irisseismic.R_Stream(py_stream, _starttime, _endtime, act_flags, io_flags, dq_flags, timing_qual,
-							sensor, scale, scalefreq, scaleunits, latitude, longitude, elevation, depth, azimuth, dip)
+            try:
+                if prefetched is None:
+                    prefetched = self._read_local(filepaths, _starttime, _endtime)
+                (filepaths, py_stream, flags) = prefetched
 
-                    except Exception as e:
-                        err_msg = "Error reading in local waveform from %s" % filepath
-                        self.logger.debug(e)
-                        self.logger.debug(err_msg)
-                        raise
-  
-                    if len(utils.get_slot(r_stream, 'traces')) == 0:
-                        raise Exception("no data available") 
+                # NOTE:  This should be consistent for each day of data
+                metadata, epochs = self._stream_metadata(network, station, location, channel, _starttime, _endtime, ignoreEpoch)
 
+                # Create the IRISSeismic version of the stream
+                (act_flags, io_flags, dq_flags, timing_qual) = flags
+                r_stream = irisseismic.R_Stream(py_stream, _starttime, _endtime, act_flags, io_flags, dq_flags, timing_qual, *metadata)
 
-            else:
-                # create tempfile
-                x = tempfile.TemporaryFile()
-
-                # begin day loop
-                for day in range(nday):
-                    start = (_starttime + day * 86400)
-                    start = start - (start.hour * 3600 + start.minute * 60 + start.second + start.microsecond * .000001)
-                    end = start + 86400
-
-                    if start <= _starttime:
-                        start = _starttime
-                    if end >= _endtime:
-                        end = _endtime
-
-                    _sncl_pattern = self.get_sncl_pattern(network, station, location, channel)
-                    filename = '%s.%s' % (_sncl_pattern,_starttime.strftime('%Y.%j'))
-                    self.logger.debug("read local miniseed file for %s..." % filename)
-                    fpattern1 = self.dataselect_url + '/' + filename + '.[12][0-9][0-9][0-9].[0-9][0-9][0-9]'
-                    fpattern2 = fpattern1 + '.[A-Z]'
-                    matching_files = glob.glob(fpattern1) + glob.glob(fpattern2)
-		
-                    if (len(matching_files) == 0):
-                        err_msg = "No files found matching '%s'" % (fpattern1)
-                        raise Exception(err_msg)
-		    
-                    else:
-                        filepath = matching_files[0]
-                        if (len(matching_files) > 1):
-                            self.logger.debug("Multiple files found: %s" % " ".join(matching_files))
-                            self.logger.warning("Multiple files found matching" '%s -- using %s' % (fpattern1, filepath))
+            except Exception as e:
+                err_msg = "Error reading in local waveform from %s" % " ".join(filepaths)
+                self.logger.debug(e)
+                self.logger.debug(err_msg)
+                raise
 
-                        # write miniseed to tempfile
-                        with open(filepath, 'rb') as f:
-                            x.write(f.read())
-                            x.flush()
-                        f.close()
+            if len(utils.get_slot(r_stream, 'traces')) == 0:
+                raise Exception("no data available")
 
+        else:
+            # Convert the records of a bulk request made by prefetch_dataselect()
+            # NOTE:  The records are kept so that other metric groups can convert them again
+            data = self._bulk_records.get(cache_key)
+            if data is not None:
+                bulk_endtime = _endtime if inclusiveEnd else _endtime - 0.000001
                 try:
-                    py_stream = obspy.read(x)
-                    x.close()
-                    if not inclusiveEnd:
-                            _endtime = _endtime - 0.000001
-                    py_stream = py_stream.slice(_starttime, _endtime, nearest_sample=False) 
-                    # NOTE:  ObsPy does not store state-of-health flags with each stream.
-                    if (StrictVersion(obspy.__version__) < StrictVersion("1.1.0")):
-                        flag_dict = obspy.io.mseed.util.get_timing_and_data_quality(filepath)
-                        act_flags = [0,0,0,0,0,0,0,0] 
-                        io_flags = [0,0,0,0,0,0,0,0] 
-                        dq_flags = flag_dict['data_quality_flags']
-                    else:
-                        flag_dict = obspy.io.mseed.util.get_flags(filepath)
-                        act_flags = []
-                        io_flags = []
-                        dq_flags = []
-                        for k,v in flag_dict['activity_flags_counts'].items():
-                            act_flags.append(v)
-                        for k,v in flag_dict['io_and_clock_flags_counts'].items():
-                            io_flags.append(v)
-                        for k,v in flag_dict['data_quality_flags_counts'].items():
-                            dq_flags.append(v)
-
-                    if flag_dict["timing_quality"]:
-                        timing_qual=flag_dict["timing_quality"]["mean"]
-                    else:
-                        timing_qual=None
-
-                    # NOTE:  ObsPy does not store station metadata with each trace.
-                    # NOTE:  We need to read them in separately from station metadata.
-                    # NOTE:  This should be consistent for each day of data
-                    self.logger.info('%s, %s,%s,%s' % (network,station,location,channel))
-                    availability = self.get_availability(network, station, location, channel, _starttime, _endtime)
-
-                    if(ignoreEpoch == False):
-                        if (len(availability) > 1):
-                            raise Exception("Multiple metadata epochs found for %s" % _sncl_pattern)
-
-                    sensor = availability.instrument[0]
-                    scale = availability.scale[0]
-                    scalefreq = availability.scalefreq[0]
-                    scaleunits = availability.scaleunits[0]
-                    if sensor is None: sensor = ""          
-                    if scale is None: scale = np.NaN           
-                    if scalefreq is None: scalefreq = np.NaN   
-                    if scaleunits is None: scaleunits = ""  
-                    latitude = availability.latitude[0]
-                    longitude = availability.longitude[0]
-                    elevation = availability.elevation[0]
-                    depth = availability.depth[0]
-                    azimuth = availability.azimuth[0]
-                    dip = availability.dip[0]
-
-                    # Create the IRISSeismic version of the stream
-                    r_stream = irisseismic.R_Stream(py_stream, _starttime, _endtime, act_flags, io_flags, dq_flags, timing_qual,
-						    sensor, scale, scalefreq, scaleunits, latitude, longitude, elevation, depth, azimuth, dip)
-			
+                    converted = self._read_bulk(data, network, station, location, channel, _starttime, bulk_endtime)
                 except Exception as e:
-                    err_msg = "Error reading in local waveform from %s" % filepath
-                    self.logger.debug(e)
-                    self.logger.debug(err_msg)
-                    raise
-
-                if len(utils.get_slot(r_stream, 'traces')) == 0:
-                        raise Exception("no data available")
-      
+                    self.logger.debug("Unable to use bulk waveform for %s: %s" % (_sncl_pattern, e))
+                    converted = None
+                if converted is not None:
+                    (r_stream, epochs) = converted
+                    self.waveform_cache.put(cache_key, [r_stream, epochs], irisseismic.objectSize(r_stream))
+                    if not ignoreEpoch and epochs > 1:
+                        raise Exception("Multiple metadata epochs found for %s" % _sncl_pattern)
+                    return r_stream
 
-        else:
             # Read from FDSN web services
             try:
                 # R getDataselect() seems to capture awkward error reports when there is no data
@@ -1150,6 +1438,8 @@ class Concierge(object):
                 sys.stderr = self.dev_null
                 r_stream = irisseismic.R_getDataselect(self.dataselect_url, self.dataselect_type, network, station, location, channel, _starttime, _endtime, quality, repository,inclusiveEnd, ignoreEpoch)
                 sys.stderr = orig_stderr
+                # getDataselect() fails on multiple epochs unless they are ignored
+                epochs = None if ignoreEpoch else 1
             except Exception as e:
                 err_msg = "Error reading in waveform from FDSN dataselect webservice client (base url: %s)" % self.dataselect_url
                 self.logger.error(err_msg)
@@ -1169,6 +1459,7 @@ class Concierge(object):
         if False:              
             return None # TODO:  raise an exception
         else:
+            self.waveform_cache.put(cache_key, [r_stream, epochs], irisseismic.objectSize(r_stream))
             return r_stream
 
 
@@ -1325,6 +1616,23 @@ class Concierge(object):
         else:
             return events
 
+    def get_traveltime(self, latitude, longitude, depth, staLatitude, staLongitude):
+        """
+        Returns a dataframe of seismic phase arrivals at a station.
+
+        Travel times come from the ``traveltime_provider`` preference and are
+        memoized per event and distance bin. See
+        :meth:`ispaq.traveltime.TravelTimes.get_traveltime`.
+
+        :param latitude: Latitude of seismic event.
+        :param longitude: Longitude of seismic event.
+        :param depth: Depth of seismic event in km.
+        :param staLatitude: Latitude of seismic station.
+        :param staLongitude: Longitude of seismic station.
+        :return: pandas dataframe with columns: ``distance, depth, phaseName, travelTime, rayParam, takeoff, incident, puristDistance, puristName``.
+        """
+        return self.traveltimes.get_traveltime(latitude, longitude, depth, staLatitude, staLongitude)
+
 
 
 if __name__ == '__main__':
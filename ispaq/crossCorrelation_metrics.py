@@ -14,10 +14,8 @@ from __future__ import (absolute_import, division, print_function)
 import math
 import numpy as np
 import pandas as pd
-import obspy
 
 from obspy import UTCDateTime
-from obspy import geodetics
 from obspy import taup
 from obspy.taup import TauPyModel
 model = TauPyModel(model="iasp91")
@@ -25,6 +23,7 @@ model = TauPyModel(model="iasp91")
 from .concierge import NoAvailableDataError
 
 from . import utils
+from . import geodetics
 from . import irisseismic
 from . import irismustangmetrics
 
@@ -121,6 +120,12 @@ def crossCorrelation_metrics(concierge):
 
         # function metadata dictionary
         function_metadata = concierge.function_by_logic['crossCorrelation']
+
+        # Distances from the event to all stations in one pass
+        eventDistance = pd.Series(geodetics.distaz(event.latitude, event.longitude,
+                                                   availability.latitude, availability.longitude,
+                                                   geocentric=False)[0],
+                                  index=availability.index)
     
         # Loop over rows of the availability dataframe
         for (index, av1) in availability.iterrows():
@@ -135,7 +140,7 @@ def crossCorrelation_metrics(concierge):
 
             # Get data in a window centered on the event's arrival at station #1
              
-            dist = obspy.geodetics.base.locations2degrees(event.latitude, event.longitude, av1.latitude, av1.longitude)
+            dist = eventDistance[index]
             arrivals = model.get_travel_times(source_depth_in_km=event.depth,distance_in_degree=dist)
 
             tt=min(arrivals,key=lambda x: x.time).time
@@ -237,11 +242,9 @@ def crossCorrelation_metrics(concierge):
             else:
                 avCompatible = availability2[mask].reset_index(drop=True)
                 # To find the closest SNCL -- order rows by distance and take the first row
-                #avCompatible['dist'] = pd.Series(irisseismic.surfaceDistance(av1.latitude, av1.longitude, avCompatible.latitude, avCompatible.longitude))
-                dist2 = pd.Series()
-                for i in range(0,avCompatible.shape[0]):
-                    dist2.set_value(i,value=obspy.geodetics.base.locations2degrees(av1.latitude, av1.longitude,avCompatible.latitude.iloc[i],avCompatible.longitude.iloc[i]))
-                avCompatible['dist'] = dist2
+                avCompatible['dist'] = geodetics.distaz(av1.latitude, av1.longitude,
+                                                        avCompatible.latitude, avCompatible.longitude,
+                                                        geocentric=False)[0]
                 avCompatible = avCompatible.sort_values('dist', ascending=True)
                 
             # ----- Compatible SNCLs found.  Find the closest one with data ------------
@@ -257,8 +260,8 @@ def crossCorrelation_metrics(concierge):
 
                 # Get data in a window centered on the event's arrival at station #2
                 try:
-                    tt = irisseismic.getTraveltime(event.latitude, event.longitude, event.depth, 
-                                                   av2.latitude, av2.longitude)
+                    tt = concierge.get_traveltime(event.latitude, event.longitude, event.depth, 
+                                                 av2.latitude, av2.longitude)
                 except Exception as e:
                     logger.warning('Skipping %s:%s because getTravelTime failed: %s' % (av1.snclId, av2.snclId, e))
                     if av2.snclId is lastsncl:
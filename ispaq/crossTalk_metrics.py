@@ -149,6 +149,11 @@ def crossTalk_metrics(concierge):
         # Add sn_lId to the availability dataframe for easy detection
         availability.loc[:,'sn_lId'] = sn_lIds
 
+        # Request this event's waveforms together where the data source supports it, in loop order
+        concierge.prefetch_dataselect([(av.network, av.station, av.location, av.channel, halfHourStart-1, halfHourEnd+1)
+                                       for av in availability.sort_values('sn_lId', kind='mergesort').itertuples()
+                                       if not math.isnan(av.latitude)])
+
         # ----- All available SNCLs -------------------------------------------------
 
         for idx, sn_lId in enumerate(sorted(list(set(sn_lIds)))):
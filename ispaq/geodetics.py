@@ -0,0 +1,160 @@
+"""
+Vectorized great-circle calculations for ISPAQ.
+
+Distances and azimuths between one point (usually an event) and arrays of
+station coordinates are computed with NumPy in a single call, replacing
+per-station web service requests and Python loops.
+
+:copyright:
+    Mazama Science
+:license:
+    GNU Lesser General Public License, Version 3
+    (http://www.gnu.org/copyleft/lesser.html)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+import obspy.geodetics
+
+
+# Flattening of the WGS84 ellipsoid, used to convert to geocentric latitude
+_FLATTENING = 1.0 / 298.257223563
+
+# Earth mean radius in km, as used by IRISSeismic::surfaceDistance
+_EARTH_RADIUS = 6371.0
+
+# Relative and absolute (degrees) tolerance of the spherical distance in within_radius()
+_RADIUS_RTOL = 0.01
+_RADIUS_ATOL = 0.01
+
+
+def _unit_vectors(lat, lon, geocentric=True):
+    """
+    Returns (x, y, z) arrays of unit vectors for latitudes and longitudes in degrees.
+    """
+    lat = np.radians(np.asarray(lat, dtype='float64'))
+    lon = np.radians(np.asarray(lon, dtype='float64'))
+    if geocentric:
+        lat = np.arctan2((1.0 - _FLATTENING)**2 * np.sin(lat), np.cos(lat))
+    coslat = np.cos(lat)
+    return (coslat * np.cos(lon), coslat * np.sin(lon), np.sin(lat))
+
+
+def _azimuth(a, b):
+    """
+    Returns the azimuth in degrees from unit vectors ``a`` towards ``b``.
+    """
+    ax, ay, az = a
+    bx, by, bz = b
+    # North and east directions at a, the pole being (0, 0, 1)
+    east = (-ay, ax, np.zeros_like(ax))
+    north = (-az * ax, -az * ay, ax * ax + ay * ay)
+    e = bx * east[0] + by * east[1]
+    n = bx * north[0] + by * north[1] + bz * north[2]
+    return np.degrees(np.arctan2(e, n)) % 360.0
+
+
+def distaz(latitude, longitude, latitudes, longitudes, geocentric=True):
+    """
+    Distance, azimuth and back azimuth from one point to many.
+
+    By default latitudes are converted to geocentric latitude on the WGS84
+    ellipsoid before computing great-circle values, as done by the IRIS
+    distaz web service. With ``geocentric=False`` the Earth is treated as a
+    sphere, as done by :func:`obspy.geodetics.locations2degrees`.
+
+    :type latitude: float
+    :param latitude: Latitude of the source point (usually the event).
+    :type longitude: float
+    :param longitude: Longitude of the source point.
+    :type latitudes: float or array-like
+    :param latitudes: Latitudes of the receivers (stations).
+    :type longitudes: float or array-like
+    :param longitudes: Longitudes of the receivers.
+    :type geocentric: bool
+    :param geocentric: Whether to use geocentric latitudes.
+    :rtype: tuple of :class:`numpy.ndarray`
+    :return: ``(distance, azimuth, backAzimuth)`` in degrees, NaN where
+        receiver coordinates are missing.
+
+    .. rubric:: Example
+
+    >>> dist, az, baz = distaz(0.0, 0.0, [0.0, 10.0], [90.0, 0.0])
+    >>> [round(x, 3) for x in dist]
+    [90.0, 9.934]
+    >>> [round(x, 3) for x in az]
+    [90.0, 0.0]
+    >>> [round(x, 3) for x in baz]
+    [270.0, 180.0]
+    """
+    source = _unit_vectors(latitude, longitude, geocentric)
+    receivers = _unit_vectors(np.atleast_1d(latitudes), np.atleast_1d(longitudes), geocentric)
+    source = tuple(np.broadcast_to(c, receivers[0].shape) for c in source)
+
+    dot = source[0] * receivers[0] + source[1] * receivers[1] + source[2] * receivers[2]
+    cross = np.sqrt((source[1] * receivers[2] - source[2] * receivers[1])**2 +
+                    (source[2] * receivers[0] - source[0] * receivers[2])**2 +
+                    (source[0] * receivers[1] - source[1] * receivers[0])**2)
+    distance = np.degrees(np.arctan2(cross, dot))
+
+    azimuth = _azimuth(source, receivers)
+    backAzimuth = _azimuth(receivers, source)
+    return (distance, azimuth, backAzimuth)
+
+
+def surface_distance(latitude, longitude, latitudes, longitudes):
+    """
+    Great-circle distance in km on a spherical Earth, as returned by
+    IRISSeismic::surfaceDistance.
+
+    .. rubric:: Example
+
+    >>> [round(x, 1) for x in surface_distance(0.0, 0.0, [0.0, 45.0], [1.0, 0.0])]
+    [111.2, 5003.8]
+    """
+    distance = distaz(latitude, longitude, latitudes, longitudes, geocentric=False)[0]
+    return np.radians(distance) * _EARTH_RADIUS
+
+
+def within_radius(latitude, longitude, latitudes, longitudes, minradius=None, maxradius=None):
+    """
+    Boolean mask of receivers between ``minradius`` and ``maxradius`` degrees.
+
+    Distances are those of :func:`obspy.geodetics.gps2dist_azimuth` converted
+    with :func:`obspy.geodetics.kilometer2degrees`. They are estimated for all
+    receivers at once on the sphere and only receivers close to one of the
+    limits are recomputed on the ellipsoid.
+
+    .. rubric:: Example
+
+    >>> list(within_radius(0.0, 0.0, [0.0, 0.0, float('nan')], [5.0, 50.0, 1.0], maxradius=10))
+    [True, False, False]
+    """
+    latitudes = np.atleast_1d(np.asarray(latitudes, dtype='float64'))
+    longitudes = np.atleast_1d(np.asarray(longitudes, dtype='float64'))
+    distance = distaz(latitude, longitude, latitudes, longitudes)[0]
+    valid = ~(np.isnan(distance))
+
+    # Recompute distances close to either limit on the WGS84 ellipsoid
+    tolerance = _RADIUS_RTOL * distance + _RADIUS_ATOL
+    borderline = np.zeros(len(distance), dtype=bool)
+    for limit in (minradius, maxradius):
+        if limit is not None:
+            borderline |= valid & (np.abs(distance - limit) <= tolerance)
+    for ii in np.flatnonzero(borderline):
+        meters = obspy.geodetics.gps2dist_azimuth(latitude, longitude, latitudes[ii], longitudes[ii])[0]
+        distance[ii] = obspy.geodetics.kilometer2degrees(meters / 1000.0)
+
+    mask = valid
+    if minradius is not None:
+        mask &= (distance >= minradius)
+    if maxradius is not None:
+        mask &= (distance <= maxradius)
+    return mask
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(exclude_empty=True)
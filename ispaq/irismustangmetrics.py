@@ -46,12 +46,44 @@ from rpy2.robjects.conversion import localconverter
 _R_metricList2DF = robjects.r('IRISMustangMetrics::metricList2DF')
 _R_getMetricFunctionMetadata = robjects.r('IRISMustangMetrics::getMetricFunctionMetadata')
 
+# IRISMustangMetrics metric functions
+_R_sampleRateRespMetric = robjects.r('IRISMustangMetrics::sampleRateRespMetric')
+_R_sampleRateChannelMetric = robjects.r('IRISMustangMetrics::sampleRateChannelMetric')
+_R_transferFunctionMetric = robjects.r('IRISMustangMetrics::transferFunctionMetric')
+_R_PSDMetric = robjects.r('IRISMustangMetrics::PSDMetric')
+
+# Metric functions called by name, resolved on first use
+_R_metric_functions = {}
+
+# PSD plotting
+_R_png = robjects.r('grDevices::png')
+_R_dev_off = robjects.r('grDevices::dev.off')
+_R_psdList = robjects.r('IRISSeismic::psdList')
+_R_psdPlot = robjects.r('IRISSeismic::psdPlot')
+
 def function_metadata():
     r_json = _R_getMetricFunctionMetadata()
     py_json = r_json[0]
     functionMetadata = json.loads(py_json)
     return functionMetadata
 
+def _R_metric_function(metric_function_name):
+    """
+    Returns the IRISMustangMetrics function of a named metric.
+
+    R looks up ``IRISMustangMetrics::<name>Metric`` only the first time a
+    metric is used, later calls reuse the function.
+    """
+    R_function = _R_metric_functions.get(metric_function_name)
+    if R_function is None:
+        if metric_function_name == 'numSpikes':
+            function = 'IRISMustangMetrics::spikesMetric'
+        else:
+            function = 'IRISMustangMetrics::' + metric_function_name + 'Metric'
+        R_function = robjects.r(function)
+        _R_metric_functions[metric_function_name] = R_function
+    return R_function
+
 #     Functions that return GeneralValueMetrics     -----------------------------
 
 
@@ -63,14 +95,8 @@ def apply_simple_metric(r_stream, metric_function_name, *args, **kwargs):
     :param metric_function_name: the name of the set of metrics
     :return:
     """
-    
-    
-    if metric_function_name is 'numSpikes':
-        function = 'IRISMustangMetrics::spikesMetric'
-    else:
-        function = 'IRISMustangMetrics::' + metric_function_name + 'Metric'
-        
-    R_function = robjects.r(function)
+
+    R_function = _R_metric_function(metric_function_name)
     r_metriclist = R_function(r_stream, *args, **kwargs)  
     r_dataframe = _R_metricList2DF(r_metriclist)
 
@@ -96,8 +122,7 @@ def apply_sampleRateResp_metric(r_stream,resp_pct,norm_freq,evalresp):
     :return:
     """
 
-    function = 'IRISMustangMetrics::sampleRateRespMetric'
-    R_function = robjects.r(function)
+    R_function = _R_sampleRateRespMetric
 
     #kwargs is just evalresp, if none is provided then the R code will go to IRIS to get it anyway
     if evalresp is not None:
@@ -132,8 +157,7 @@ def apply_sampleRateChannel_metric(r_stream, channel_pct,chan_rate):
     :return:
     """
     
-    function = 'IRISMustangMetrics::sampleRateChannelMetric'
-    R_function = robjects.r(function)
+    R_function = _R_sampleRateChannelMetric
 
     r_metriclist = R_function(r_stream,channel_pct,chan_rate)
         
@@ -160,8 +184,7 @@ def apply_correlation_metric(r_stream1, r_stream2, metric_function_name, *args,
     :return:
     """
 
-    function = 'IRISMustangMetrics::' + metric_function_name + 'Metric'
-    R_function = robjects.r(function)
+    R_function = _R_metric_function(metric_function_name)
 
     pandas2ri.activate()
     r_metriclist = R_function(r_stream1, r_stream2, *args, **kwargs) 
@@ -192,7 +215,7 @@ def apply_transferFunction_metric(r_stream1, r_stream2, evalresp1, evalresp2):
     """
     
     
-    R_function = robjects.r('IRISMustangMetrics::transferFunctionMetric')
+    R_function = _R_transferFunctionMetric
     
     # NOTE:  Conversion of dataframes only works if you activate but we don't want conversion
     # NOTE:  to always be automatic so we deactivate() after we're done converting.
@@ -228,7 +251,7 @@ def apply_PSD_metric(r_stream, *args, **kwargs):
     :return: tuple of GeneralValueMetrics, corrected PSD, and PDF
     """
     
-    R_function = robjects.r('IRISMustangMetrics::PSDMetric')
+    R_function = _R_PSDMetric
 
     # look for optional parameter evalresp=pd.DataFrame
     evalresp = None
@@ -287,8 +310,8 @@ def apply_PSD_plot(r_stream, filepath, evalresp=None):
     :param evalresp: (optional) pandas dataframe of FAP from evalresp (freq,amp,phase)
     :return:
     """
-    result = robjects.r('grDevices::png')(filepath)
-    r_psdList = robjects.r('IRISSeismic::psdList')(r_stream)    
+    result = _R_png(filepath)
+    r_psdList = _R_psdList(r_stream)    
    
     #print(r_psdList)
    
@@ -303,13 +326,13 @@ def apply_PSD_plot(r_stream, filepath, evalresp=None):
 #         with localconverter(robjects.default_converter + pandas2ri.converter):
 #             r_evalresp = robjects.conversion.py2rpy(evalresp)
         r_evalresp = pandas2ri.py2ri(evalresp)  # convert to R dataframe
-        result = robjects.r('IRISSeismic::psdPlot')(r_psdList, style='pdf', evalresp=r_evalresp)
+        result = _R_psdPlot(r_psdList, style='pdf', evalresp=r_evalresp)
     else:
-        result = robjects.r('IRISSeismic::psdPlot')(r_psdList, style='pdf')
+        result = _R_psdPlot(r_psdList, style='pdf')
 
     pandas2ri.deactivate()
 
-    result = robjects.r('grDevices::dev.off')()
+    result = _R_dev_off()
 
     return True
 
@@ -11,7 +11,7 @@ Python module containing wrappers for the IRISSeismic R package.
 from __future__ import (absolute_import, division, print_function)
 from future.types import newint
 import pandas as pd
-from obspy import UTCDateTime
+from obspy import UTCDateTime, Stream, Trace
 import rpy2.robjects as ro
 from rpy2 import rinterface
 from rpy2.robjects import pandas2ri
@@ -41,10 +41,24 @@ _R_as_POSIXct = ro.r('base::as.POSIXct')                        # conversion of
 _R_vector = ro.r('base::vector')                                # creation of a the list of Traces used in R_Trace
 _R_list = ro.r('base::list')                                    # creation of the headerList used in R_Trace
 _R_as_logical = ro.r('base::as.logical')
+_R_object_size = ro.r('utils::object.size')                     # memory used by an R object
 
 # from IRISSeismic
 _R_initialize = ro.r('IRISSeismic::initialize')                 # initialization of various objects
 _R_slice = ro.r('IRISSeismic::slice')
+_R_surfaceDistance = ro.r('IRISSeismic::surfaceDistance')
+_R_multiplyBy = ro.r('IRISSeismic::multiplyBy')
+_R_mergeTraces = ro.r('IRISSeismic::mergeTraces')
+_R_rotate2D = ro.r('IRISSeismic::rotate2D')
+_R_new = ro.r('methods::new')
+
+# from signal
+_R_butter = ro.r('signal::butter')
+
+# Prototype objects passed to _R_initialize(), R copies them on modification
+_R_TraceHeader_prototype = ro.r('new("TraceHeader")')
+_R_Trace_prototype = ro.r('new("Trace")')
+_R_Stream_prototype = ro.r('new("Stream")')
 
 # All webservice functions from IRISSeismic
 _R_getAvailability = ro.r('IRISSeismic::getAvailability')       #
@@ -136,12 +150,35 @@ def R_float(x):
 
     if x is None:
         return np.NaN 
+    elif isinstance(x, np.ndarray):
+        return _R_float_array(x)
     else:
         if isinstance(x,float) or isinstance(x, int):
             x = [x]
         return ro.vectors.FloatVector(x)
 
 
+def _R_float_array(x):
+    """
+    Creates an R float vector from a `numpy.ndarray` with a single copy.
+
+    The R vector is allocated once and NumPy writes the samples, converted
+    to double, directly into R's memory. ``FloatVector(x)`` instead copies
+    one element at a time, which dominates the time needed to convert a
+    day-long trace.
+    """
+    # NOTE:  The default converter keeps the new vector an R object even when
+    # NOTE:  numpy2ri is active.
+    with localconverter(ro.default_converter):
+        r_vector = _R_vector("double", x.size)
+    try:
+        np.frombuffer(r_vector.memoryview(), dtype=np.float64)[:] = x.ravel()
+    except (AttributeError, TypeError, ValueError):
+        # NOTE:  Older rpy2 versions do not expose the memory of R vectors
+        return ro.vectors.FloatVector(x)
+    return r_vector
+
+
 def R_character(x):
     """
     Creates an R character vector from a list of python strings.
@@ -234,8 +271,7 @@ def R_TraceHeader(stats, latitude, longitude, elevation, depth, azimuth, dip):
                            azimuth=R_float(azimuth),
                            dip=R_float(dip))
 
-    r_traceHeader = ro.r('new("TraceHeader")')
-    r_traceHeader = _R_initialize(r_traceHeader, r_headerList)
+    r_traceHeader = _R_initialize(_R_TraceHeader_prototype, r_headerList)
 
              
     return r_traceHeader
@@ -260,9 +296,7 @@ def R_Trace(trace,
     :param input_units: Units available from IRIS getChannel webservice.
     :return: IRISSeismic Trace object.
     """
-    r_trace = ro.r('new("Trace")')
-    
-    r_trace = _R_initialize(r_trace,
+    r_trace = _R_initialize(_R_Trace_prototype,
                            id=".".join([trace.id,trace.stats.mseed.dataquality]),
                            stats=R_TraceHeader(trace.stats, latitude, longitude, elevation, depth, azimuth, dip),
                            Sensor=sensor,
@@ -312,12 +346,10 @@ def R_Stream(stream,
     r_listOfTraces = R_list(len(stream.traces))
 
     for i in range(len(stream.traces)):
-        numpy2ri.activate()
         r_listOfTraces[i] = R_Trace(stream.traces[i], sensor, scale, scalefreq, scaleunits, latitude, longitude, elevation, depth, azimuth, dip)
-        numpy2ri.deactivate()
 
     # Create R Stream object
-    r_stream = ro.r('new("Stream")')
+    r_stream = _R_Stream_prototype
         
     if timing_qual is None:
         numpy2ri.activate()
@@ -347,6 +379,52 @@ def R_Stream(stream,
     return(r_stream) 
 
 
+def py_Stream(r_stream, headonly=False):
+    """
+    Create an ObsPy Stream from an IRISSeismic Stream object
+    :param r_stream: IRISSeismic Stream object.
+    :param headonly: Only convert the trace headers, leaving empty data arrays.
+    :return: tuple of ObsPy Stream, requestedStarttime and requestedEndtime.
+
+    Trace data are NumPy views of the R vectors where rpy2 allows it, so the
+    arrays must not be modified.
+    """
+    traces = []
+    for r_trace in r_stream.do_slot('traces'):
+        r_stats = r_trace.do_slot('stats')
+        header = {'network': r_stats.do_slot('network')[0],
+                  'station': r_stats.do_slot('station')[0],
+                  'location': r_stats.do_slot('location')[0],
+                  'channel': r_stats.do_slot('channel')[0],
+                  'starttime': UTCDateTime(r_stats.do_slot('starttime')[0]),
+                  'sampling_rate': r_stats.do_slot('sampling_rate')[0],
+                  'mseed': {'dataquality': r_stats.do_slot('quality')[0]}}
+        if headonly:
+            npts = int(r_stats.do_slot('npts')[0])
+            trace = Trace(header=header)
+            trace.stats.npts = npts
+        else:
+            trace = Trace(data=_py_float_array(r_trace.do_slot('data')), header=header)
+        traces.append(trace)
+
+    requestedStarttime = UTCDateTime(r_stream.do_slot('requestedStarttime')[0])
+    requestedEndtime = UTCDateTime(r_stream.do_slot('requestedEndtime')[0])
+    return (Stream(traces), requestedStarttime, requestedEndtime)
+
+
+def _py_float_array(r_vector):
+    """
+    Returns a float64 `numpy.ndarray` sharing memory with an R numeric vector
+    where possible.
+    """
+    try:
+        x = np.asarray(r_vector.memoryview())
+    except (AttributeError, TypeError, ValueError):
+        # NOTE:  Older rpy2 versions do not expose the memory of R vectors
+        x = np.array(r_vector)
+    return x.astype(np.float64, copy=False)
+
+
 # ------------------------------------------------------------------------------
 
 
@@ -406,14 +484,41 @@ def _R_stationExtraArgs(includerestricted, latitude, longitude, minradius, maxra
     else:
         return (includerestricted, rinterface.MissingArg, rinterface.MissingArg, rinterface.MissingArg, rinterface.MissingArg)
 
+# User agent string and IrisClient objects, created on first use
+_user_agent = None
+_R_clients = {}
+
 def _userAgent():
     """
     Create user agent string for use with new("IrisClient")
     """
-    #ispaq_version = ispaq.__version__
-    ispaq_version = '3.0.0-beta'
-    r_agent_string = ro.r("paste0('IRISSeismic/',installed.packages()['IRISSeismic','Version'],' RCurl/',installed.packages()['RCurl','Version'],' R/',R.version$major,'.',R.version$minor,' ',version$platform,' ISPAQ/')")
-    return(r_agent_string[0]+ispaq_version)
+    global _user_agent
+    if _user_agent is None:
+        #ispaq_version = ispaq.__version__
+        ispaq_version = '3.0.0-beta'
+        r_agent_string = ro.r("paste0('IRISSeismic/',installed.packages()['IRISSeismic','Version'],' RCurl/',installed.packages()['RCurl','Version'],' R/',R.version$major,'.',R.version$minor,' ',version$platform,' ISPAQ/')")
+        _user_agent = r_agent_string[0]+ispaq_version
+    return(_user_agent)
+
+def _R_IrisClient(client_url=None, client_type=None):
+    """
+    Returns the IrisClient for a web services site and service type.
+
+    One client is created per ``(client_url, client_type)`` and reused by
+    all later requests. ``None`` leaves the IrisClient default in place.
+    """
+    key = (client_url, client_type)
+    r_client = _R_clients.get(key)
+    if r_client is None:
+        cmd = 'new("IrisClient"'
+        if client_url is not None:
+            cmd += ', site="' + client_url + '"'
+        if client_type is not None:
+            cmd += ', service_type="' + client_type + '"'
+        cmd += ', useragent="' + _userAgent() + '")'
+        r_client = ro.r(cmd)
+        _R_clients[key] = r_client
+    return r_client
 
 
 
@@ -453,10 +558,8 @@ def getAvailability(client_url="http://service.iris.edu",
     2     629145000
     ...
     """
-    user_agent = _userAgent()
-    cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '", useragent="' + user_agent + '")'
     #cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '")'
-    r_client = ro.r(cmd)
+    r_client = _R_IrisClient(client_url, client_type)
     
     starttime = R_POSIXct(starttime)
     endtime = R_POSIXct(endtime)
@@ -509,9 +612,7 @@ def getChannel(client_url="http://service.iris.edu",
     2     629145000
     ...
     """
-    user_agent = _userAgent()
-    cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '", useragent="' + user_agent + '")'
-    r_client = ro.r(cmd)
+    r_client = _R_IrisClient(client_url, client_type)
 
     # Convert python arguments to R equivalents
     starttime = R_POSIXct(starttime)
@@ -557,9 +658,7 @@ def R_getDataselect(client_url="http://service.iris.edu",
     
 #     from rpy2.robjects import pandas2ri
 
-    user_agent = _userAgent()
-    cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '", useragent="' + user_agent + '")'
-    r_client = ro.r(cmd)
+    r_client = _R_IrisClient(client_url, client_type)
     
 
     # Convert python arguments to R equivalents
@@ -592,8 +691,7 @@ def getDistaz(latitude, longitude, staLatitude, staLongitude):
          azimuth  backAzimuth  distance
     1  241.57595     47.88017  39.97257
     """
-    user_agent = _userAgent()
-    r_client = ro.r('new("IrisClient",useragent="' + user_agent + '")')
+    r_client = _R_IrisClient()
     
     # Call the function and return a pandas dataframe with the results
     r_df = _R_getDistaz(r_client, latitude, longitude, staLatitude, staLongitude)
@@ -633,9 +731,7 @@ def getEvalresp(client_url="http://service.iris.edu",
     """
     #r_client = ro.r('new("IrisClient")')
 
-    user_agent = _userAgent()
-    cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '", useragent="' + user_agent + '")'
-    r_client = ro.r(cmd)
+    r_client = _R_IrisClient(client_url, client_type)
     
     # Convert python arguments to R equivalents
     time = R_POSIXct(time)
@@ -673,9 +769,7 @@ def getEvent(client_url="https://earthquake.usgs.gov", starttime=None, endtime=N
     Name: eventLocationName, dtype: object
     """
     #cmd = 'new("IrisClient", site="' + client_url + '")'
-    user_agent = _userAgent()
-    cmd = 'new("IrisClient", site="' + client_url + '",useragent="' + user_agent + '")'
-    r_client = ro.r(cmd)
+    r_client = _R_IrisClient(client_url)
     
     # Convert python arguments to R equivalents
     starttime = R_POSIXct(starttime)
@@ -718,9 +812,7 @@ def getNetwork(client_url="http://service.iris.edu",
     :return: pandas dataframe of network metadata.
     """
     #cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '")'
-    user_agent = _userAgent()
-    cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '", useragent="' + user_agent + '")'
-    r_client = ro.r(cmd)
+    r_client = _R_IrisClient(client_url, client_type)
 
     # Convert python arguments to R equivalents
     starttime = R_POSIXct(starttime)
@@ -759,9 +851,7 @@ def R_getSNCL(client_url="http://service.iris.edu",
     :return: R Stream object
     """
     #cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '")'
-    user_agent = _userAgent()
-    cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '", useragent="' + user_agent + '")'
-    r_client = ro.r(cmd)
+    r_client = _R_IrisClient(client_url, client_type)
 
     # Convert python arguments to R equivalents
     starttime = R_POSIXct(starttime)
@@ -797,9 +887,7 @@ def getStation(client_url="http://service.iris.edu",
     :return: pandas dataframe of channel metadata.
     """
     #cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '")'
-    user_agent = _userAgent()
-    cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '", useragent="' + user_agent + '")'
-    r_client = ro.r(cmd)
+    r_client = _R_IrisClient(client_url, client_type)
 
     # Convert python arguments to R equivalents
     starttime = R_POSIXct(starttime)
@@ -829,8 +917,7 @@ def getTraveltime(latitude, longitude, depth, staLatitude, staLongitude):
     :return: pandas dataframe with columns: ``distance, depth, phaseName, travelTime, rayParam, takeoff, incident, puristDistance, puristName``.
     """
     #r_client = ro.r('new("IrisClient")')
-    user_agent = _userAgent()
-    r_client = ro.r('new("IrisClient",useragent="' + user_agent + '")')
+    r_client = _R_IrisClient()
     
     # Call the function and return a pandas dataframe with the results
     r_df = _R_getTraveltime(r_client, latitude, longitude, depth, staLatitude, staLongitude)
@@ -864,9 +951,7 @@ def getUnavailability(client_url="http://service.iris.edu",
     :return: pandas dataframe of channel metadata.
     """
     #cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '")'
-    user_agent = _userAgent()
-    cmd = 'new("IrisClient", site="' + client_url + '", service_type="' + client_type + '", useragent="' + user_agent + '")'
-    r_client = ro.r(cmd)
+    r_client = _R_IrisClient(client_url, client_type)
     
     # Convert python arguments to R equivalents
     starttime = R_POSIXct(starttime)
@@ -905,9 +990,17 @@ def R_slice(x, starttime, endtime):
     r_stream = _R_slice(x,starttime, endtime)
     return r_stream
 
-# surfaceDistance is needed in crossCorrelation_metrics.py
+def objectSize(x):
+    """
+    Return the memory used by an R object.
+    :param x: R object
+    :return: size in bytes
+    """
+    return int(_R_object_size(x)[0])
+
+# surfaceDistance is kept for R parity checks, event metrics use geodetics.surface_distance()
 def surfaceDistance(lat1, lon1, lat2, lon2):
-    R_function = ro.r('IRISSeismic::surfaceDistance')
+    R_function = _R_surfaceDistance
     r_result = R_function(R_float(lat1), R_float(lon1), R_float(lat2), R_float(lon2))
     with localconverter(ro.default_converter + pandas2ri.converter):
         result = ro.conversion.rpy2py(r_result)
@@ -917,21 +1010,21 @@ def surfaceDistance(lat1, lon1, lat2, lon2):
 
 # multiplyBy is needed in crossCorrelation_metrics.py
 def multiplyBy(x, y):
-    R_function = ro.r('IRISSeismic::multiplyBy')
+    R_function = _R_multiplyBy
     r_stream = R_function(x, R_float(y))
     
     return(r_stream)
 
 # mergeTraces is needed in pressureCorrelation_metrics.py
 def mergeTraces(r_stream):
-    R_function = ro.r('IRISSeismic::mergeTraces')
+    R_function = _R_mergeTraces
     r_stream = R_function(r_stream)
     
     return(r_stream)
 
 # butter is needed in crossCorrelation_metrics.py
 def butter(x, y):
-    R_function = ro.r('signal::butter')
+    R_function = _R_butter
     r_filter = R_function(R_float(x), R_float(y))
     
     return(r_filter)
@@ -946,9 +1039,12 @@ def trim_taper_filter(stN, stE, stZ, max_length, taper, filterArgs):
     """
     
     # Assign names in R
+    # NOTE:  The Streams may be shared through the Concierge waveform cache. A second
+    # NOTE:  binding makes R copy them on modification instead of editing them in place.
     _R_assign('stN',stN)
     _R_assign('stE',stE)
     _R_assign('stZ',stZ)
+    ro.r('stN_orig <- stN; stE_orig <- stE; stZ_orig <- stZ')
     
     # Adjust length
     ro.r('stN@traces[[1]]@data <- stN@traces[[1]]@data[1:%d]' % (max_length))
@@ -979,6 +1075,7 @@ def trim_taper_filter(stN, stE, stZ, max_length, taper, filterArgs):
     stN = _R_get('stN')
     stE = _R_get('stE')
     stZ = _R_get('stZ')
+    ro.r('rm(stN_orig, stE_orig, stZ_orig)')
     
     return(stN, stE, stZ, HZ)
 
@@ -986,7 +1083,7 @@ def trim_taper_filter(stN, stE, stZ, max_length, taper, filterArgs):
 # rotate2D is needed in orientationCheck_metrics.py 
 def rotate2D(st1, st2, angle):
     pandas2ri.activate()
-    R_function = ro.r('IRISSeismic::rotate2D')
+    R_function = _R_rotate2D
 
     r_list = R_function(st1, st2, angle)
     
@@ -1005,7 +1102,7 @@ def generalValueMetric(snclq, starttime, endtime, metricName, elementNames, elem
     elementNames = R_character(elementNames)
     elementValues = [str(i) for i in elementValues]
     elementValues = R_character(elementValues)
-    R_function = ro.r('methods::new')
+    R_function = _R_new
 
     
     pandas2ri.activate()
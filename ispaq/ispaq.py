@@ -73,6 +73,8 @@ def main():
                         help='FDSN webservice or path to QuakeML file')
     prefs.add_argument('--resp_dir', required=False,
                         help='path to directory with RESP files')
+    prefs.add_argument('--archive_layout', required=False,
+                        help='layout of a local miniSEED archive: SDS or a path template, default=search dataselect_url')
     prefs.add_argument('--output', required=False,
                        help='write metrics to csv file (csv) or sqlite database file (db). Options: csv, db')
     prefs.add_argument('--db_name', required=False,
@@ -83,6 +85,20 @@ def main():
                         help='directory to write/read existing PSD .csv files, if output=csv')
     prefs.add_argument('--pdf_dir', required=False,
                         help='directory to write generated PDF files')
+    prefs.add_argument('--cache_dir', required=False,
+                        help='directory to keep indexes and caches that are reused between runs')
+    prefs.add_argument('--waveform_cache_size', required=False,
+                        help='memory in MB for waveforms reused between metrics, 0 disables the cache')
+    prefs.add_argument('--traveltime_provider', required=False,
+                        help='source of travel times for event metrics: taup (local) or irisws, default=irisws')
+    prefs.add_argument('--prefetch_depth', required=False,
+                        help='number of local waveforms read ahead on background threads, 0 disables prefetching')
+    prefs.add_argument('--prefetch_memory', required=False,
+                        help='memory in MB for waveforms read ahead')
+    prefs.add_argument('--metric_engine', required=False,
+                        help='implementation of simple metrics: R (IRISMustangMetrics) or native (NumPy), default=R')
+    prefs.add_argument('--psd_engine', required=False,
+                        help='implementation of PSD metrics: R (IRISMustangMetrics) or native (NumPy), default=R')
     prefs.add_argument('--pdf_type', required=False,
                         help='output format of generated PDFs - text and/or plot')
     prefs.add_argument('--pdf_interval', required=False,
@@ -342,6 +358,8 @@ def main():
         except Exception as e:
             logger.debug(e)
             logger.error("Error calculating 'simple' metrics")
+        finally:
+            concierge.prefetcher.shutdown()
 
     
     if 'sampleRate' in concierge.logic_types:
@@ -366,6 +384,8 @@ def main():
         except Exception as e:
             logger.debug(e)
             logger.error("Error calculating 'sampleRate' metrics")
+        finally:
+            concierge.prefetcher.shutdown()
 
     # Generate SNR Metrics -----------------------------------------------------
 
@@ -392,6 +412,8 @@ def main():
         except Exception as e:
             logger.debug(e)
             logger.error("Error calculating 'SNR' metrics")
+        finally:
+            concierge.prefetcher.shutdown()
 
 
     # Generate PSD Metrics -----------------------------------------------------
@@ -421,6 +443,8 @@ def main():
         except Exception as e:
             logger.debug(e)
             logger.error("Error calculating 'PSD' metrics")
+        finally:
+            concierge.prefetcher.shutdown()
 
 
     # Generate Cross Talk Metrics ----------------------------------------------
@@ -447,6 +471,8 @@ def main():
         except Exception as e:
             logger.debug(e)
             logger.error("Error calculating 'crossTalk' metrics")
+        finally:
+            concierge.prefetcher.shutdown()
         
 
     # Generate Pressure Correlation Metrics ----------------------------------------------
@@ -473,6 +499,8 @@ def main():
         except Exception as e:
             logger.debug(e)
             logger.error("Error calculating 'pressureCorrelation' metrics")
+        finally:
+            concierge.prefetcher.shutdown()
         
 
     # Generate Cross Correlation Metrics ---------------------------------------
@@ -499,6 +527,8 @@ def main():
         except Exception as e:
             logger.debug(e)
             logger.error("Error calculating 'crossCorrelation' metrics")
+        finally:
+            concierge.prefetcher.shutdown()
                 
 
     # Generate Orientation Check Metrics ---------------------------------------
@@ -525,6 +555,8 @@ def main():
         except Exception as e:
             logger.debug(e)
             logger.error("Error calculating 'orientationCheck' metrics")
+        finally:
+            concierge.prefetcher.shutdown()
                         
                         
     # Generate Transfer Function Metrics ---------------------------------------
@@ -551,6 +583,8 @@ def main():
         except Exception as e:
             logger.debug(e)
             logger.error("Error calculating 'transferFunction' metrics")
+        finally:
+            concierge.prefetcher.shutdown()
 
 
     logger.info('ALL FINISHED!')
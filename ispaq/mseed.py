@@ -0,0 +1,319 @@
+"""
+Record-level access to local miniSEED files.
+
+A day file holds tens of thousands of records but event-based metrics only
+need the few minutes around an arrival.  The RecordIndex scans the record
+headers of a file once, keeps the time span of every record and reads only
+the byte ranges of records that overlap a requested window.
+
+:copyright:
+    Mazama Science
+:license:
+    GNU Lesser General Public License, Version 3
+    (http://www.gnu.org/copyleft/lesser.html)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import io
+import mmap
+import os
+
+import numpy as np
+
+from distutils.version import StrictVersion
+
+import ctypes as C
+
+import obspy
+import obspy.io.mseed.util
+from obspy.io.mseed.headers import clibmseed, HPTMODULUS, MS_NOERROR, MSRecord
+
+from . import cache
+
+
+def scan_records(source):
+    """
+    Returns the position, time span and state-of-health flags of every
+    record in a miniSEED file.
+
+    Record headers are parsed with libmseed, as
+    :func:`obspy.io.mseed.util.get_flags` does, and no data are decoded.
+
+    :param source: miniSEED file name, or the contents of a file as bytes or
+        a memory map.
+    :rtype: dict of :class:`numpy.ndarray`
+    :return: Arrays ``offset``, ``length``, ``starttime``, ``endtime`` (epoch
+        seconds of the first and last samples), ``sampling_rate``,
+        ``act_flags``, ``io_flags``, ``dq_flags`` (fixed header flag bytes)
+        and ``timing_quality`` (Blockette 1001, ``NaN`` when absent), one
+        element per record in file order.
+
+    .. rubric:: Example
+
+    >>> import os
+    >>> records = scan_records(os.path.join(os.path.dirname(__file__), '..',
+    ...                                     'test_data', 'II.KAPI.00.BHZ.2013.005.M'))
+    >>> len(records['offset']), int(records['length'][0])
+    (74, 4096)
+    """
+    if isinstance(source, str):
+        buffer = np.fromfile(source, dtype=np.int8)
+        name = source
+    else:
+        buffer = np.frombuffer(source, dtype=np.int8)
+        name = 'buffer'
+    rows = []
+    offset = 0
+    msr = clibmseed.msr_init(C.POINTER(MSRecord)())
+    try:
+        while offset < len(buffer):
+            record = buffer[offset:offset + 8192]
+            retcode = clibmseed.msr_parse(record, len(record), C.pointer(msr), -1, 0, 0)
+            if retcode != MS_NOERROR or msr.contents.reclen <= 0:
+                raise ValueError("Unable to parse the record at byte %d of %s" % (offset, name))
+            header = msr.contents.fsdh.contents
+            if msr.contents.Blkt1001:
+                timing_quality = msr.contents.Blkt1001.contents.timing_qual
+            else:
+                timing_quality = np.nan
+            rows.append((offset, msr.contents.reclen,
+                         clibmseed.msr_starttime(msr) / HPTMODULUS,
+                         clibmseed.msr_endtime(msr) / HPTMODULUS,
+                         msr.contents.samprate,
+                         header.act_flags, header.io_flags, header.dq_flags,
+                         timing_quality))
+            offset += msr.contents.reclen
+    finally:
+        clibmseed.msr_free(C.pointer(msr))
+
+    rows = np.array(rows, dtype='float64').reshape(-1, 9)
+    return {'offset': rows[:, 0].astype('int64'),
+            'length': rows[:, 1].astype('int64'),
+            'starttime': rows[:, 2],
+            'endtime': rows[:, 3],
+            'sampling_rate': rows[:, 4],
+            'act_flags': rows[:, 5].astype('uint8'),
+            'io_flags': rows[:, 6].astype('uint8'),
+            'dq_flags': rows[:, 7].astype('uint8'),
+            'timing_quality': rows[:, 8]}
+
+
+def record_flags(records):
+    """
+    Returns the :func:`read_flags` values of the records of a whole file from
+    its :func:`scan_records` arrays.
+
+    Flag counts include every record. As in
+    :func:`obspy.io.mseed.util.get_flags`, the timing quality is the mean over
+    records not overlapped by later data and is ``None`` unless all of those
+    records have a Blockette 1001.
+
+    .. rubric:: Example
+
+    >>> import os
+    >>> filepath = os.path.join(os.path.dirname(__file__), '..',
+    ...                         'test_data', 'II.KAPI.00.BHZ.2013.005.M')
+    >>> record_flags(scan_records(filepath)) == read_flags(filepath)
+    True
+    """
+    act_flags = [int(np.count_nonzero(records['act_flags'] & (1 << bit))) for bit in range(7)]
+    io_flags = [int(np.count_nonzero(records['io_flags'] & (1 << bit))) for bit in range(6)]
+    dq_flags = [int(np.count_nonzero(records['dq_flags'] & (1 << bit))) for bit in range(8)]
+
+    with np.errstate(divide='ignore'):
+        delta = 1.0 / records['sampling_rate']
+    ends = records['endtime'] + delta
+    # Latest ending records first, file order among equal ends
+    order = np.lexsort((-np.arange(len(ends)), -ends))
+    coverage_start = None
+    timing_quality = []
+    used_records = 0
+    for i in order:
+        start = records['starttime'][i]
+        end = ends[i]
+        if coverage_start is None:
+            coverage_start = start
+        else:
+            if start >= coverage_start:
+                continue
+            end = min(end, coverage_start)
+            coverage_start = start
+        if end - start <= 0.0:
+            continue
+        used_records += 1
+        if not np.isnan(records['timing_quality'][i]):
+            timing_quality.append(records['timing_quality'][i])
+
+    if timing_quality and len(timing_quality) == used_records:
+        timing_qual = float(np.mean(timing_quality))
+    else:
+        timing_qual = None
+
+    return (act_flags, io_flags, dq_flags, timing_qual)
+
+
+def read_flags(source, starttime=None, endtime=None):
+    """
+    Returns the state-of-health flag counts and mean timing quality of
+    miniSEED data, as stored with an R Stream.
+
+    :param source: miniSEED file name or file-like object.
+    :return: ``(act_flags, io_flags, dq_flags, timing_qual)``
+    """
+    if (StrictVersion(obspy.__version__) < StrictVersion("1.1.0")):
+        flag_dict = obspy.io.mseed.util.get_timing_and_data_quality(source)
+        act_flags = [0,0,0,0,0,0,0,0] # not supported before 1.1.0
+        io_flags = [0,0,0,0,0,0,0,0]  # not supported before 1.1.0
+        dq_flags = flag_dict['data_quality_flags']
+    else:
+        flag_dict = obspy.io.mseed.util.get_flags(source, starttime=starttime, endtime=endtime)
+        act_flags = list(flag_dict['activity_flags_counts'].values())
+        io_flags = list(flag_dict['io_and_clock_flags_counts'].values())
+        dq_flags = list(flag_dict['data_quality_flags_counts'].values())
+
+    if flag_dict["timing_quality"]:
+        timing_qual = flag_dict["timing_quality"]["mean"]
+    else:
+        timing_qual = None
+
+    return (act_flags, io_flags, dq_flags, timing_qual)
+
+
+def read_headers(source, starttime, endtime):
+    """
+    Reads the trace headers of miniSEED data cut to a window, without
+    decoding any samples.
+
+    The traces are those of ``obspy.read(source).slice(starttime, endtime,
+    nearest_sample=False)``. Their data are read-only arrays of zeros that
+    use no memory, so only the headers are meaningful.
+
+    :param source: miniSEED file name or file-like object.
+    :rtype: :class:`obspy.core.stream.Stream`
+
+    .. rubric:: Example
+
+    >>> import os
+    >>> filepath = os.path.join(os.path.dirname(__file__), '..',
+    ...                         'test_data', 'II.KAPI.00.BHZ.2013.005.M')
+    >>> starttime = obspy.UTCDateTime("2013-01-05T01:00:00")
+    >>> st = read_headers(filepath, starttime, starttime + 3600 - 0.000001)
+    >>> print(st)  #doctest: +NORMALIZE_WHITESPACE
+    1 Trace(s) in Stream:
+    II.KAPI.00.BHZ | 2013-01-05T01:00:00.019500Z - 2013-01-05T01:59:59.969500Z | 20.0 Hz, 72000 samples
+    """
+    st = obspy.read(source, format='MSEED', headonly=True)
+    for tr in st:
+        tr.data = np.broadcast_to(np.zeros(1, dtype=np.int32), (tr.stats.npts,))
+    return st.slice(starttime, endtime, nearest_sample=False)
+
+
+class RecordIndex(object):
+    """
+    Per-file record indexes, kept in memory and in ``cache_dir`` between runs.
+
+    Indexes are validated against the file size and modification time so
+    that a rewritten file is scanned again. ``cache_dir`` holds one index
+    file per miniSEED file, replaced when that file changes; indexes of files
+    that no longer exist are left behind and may be deleted at any time.
+
+    :type cache_dir: str
+    :param cache_dir: Directory in which to persist the indexes, or ``None``.
+    :type maxsize: int
+    :param maxsize: Maximum memory in bytes used by the indexes kept in memory.
+    """
+    def __init__(self, cache_dir=None, maxsize=128 * 1024**2, logger=None):
+        self.logger = logger
+        self._memory = cache.LRUCache(maxsize)
+        self._disk = cache.DiskCache(cache_dir, 'mseed_index', logger)
+
+    def records(self, filepath, buffer=None):
+        """
+        Returns the :func:`scan_records` arrays of a file.
+
+        ``buffer`` may hold the contents of the file, which are then scanned
+        instead of reading the file again.
+        """
+        path = os.path.abspath(filepath)
+        filestat = os.stat(path)
+        version = (filestat.st_size, filestat.st_mtime)
+        records = self._memory.get((path, version))
+        if records is None:
+            stored = self._disk.get(path)
+            if stored is not None and stored[0] == version:
+                records = stored[1]
+            else:
+                if self.logger is not None:
+                    self.logger.debug("Indexing miniSEED records of %s" % filepath)
+                records = scan_records(path if buffer is None else buffer)
+                self._disk.put(path, (version, records))
+            self._memory.put((path, version), records, sum(a.nbytes for a in records.values()))
+        return records
+
+    def read(self, filepath, starttime, endtime):
+        """
+        Reads the records of a miniSEED file that overlap a time window.
+
+        The stream is the same as ``obspy.read(filepath, starttime=starttime,
+        endtime=endtime)`` but records outside the window are neither read
+        from disk nor decoded.
+
+        Windows that cover the whole UTC day of the file's first record,
+        as simple and PSD metrics use, read the file directly without
+        indexing it.
+
+        :rtype: tuple
+        :return: ``(stream, flags)`` with the :func:`read_flags` values of
+            the whole file.
+        """
+        try:
+            first = obspy.io.mseed.util.get_record_information(filepath)['starttime']
+            day_start = obspy.UTCDateTime(first.date)
+            whole_day = starttime <= day_start and endtime >= day_start + 86400 - 0.001
+        except Exception:
+            whole_day = False
+
+        # The file is read once: flags and records are scanned from the
+        # same bytes that are decoded
+        with open(filepath, 'rb') as f:
+            if whole_day:
+                data = f.read()
+                try:
+                    flags = record_flags(scan_records(data))
+                except Exception as e:
+                    if self.logger is not None:
+                        self.logger.debug("Reading flags of all of %s: %s" % (filepath, e))
+                    flags = read_flags(io.BytesIO(data))
+                return (obspy.read(io.BytesIO(data), format='MSEED', starttime=starttime, endtime=endtime), flags)
+
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                try:
+                    records = self.records(filepath, mm)
+                except Exception as e:
+                    if self.logger is not None:
+                        self.logger.debug("Reading all of %s: %s" % (filepath, e))
+                    data = mm[:]
+                    return (obspy.read(io.BytesIO(data), format='MSEED', starttime=starttime, endtime=endtime),
+                            read_flags(io.BytesIO(data)))
+                flags = record_flags(records)
+
+                # Allow one sample of slack for ObsPy's nearest sample trimming
+                slack = 1.0 / np.where(records['sampling_rate'] > 0, records['sampling_rate'], 1.0)
+                selected = np.flatnonzero((records['endtime'] + slack >= starttime.timestamp) &
+                                          (records['starttime'] - slack <= endtime.timestamp))
+                if len(selected) == 0:
+                    return (obspy.Stream(), flags)
+
+                data = b''.join(mm[o:o + l] for (o, l) in
+                                zip(records['offset'][selected], records['length'][selected]))
+            finally:
+                mm.close()
+
+        return (obspy.read(io.BytesIO(data), format='MSEED', starttime=starttime, endtime=endtime), flags)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(exclude_empty=True)
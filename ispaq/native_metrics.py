@@ -0,0 +1,743 @@
+"""
+NumPy implementations of IRISMustangMetrics simple metrics.
+
+Each metric function takes an ObsPy Stream with the requested start and end
+times of the IRISSeismic Stream it was made from, and returns a dataframe
+with the same columns and value strings as the corresponding
+``irismustangmetrics.apply_simple_metric()`` result:
+``metricName, snclq, starttime, endtime, qualityFlag, value``.
+
+The ``metric_engine`` preference selects these functions (``native``) or
+the R package (``R``) in simple_metrics.py.
+
+:copyright:
+    Mazama Science
+:license:
+    GNU Lesser General Public License, Version 3
+    (http://www.gnu.org/copyleft/lesser.html)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import math
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+
+from obspy import UTCDateTime
+
+
+ENGINES = ('R', 'native')
+
+# Columns of the dataframe returned by IRISMustangMetrics::metricList2DF for GeneralValueMetrics
+_COLUMNS = ('metricName', 'snclq', 'starttime', 'endtime', 'qualityFlag', 'value')
+
+
+#     Helper functions     ----------------------------------------------------
+
+
+def _format_value(x, digits=7, nsmall=0):
+    """
+    Formats a metric value as R's ``format(x, digits=7, nsmall=0)`` does for
+    GeneralValueMetric value strings, with missing values as ``"NULL"``.
+
+    .. rubric:: Example
+
+    >>> [_format_value(x) for x in [0.3, 123456.7891, 12345678.0, 0.0001234, 0.00001234, -2.5e10, 42]]
+    ['0.3', '123456.8', '12345678', '0.0001234', '1.234e-05', '-2.5e+10', '42']
+    >>> [_format_value(x, nsmall=3) for x in [0.0, 12.5, 3.14159265]]
+    ['0.000', '12.500', '3.141593']
+    """
+    if isinstance(x, (int, np.integer)):
+        return str(int(x))
+    x = float(x)
+    if np.isnan(x):
+        return 'NULL'
+    if np.isinf(x):
+        return 'Inf' if x > 0 else '-Inf'
+    if x == 0.0:
+        return '%.*f' % (nsmall, 0.0)
+
+    # Significant digits and exponent after rounding to 'digits'
+    mantissa, exponent = ('%.*e' % (digits - 1, abs(x))).split('e')
+    kpower = int(exponent)
+    nsig = len(mantissa.replace('.', '').rstrip('0'))
+
+    # R uses fixed notation unless it is wider than scientific notation
+    sign = 1 if x < 0 else 0
+    rgt = max(0, nsig - kpower - 1)
+    left = kpower + 1 if kpower >= 0 else 1
+    fixed_width = sign + left + (rgt + 1 if rgt > 0 else 0)
+    sci_width = sign + (nsig + 1 if nsig > 1 else 1) + (5 if abs(kpower) >= 100 else 4)
+    if fixed_width <= sci_width:
+        return '%.*f' % (max(rgt, nsmall), x)
+    else:
+        return '%.*e' % (nsig - 1, x)
+
+
+def _snclq(st, metric_name):
+    """
+    Returns the single SNCLQ identifier of all traces in a stream.
+    """
+    unique_ids = sorted(set(['.'.join([tr.id, tr.stats.mseed.dataquality]) for tr in st]))
+    if len(unique_ids) > 1:
+        raise ValueError("%s: Stream has %d unique identifiers" % (metric_name, len(unique_ids)))
+    return unique_ids[0]
+
+
+def _metric_df(snclq, starttime, endtime, values):
+    """
+    Returns a dataframe of GeneralValueMetrics.
+
+    :param values: list of ``(metricName, value)`` tuples; a value that is
+        already a string is used as is.
+    """
+    rows = [(metricName, snclq, starttime, endtime, -9.0,
+             value if isinstance(value, str) else _format_value(value))
+            for (metricName, value) in values]
+    return pd.DataFrame(rows, columns=_COLUMNS)
+
+
+def _data(st):
+    """
+    Returns the samples of all traces as one float64 array without missing values.
+    """
+    if len(st) == 1:
+        data = np.asarray(st[0].data, dtype=np.float64)
+    else:
+        data = np.concatenate([np.asarray(tr.data, dtype=np.float64) for tr in st])
+    missing = np.isnan(data)
+    if missing.any():
+        data = data[~missing]
+    return data
+
+
+def _mean(data):
+    """
+    Mean with the extended precision accumulation and correction pass of R's mean().
+    """
+    n = len(data)
+    mean = data.sum(dtype=np.longdouble) / n
+    mean += (data - mean).sum(dtype=np.longdouble) / n
+    return float(mean)
+
+
+#     Metric functions     ----------------------------------------------------
+
+
+def basicStatsMetric(st, starttime, endtime):
+    """
+    Sample min, median, mean, max, rms variance and number of unique values,
+    as IRISMustangMetrics::basicStatsMetric.
+
+    Traces are concatenated so that gaps and overlaps are handled as in R:
+    every sample of every trace counts once.
+
+    :type st: :class:`obspy.core.stream.Stream`
+    :param st: Stream of a single SNCLQ.
+    :type starttime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Requested start time of the stream.
+    :type endtime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param endtime: Requested end time of the stream.
+    :rtype: :class:`pandas.DataFrame`
+
+    .. rubric:: Example
+
+    >>> from obspy import Trace, Stream, UTCDateTime
+    >>> tr = Trace(np.array([1, 2, 2, 7], dtype=np.int32), {'network': 'XX', 'station': 'TEST'})
+    >>> tr.stats.mseed = {'dataquality': 'M'}
+    >>> df = basicStatsMetric(Stream([tr]), UTCDateTime(0), UTCDateTime(4))
+    >>> list(zip(df.metricName, df.value))  #doctest: +NORMALIZE_WHITESPACE
+    [('sample_min', '1'), ('sample_median', '2'), ('sample_mean', '3'), ('sample_max', '7'),
+     ('sample_rms', '2.345208'), ('sample_unique', '3')]
+    """
+    snclq = _snclq(st, 'basicStatsMetric')
+    data = _data(st)
+
+    mean = _mean(data)
+    rmsVariance = float(np.sqrt(np.square(data - mean).sum(dtype=np.longdouble) / len(data)))
+
+    values = [('sample_min', float(data.min())),
+              ('sample_median', float(np.median(data))),
+              ('sample_mean', mean),
+              ('sample_max', float(data.max())),
+              ('sample_rms', rmsVariance),
+              ('sample_unique', len(np.unique(data)))]
+    return _metric_df(snclq, starttime, endtime, values)
+
+
+def getGaps(st, starttime, endtime):
+    """
+    Gaps (positive) and overlaps (negative) in seconds before, between and
+    after the traces of a stream, as IRISSeismic::getGaps.
+
+    Only trace headers are used.
+
+    :return: `numpy.ndarray` of ``len(st) + 1`` values, 0 where there is no
+        gap of at least one sample.
+    """
+    starts = np.array([tr.stats.starttime.timestamp for tr in st])
+    ends = np.array([tr.stats.endtime.timestamp for tr in st])
+    sampling_rates = np.array([tr.stats.sampling_rate for tr in st], dtype=np.float64)
+    if np.any(sampling_rates < 0):
+        raise ValueError("getGaps.Stream: encountered sampling rate < 0")
+    periods = 1.0 / sampling_rates
+    tolerances = periods - 0.5 / sampling_rates
+
+    gaps = np.zeros(len(st) + 1)
+
+    # Initial gap (no overlap possible)
+    delta = (starts[0] - starttime.timestamp) - periods[0]
+    if delta > tolerances[0]:
+        gaps[0] = delta + periods[0]
+
+    # Inter-trace gaps and overlaps
+    delta = (starts[1:] - ends[:-1]) - periods[:-1]
+    gaps[1:-1] = np.where(np.abs(delta) > tolerances[:-1], delta, 0.0)
+
+    # Final gap (no overlap possible)
+    delta = (endtime.timestamp - ends[-1]) - periods[-1]
+    if delta > tolerances[-1]:
+        gaps[-1] = delta
+
+    return gaps
+
+
+def gapsMetric(st, starttime, endtime):
+    """
+    Number and maximum length of gaps and overlaps and percent availability,
+    as IRISMustangMetrics::gapsMetric.
+
+    Only trace headers are used, so ``st`` may come from
+    ``obspy.read(..., headonly=True)`` without decoding any samples.
+
+    :type st: :class:`obspy.core.stream.Stream`
+    :param st: Stream of a single SNCLQ.
+    :type starttime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Requested start time of the stream.
+    :type endtime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param endtime: Requested end time of the stream.
+    :rtype: :class:`pandas.DataFrame`
+
+    .. rubric:: Example
+
+    >>> from obspy import Trace, Stream, UTCDateTime
+    >>> traces = [Trace(np.zeros(10), {'starttime': UTCDateTime(0)}),
+    ...           Trace(np.zeros(50), {'starttime': UTCDateTime(20)})]
+    >>> for tr in traces: tr.stats.mseed = {'dataquality': 'M'}
+    >>> df = gapsMetric(Stream(traces), UTCDateTime(0), UTCDateTime(100))
+    >>> list(zip(df.metricName, df.value))  #doctest: +NORMALIZE_WHITESPACE
+    [('num_gaps', '2'), ('max_gap', '30.000'), ('num_overlaps', '0'), ('max_overlap', '0'),
+     ('percent_availability', '60')]
+    """
+    snclq = _snclq(st, 'getGaps.Stream')
+    gaps = getGaps(st, starttime, endtime)
+
+    if gaps.sum(dtype=np.longdouble) == 0:
+        num_gaps = num_overlaps = 0
+        max_gap = max_overlap = 0.0
+        gap_secs = 0.0
+    else:
+        positive = gaps[gaps > 0]
+        num_gaps = len(positive)
+        max_gap = float(positive.max()) if num_gaps > 0 else 0.0
+        gap_secs = float(positive.sum(dtype=np.longdouble))
+        negative = gaps[gaps < 0]
+        num_overlaps = len(negative)
+        max_overlap = abs(float(negative.min())) if num_overlaps > 0 else 0.0
+
+    if num_gaps == 0:
+        percent_availability = 100.0
+    else:
+        totalSecs = endtime.timestamp - starttime.timestamp
+        percent_availability = 100 - 100 * gap_secs / totalSecs
+    percent_availability = min(max(percent_availability, 0.0), 100.0)
+
+    values = [('num_gaps', num_gaps),
+              ('max_gap', _format_value(max_gap, nsmall=3)),
+              ('num_overlaps', num_overlaps),
+              ('max_overlap', _format_value(max_overlap, digits=8)),
+              ('percent_availability', percent_availability)]
+    return _metric_df(snclq, starttime, endtime, values)
+
+
+def _detrend(data):
+    """
+    Residuals of a least squares linear fit, as ``pracma::detrend(x, tt='linear')``.
+    """
+    n = len(data)
+    a = np.column_stack((np.arange(1, n + 1) / n, np.ones(n)))
+    coefficients = np.linalg.lstsq(a, data, rcond=None)[0]
+    return data - a.dot(coefficients)
+
+
+def roll_stalta(x, n_sta, n_lta, increment=1, chunksize=2**16):
+    """
+    Ratio of the short term average right of each index (including it) to the
+    long term average left of it (including it), as seismicRoll::roll_stalta.
+
+    Window sums are differences of an extended precision cumulative sum, so
+    every index costs the same however long the windows are. The sum restarts
+    for each chunk of ``chunksize`` indexes, covering only the samples of the
+    chunk's windows, so rounding errors do not grow over a day of data.
+
+    :type x: :class:`numpy.ndarray`
+    :param x: Signal, typically squared amplitudes.
+    :param n_sta: Number of samples in the STA window.
+    :param n_lta: Number of samples in the LTA window.
+    :param increment: Distance between evaluated indexes.
+    :return: `numpy.ndarray` the length of ``x`` with NaN where the windows
+        do not fit or where STA/LTA is not evaluated.
+
+    .. rubric:: Example
+
+    >>> roll_stalta(np.array([1., 1., 1., 4., 4., 1., 1.]), 2, 3).round(3).tolist()
+    [nan, nan, nan, 2.0, 0.833, nan, nan]
+    """
+    n_sta = int(n_sta)
+    n_lta = int(n_lta)
+    if n_sta > len(x):
+        raise ValueError("n_sta cannot be greater than length(x).")
+    if n_lta > len(x):
+        raise ValueError("n_lta cannot be greater than length(x).")
+    if increment < 1:
+        raise ValueError("increment must be >= 1.")
+
+    out = np.full(len(x), np.nan)
+    indexes = np.arange(n_lta, len(x) - n_sta, int(increment))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, len(indexes), chunksize):
+            ind = indexes[start:start + chunksize]
+            # Samples from the first LTA window to the last STA window of the chunk
+            first = ind[0] + 1 - n_lta
+            last = ind[-1] + n_sta
+            cumsum = np.zeros(last - first + 1, dtype=np.longdouble)
+            np.cumsum(x[first:last], dtype=np.longdouble, out=cumsum[1:])
+            ind_chunk = ind - first
+            sta = (cumsum[ind_chunk + n_sta] - cumsum[ind_chunk]) / n_sta
+            lta = (cumsum[ind_chunk + 1] - cumsum[ind_chunk + 1 - n_lta]) / n_lta
+            out[ind] = (sta / lta).astype(np.float64)
+    return out
+
+
+def STALTAMetric(st, starttime, endtime, staSecs=3, ltaSecs=30, increment=1, algorithm='classic_LR'):
+    """
+    Maximum STA/LTA of the linearly detrended, squared samples and the time
+    at which it occurs, as IRISMustangMetrics::STALTAMetric.
+
+    The default ``increment=1`` evaluates STA/LTA at every sample.
+
+    :type st: :class:`obspy.core.stream.Stream`
+    :param st: Stream of a single SNCLQ.
+    :type starttime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Requested start time of the stream.
+    :type endtime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param endtime: Requested end time of the stream.
+    :param staSecs: STA window in seconds.
+    :param ltaSecs: LTA window in seconds.
+    :param increment: Distance in samples between evaluated STA/LTA values.
+    :param algorithm: Only ``classic_LR`` is implemented.
+    :rtype: :class:`pandas.DataFrame` with an additional ``time`` column.
+    """
+    if algorithm != 'classic_LR':
+        raise ValueError('STALTAMetric: algorithm="%s" is not implemented natively' % algorithm)
+
+    snclq = _snclq(st, 'STALTAMetric')
+
+    maxSTALTA = 0.0
+    eventTime = starttime.timestamp
+
+    for tr in st:
+        # Make sure trace has enough data
+        sampling_rate = tr.stats.sampling_rate
+        if len(tr.data) <= ltaSecs * sampling_rate + staSecs * sampling_rate:
+            continue
+
+        data = _detrend(np.asarray(tr.data, dtype=np.float64))
+        stalta = roll_stalta(np.square(data), staSecs * sampling_rate, ltaSecs * sampling_rate, increment)
+        stalta[np.isinf(stalta)] = np.nan
+
+        if np.all(np.isnan(stalta)):
+            raise ValueError("STALTAMetric: stalta returns a vector with all NA or NaN")
+
+        eventIndex = int(np.nanargmax(stalta))
+        traceMaxSTALTA = stalta[eventIndex]
+        if traceMaxSTALTA > maxSTALTA:
+            maxSTALTA = float(traceMaxSTALTA)
+            # NOTE:  R uses the 1-based index of the maximum
+            eventTime = tr.stats.starttime.timestamp + (eventIndex + 1) / sampling_rate
+
+    df = _metric_df(snclq, starttime, endtime, [('max_stalta', maxSTALTA)])
+    df['time'] = UTCDateTime(math.floor(eventTime)).strftime('%Y-%m-%dT%H:%M:%S')
+    return df
+
+
+def _sliding_windows(x, n):
+    """
+    Read-only view of every window of ``n`` consecutive samples of ``x``.
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    windows = np.lib.stride_tricks.as_strided(x, shape=(len(x) - n + 1, n),
+                                              strides=(x.strides[0], x.strides[0]))
+    windows.flags.writeable = False
+    return windows
+
+
+def _median_rows(windows, n):
+    """
+    Median of each row of a 2-D array of ``n`` columns, as seismicRoll computes it.
+    """
+    k = n // 2
+    if n % 2:
+        return np.partition(windows, k, axis=1)[:, k]
+    else:
+        ordered = np.partition(windows, (k - 1, k), axis=1)
+        return (ordered[:, k - 1] + ordered[:, k]) / 2
+
+
+def _hampel(x, n, indexes, chunksize=2**16):
+    """
+    :func:`roll_hampel` values at the given indexes.
+    """
+    L = 1.4826
+    k = n // 2
+    windows = _sliding_windows(x, n)
+
+    out = np.empty(len(indexes))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, len(indexes), chunksize):
+            ind = indexes[start:start + chunksize]
+            chunk = windows[ind - k]
+            x0 = _median_rows(chunk, n)
+            medianAbsMinusMedian = _median_rows(np.abs(chunk - x0[:, np.newaxis]), n)
+            out[start:start + chunksize] = np.abs(x[ind] - x0) / (L * medianAbsMinusMedian)
+    return out
+
+
+def roll_hampel(x, n, increment=1):
+    """
+    Distance of each sample from the median of the centered window of ``n``
+    samples, in units of 1.4826 median absolute deviations, as
+    seismicRoll::roll_hampel.
+
+    :type x: :class:`numpy.ndarray`
+    :param x: Signal.
+    :param n: Window size in samples.
+    :param increment: Distance between evaluated indexes.
+    :return: `numpy.ndarray` the length of ``x`` with NaN in the half-window
+        at either end and where the filter is not evaluated.
+
+    .. rubric:: Example
+
+    >>> roll_hampel(np.array([1., 2., 1., 9., 2., 1., 2.]), 3).round(3).tolist()
+    [nan, inf, 0.674, 4.721, 0.0, inf, nan]
+    """
+    n = int(n)
+    if n > len(x):
+        raise ValueError("n cannot be greater than length(x).")
+    if increment < 1:
+        raise ValueError("increment must be >= 1.")
+
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    k = n // 2
+    indexes = np.arange(k, len(x) - k, int(increment))
+
+    out = np.full(len(x), np.nan)
+    out[indexes] = _hampel(x, n, indexes)
+    return out
+
+
+def _hampel_candidates(x, n, thresholdMin):
+    """
+    Indexes at which :func:`roll_hampel` may exceed ``thresholdMin``, for an
+    odd window size.
+
+    With ``x0`` the window median at sorted position ``k = n // 2``, fewer
+    than ``k + 1`` samples lie strictly closer to ``x0`` than the sorted
+    values at positions ``k - b`` and ``k + a`` when ``a + b = k + 1``, so
+    the median absolute deviation is at least the smaller of those two
+    distances. Rank filters give that lower bound everywhere in linear time.
+
+    :return: ``(candidates, finite)``, where ``finite`` is ``True`` if the
+        filter is known to be finite somewhere.
+    """
+    k = n // 2
+    a = (k + 1) // 2
+    b = k + 1 - a
+    x0 = ndimage.median_filter(x, size=n)[k:len(x) - k]
+    lower = x0 - ndimage.rank_filter(x, k - b, size=n)[k:len(x) - k]
+    upper = ndimage.rank_filter(x, k + a, size=n)[k:len(x) - k] - x0
+    spread = np.minimum(lower, upper)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bound = np.abs(x[k:len(x) - k] - x0) / (1.4826 * spread)
+    # NOTE:  Compare spread with 0 rather than rely on the sign of an infinite bound, as x0 may be -0.0
+    candidates = np.flatnonzero(~((spread > 0) & (bound <= thresholdMin))) + k
+    return (candidates, bool(np.any(spread > 0)))
+
+
+def findOutliers(x, n=41, thresholdMin=10, selectivity=None, increment=1, fixedThreshold=True):
+    """
+    Indexes of the samples that :func:`roll_hampel` flags as outliers, as
+    seismicRoll::findOutliers.
+
+    With a fixed threshold and an odd window, the filter is only evaluated
+    where a lower bound of the median absolute deviation allows it to
+    exceed ``thresholdMin``.
+
+    :return: `numpy.ndarray` of 0-based indexes.
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    n = int(n)
+
+    if fixedThreshold and n % 2 and n >= 3 and increment == 1 and n <= len(x):
+        (candidates, finite) = _hampel_candidates(x, n, thresholdMin)
+        h = _hampel(x, n, candidates)
+        h[np.isinf(h)] = np.nan
+        if not finite and np.all(np.isnan(h)):
+            raise ValueError("roll_hampel returns a vector with all NA or NaN (50%+ of values in all windows are identical)")
+        with np.errstate(invalid='ignore'):
+            return candidates[h > thresholdMin]
+
+    h = roll_hampel(x, n, increment)
+
+    # If 50%+ of values in window are the same, then h blows up to Inf
+    h[np.isinf(h)] = np.nan
+
+    if np.all(np.isnan(h)):
+        raise ValueError("roll_hampel returns a vector with all NA or NaN (50%+ of values in all windows are identical)")
+
+    maxH = np.nanmax(h)
+    with np.errstate(invalid='ignore'):
+        if maxH < thresholdMin:
+            return np.array([], dtype=np.int64)
+        elif fixedThreshold:
+            return np.flatnonzero(h > thresholdMin)
+        elif selectivity is None:
+            return np.array([], dtype=np.int64)
+        else:
+            return np.flatnonzero(h > maxH * selectivity)
+
+
+def spikesMetric(st, starttime, endtime, windowSize=41, thresholdMin=10, selectivity=None, fixedThreshold=True):
+    """
+    Number of spikes found by a rolling Hampel filter, as
+    IRISMustangMetrics::spikesMetric.
+
+    Traces are concatenated and adjacent outliers count as one spike.
+
+    :type st: :class:`obspy.core.stream.Stream`
+    :param st: Stream of a single SNCLQ.
+    :type starttime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Requested start time of the stream.
+    :type endtime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param endtime: Requested end time of the stream.
+    :param windowSize: Hampel filter window in samples.
+    :param thresholdMin: Minimum filter value of an outlier.
+    :param selectivity: Fraction of the maximum filter value above which
+        samples are outliers, used when ``fixedThreshold`` is ``False``.
+    :param fixedThreshold: Use ``thresholdMin`` rather than ``selectivity``.
+    :rtype: :class:`pandas.DataFrame`
+
+    .. rubric:: Example
+
+    >>> from obspy import Trace, Stream, UTCDateTime
+    >>> data = np.tile([1., 2., 3., 2.], 25)
+    >>> data[[30, 31, 70]] = 500.
+    >>> tr = Trace(data, {'network': 'XX', 'station': 'TEST'})
+    >>> tr.stats.mseed = {'dataquality': 'M'}
+    >>> df = spikesMetric(Stream([tr]), UTCDateTime(0), UTCDateTime(100))
+    >>> list(zip(df.metricName, df.value))
+    [('num_spikes', '2')]
+    """
+    x = np.concatenate([np.asarray(tr.data, dtype=np.float64) for tr in st])
+
+    if len(x) < windowSize:
+        raise ValueError("spikesMetric: skipping %s trace length %d is less than windowSize %d" % (st[0].id, len(x), windowSize))
+
+    try:
+        outlierIndices = findOutliers(x, n=windowSize, thresholdMin=thresholdMin,
+                                      selectivity=selectivity, fixedThreshold=fixedThreshold)
+    except Exception as e:
+        raise ValueError("spikesMetric: skipping %s %s" % (st[0].id, e))
+
+    # NOTE:  Ignore adjacent outliers when determining the count of spikes.
+    # NOTE:  But be sure there is at least one spike if there is at least one outlier.
+    count = 0
+    if len(outlierIndices) != 0:
+        count = int(np.count_nonzero(np.diff(outlierIndices) > 1)) + 1
+
+    snclq = '.'.join([st[0].id, st[0].stats.mseed.dataquality])
+    return _metric_df(snclq, starttime, endtime, [('num_spikes', count)])
+
+
+def mergeTraces(st, starttime, endtime, fillMethod='fillNA'):
+    """
+    Samples of all traces in one array with NaN (``fillNA``) or zeros
+    (``fillZero``) in the gaps, as IRISSeismic::mergeTraces.
+
+    As in R, overlaps are also filled rather than removed.
+
+    :return: ``(data, sampling_rate, starttime, endtime)`` of the merged trace.
+    """
+    if fillMethod == 'fillNA':
+        fill_value = np.nan
+    elif fillMethod == 'fillZero':
+        fill_value = 0.0
+    else:
+        raise ValueError("mergeTraces.Stream: unknown fillMethod '%s'" % fillMethod)
+
+    _snclq(st, 'getGaps.Stream')
+    gaps = getGaps(st, starttime, endtime)
+    sampling_rates = np.array([tr.stats.sampling_rate for tr in st], dtype=np.float64)
+    gap_rates = np.concatenate((sampling_rates[:1], sampling_rates[:-1], sampling_rates[-1:]))
+    nsamples = np.round(np.abs(gaps) * gap_rates).astype(np.int64)
+    sampling_rate = sampling_rates[0]
+
+    # Return immediately if is only one trace with no initial or final gap
+    if nsamples.sum() == 0 and len(st) == 1:
+        return (np.asarray(st[0].data, dtype=np.float64), sampling_rate, st[0].stats.starttime, st[0].stats.endtime)
+
+    if np.ptp(sampling_rates) >= 0.0002:
+        raise ValueError("mergeTraces.Stream: %d unique sampling rates encountered in Stream." %
+                         len(np.unique(np.round(sampling_rates, 4))))
+
+    # Some data centers cut on record boundaries, so traces may extend beyond the requested times
+    totalStart = st[0].stats.starttime if nsamples[0] == 0 else starttime
+    totalEnd = st[-1].stats.endtime if nsamples[-1] == 0 else endtime
+    totalSecs = totalEnd.timestamp - totalStart.timestamp
+    totalPoints = int(np.round(totalSecs) * sampling_rate)
+
+    pieces = []
+    for (i, tr) in enumerate(st):
+        pieces.append(np.full(nsamples[i], fill_value))
+        pieces.append(np.asarray(tr.data, dtype=np.float64))
+    pieces.append(np.full(nsamples[-1], fill_value))
+    data = np.concatenate(pieces)
+
+    # Sanity check -- we hope to be within twice the sampling rate of a complete accounting
+    missing_points = totalPoints - len(data)
+    if missing_points > math.ceil(2 * sampling_rate):
+        raise ValueError("mergeTraces.Stream: %d unaccounted for points after merge" % missing_points)
+    elif missing_points < math.ceil(-2 * sampling_rate):
+        raise ValueError("mergeTraces.Stream: %d extra points after merge" % abs(missing_points))
+
+    # NOTE:  As in R, missing points are NaN whatever the fillMethod
+    if missing_points > 0:
+        data = np.concatenate((data, np.full(missing_points, np.nan)))
+    return (data[:totalPoints], sampling_rate, totalStart, totalEnd)
+
+
+def maxRangeMetric(st, starttime, endtime, window=300, increment=150):
+    """
+    Largest difference between the maximum and minimum sample of windows
+    stepping through the merged stream, as IRISMustangMetrics::maxRangeMetric.
+
+    Every window is ``window`` seconds long and starts ``increment`` seconds
+    after the previous one. Minima and maxima are taken once per block of
+    the greatest common divisor of both lengths and then combined per
+    window, so each sample is visited once.
+
+    :type st: :class:`obspy.core.stream.Stream`
+    :param st: Stream of a single SNCLQ.
+    :type starttime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Requested start time of the stream.
+    :type endtime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param endtime: Requested end time of the stream.
+    :param window: Window length in seconds.
+    :param increment: Distance between window starts in seconds.
+    :rtype: :class:`pandas.DataFrame`
+
+    .. rubric:: Example
+
+    >>> from obspy import Trace, Stream, UTCDateTime
+    >>> data = np.zeros(1000)
+    >>> data[[300, 320, 380]] = [5., -3., 2.]
+    >>> tr = Trace(data, {'network': 'XX', 'station': 'TEST'})
+    >>> tr.stats.mseed = {'dataquality': 'M'}
+    >>> df = maxRangeMetric(Stream([tr]), UTCDateTime(0), UTCDateTime(1000), window=50, increment=25)
+    >>> list(zip(df.metricName, df.value))
+    [('max_range', '8')]
+    """
+    snclq = '.'.join([st[0].id, st[0].stats.mseed.dataquality])
+    (data, sampling_rate, _, _) = mergeTraces(st, starttime, endtime)
+
+    # must have integer number of samples
+    n_samp = int(np.round(window * sampling_rate))
+    n_incr = int(np.round(increment * sampling_rate))
+    if n_incr < 1:
+        raise ValueError("increment must be >= 1.")
+
+    # last rolling segment needs to be length of window or it will be skipped, add NaNs as needed
+    modinc = len(data) % n_incr
+    padding = n_samp - n_incr if modinc == 0 else n_samp - modinc
+    if padding < 0:
+        raise ValueError("maxRangeMetric: window must not be shorter than the last increment")
+    data = np.concatenate((data, np.full(padding, np.nan)))
+
+    # Block minima and maxima, ignoring NaN
+    block = math.gcd(n_samp, n_incr)
+    blocks = data.reshape(-1, block)
+    block_min = np.fmin.reduce(blocks, axis=1)
+    block_max = np.fmax.reduce(blocks, axis=1)
+
+    # Combine the blocks of each window
+    step = n_incr // block
+    window_min = np.fmin.reduce(_sliding_windows(block_min, n_samp // block)[::step], axis=1)
+    window_max = np.fmax.reduce(_sliding_windows(block_max, n_samp // block)[::step], axis=1)
+    ranges = window_max - window_min
+
+    if np.all(np.isnan(ranges)):
+        maxRange = -np.inf
+    else:
+        maxRange = float(np.nanmax(ranges))
+
+    return _metric_df(snclq, starttime, endtime, [('max_range', maxRange)])
+
+
+# Native metric functions by IRISMustangMetrics metric function name
+METRIC_FUNCTIONS = {'basicStats': basicStatsMetric,
+                    'gaps': gapsMetric,
+                    'STALTA': STALTAMetric,
+                    'numSpikes': spikesMetric,
+                    'maxRange': maxRangeMetric}
+
+# Metrics that only need trace headers
+HEADONLY_METRICS = ('gaps',)
+
+
+def apply_simple_metric(r_stream, metric_function_name, *args, **kwargs):
+    """
+    Drop-in replacement for :func:`irismustangmetrics.apply_simple_metric`.
+
+    Metrics in ``METRIC_FUNCTIONS`` are calculated with NumPy on the samples
+    of the IRISSeismic Stream, all others are passed on to R.
+    """
+    # Imported here so that the metric functions can be used without R
+    from . import irisseismic
+    from . import irismustangmetrics
+
+    if metric_function_name not in METRIC_FUNCTIONS:
+        return irismustangmetrics.apply_simple_metric(r_stream, metric_function_name, *args, **kwargs)
+
+    headonly = metric_function_name in HEADONLY_METRICS
+    stream = irisseismic.py_Stream(r_stream, headonly=headonly)
+    return apply_py_metric(stream, metric_function_name, *args, **kwargs)
+
+
+def apply_py_metric(stream, metric_function_name, *args, **kwargs):
+    """
+    Calculates a metric in ``METRIC_FUNCTIONS`` on an ObsPy Stream, without R.
+
+    :param stream: ``(st, requestedStarttime, requestedEndtime)`` as returned
+        by :meth:`Concierge.get_py_dataselect` and
+        :func:`irisseismic.py_Stream`.
+    """
+    (st, starttime, endtime) = stream
+    return METRIC_FUNCTIONS[metric_function_name](st, starttime, endtime, *args, **kwargs)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(exclude_empty=True)
@@ -0,0 +1,645 @@
+"""
+NumPy implementation of IRISMustangMetrics::PSDMetric.
+
+PSDs are calculated with the McNamara and Buland method as in IRISSeismic:
+the day is cut into overlapping segments, every segment is averaged over
+13 overlapping sub-segments and the averaged periodograms are smoothed in
+1/8 octave bins before the instrument response is removed.
+
+All sub-segments of all segments are detrended, tapered and transformed
+together as the rows of a 2-D array, so a day of data needs a few calls to
+``numpy.fft.rfft`` instead of one R ``spec.pgram()`` call per sub-segment.
+
+The ``psd_engine`` preference selects this module (``native``) or the R
+package (``R``) in PSD_metrics.py.
+
+:copyright:
+    Mazama Science
+:license:
+    GNU Lesser General Public License, Version 3
+    (http://www.gnu.org/copyleft/lesser.html)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+from obspy import UTCDateTime
+
+from .native_metrics import mergeTraces, _metric_df
+
+
+# Maximum number of samples transformed in one call to rfft
+_FFT_BATCH_SAMPLES = 2**24
+
+# Peterson (1993) noise models as (minPeriod, A, B), see IRISSeismic::noiseModels
+_NLNM = np.array([
+    [0.10, -162.36, 5.64],
+    [0.17, -166.70, 0.00],
+    [0.40, -170.00, -8.30],
+    [0.80, -166.40, 28.90],
+    [1.24, -168.60, 52.48],
+    [2.40, -159.98, 29.81],
+    [4.30, -141.10, 0.00],
+    [5.00, -71.36, -99.77],
+    [6.00, -97.26, -66.49],
+    [10.00, -132.18, -31.57],
+    [12.00, -205.27, 36.16],
+    [15.60, -37.65, -104.33],
+    [21.90, -114.37, -47.10],
+    [31.60, -160.58, -16.28],
+    [45.00, -187.50, 0.00],
+    [70.00, -216.47, 15.70],
+    [101.00, -185.00, 0.00],
+    [154.00, -168.34, -7.61],
+    [328.00, -217.43, 11.90],
+    [600.00, -258.28, 26.60],
+    [10000.00, -346.88, 48.75],
+    [100000.00, -346.88, 48.75]])
+
+_NHNM = np.array([
+    [0.10, -108.73, -17.23],
+    [0.22, -150.34, -80.50],
+    [0.32, -122.31, -23.87],
+    [0.80, -116.85, 32.51],
+    [3.80, -108.48, 18.08],
+    [4.60, -74.66, -32.95],
+    [6.30, 0.66, -127.18],
+    [7.90, -93.37, -22.42],
+    [15.40, 73.54, -162.98],
+    [20.00, -151.52, 10.01],
+    [354.80, -206.66, 31.63],
+    [100000, -206.66, 31.63]])
+
+
+#     Helper functions     ----------------------------------------------------
+
+
+def _seq(start, end, by):
+    """
+    R's ``seq(start, end, by)``.
+    """
+    n = int(math.floor((end - start) / by + 1e-10))
+    x = start + np.arange(n + 1) * by
+    return np.minimum(x, end) if by > 0 else np.maximum(x, end)
+
+
+def _psd_parameters(channel):
+    """
+    Segment length in seconds, lowest frequency and alignment frequency of
+    the PSDs of a channel, as chosen by IRISSeismic::psdList.
+    """
+    if channel.startswith('V'):
+        return (24 * 3600, 0.0001, 0.025)
+    elif channel.startswith('L'):
+        return (3 * 3600, 0.001, 0.1)
+    elif channel.startswith('M'):
+        return (2 * 3600, 0.0025, 0.1)
+    else:
+        return (3600, 0.005, 0.1)
+
+
+def _slice_indexes(npts, sampling_rate, trace_start, trace_end, starttime, endtime):
+    """
+    First and last+1 sample and the start and end time of a slice, as
+    IRISSeismic::slice.Trace. Times are epoch seconds.
+    """
+    start_index = 0
+    stop_index = npts
+    if starttime > trace_start:
+        offset_secs = round(starttime - trace_start, 6)
+        start_index += int(math.floor(offset_secs * sampling_rate))
+        trace_start = trace_start + offset_secs
+    if endtime < trace_end:
+        offset_secs = round(trace_end - endtime, 6)
+        stop_index -= int(math.floor(offset_secs * sampling_rate))
+        trace_end = trace_end - offset_secs
+    return (start_index, stop_index, trace_start, trace_end)
+
+
+def _split_cosine_bell(n, p=0.1):
+    """
+    Taper applied by R's ``spec.taper()``.
+    """
+    m = int(math.floor(n * p))
+    window = np.ones(n)
+    if m > 0:
+        w = 0.5 * (1 - np.cos(np.pi * np.arange(1, 2 * m, 2) / (2 * m)))
+        window[:m] = w
+        window[n - m:] = w[::-1]
+    return window
+
+
+def _periodograms(rows, sampling_rate, taper=0.1):
+    """
+    One-sided periodograms of the rows of a 2-D array, as
+    ``2 * spec.pgram(..., taper=0.1, fast=TRUE, demean=TRUE, detrend=TRUE)$spec``.
+
+    As in ``spec.pgram``, power is divided by ``u2 = 1 - (5/8)*taper*2`` to
+    correct for the power removed by the taper.
+
+    :return: ``(freq, spec)`` without the zero frequency.
+    """
+    N = rows.shape[1]
+    u2 = 1 - (5 / 8) * taper * 2
+
+    # Remove the linear trend of every row
+    t = np.arange(1, N + 1) - (N + 1) / 2
+    sumt2 = N * (N**2 - 1) / 12
+    x = rows - rows.mean(axis=1)[:, np.newaxis]
+    x -= np.outer(rows.dot(t), t) / sumt2
+    x *= _split_cosine_bell(N, taper)
+
+    xfft = np.fft.rfft(x, axis=1)
+    Nspec = N // 2
+    pgram = (xfft.real[:, 1:Nspec + 1]**2 + xfft.imag[:, 1:Nspec + 1]**2) / (N * sampling_rate * u2)
+    freq = sampling_rate / N + np.arange(Nspec) * (sampling_rate / N)
+    return (freq, 2 * pgram)
+
+
+def McNamaraBins(freq, spec, loFreq=0.005, hiFreq=10, alignFreq=0.1):
+    """
+    Averages of the spectra in overlapping 1/8 octave bins, as IRISSeismic::McNamaraBins.
+
+    :param freq: Frequencies of the spectra, ascending.
+    :param spec: 2-D array with one spectrum per row.
+    :return: ``(binFreq, binnedSpec)``
+
+    .. rubric:: Example
+
+    >>> freq = np.linspace(0.001, 0.5, 5000)
+    >>> (binFreq, binned) = McNamaraBins(freq, np.ones((1, 5000)), 0.01, 0.5)
+    >>> len(binFreq), float(binFreq[0].round(5)), bool(np.all(binned == 1))
+    (45, 0.01051, True)
+    """
+    if alignFreq >= hiFreq:
+        octaves = _seq(math.log2(alignFreq), math.log2(loFreq), -0.125)
+        octaves = octaves[octaves <= math.log2(hiFreq)]
+    else:
+        loOctaves = _seq(math.log2(alignFreq), math.log2(loFreq), -0.125)
+        hiOctaves = _seq(math.log2(alignFreq), math.log2(hiFreq), 0.125)
+        octaves = np.unique(np.concatenate((loOctaves, hiOctaves)))
+    binFreq = np.sort(2**octaves)
+
+    # Bin number of every frequency, as .bincode(freq, c(0, binFreq, halfOctaveAbove)) - 1
+    halfOctaveAbove = 2**(math.log2(hiFreq) + 0.5)
+    breaks = np.concatenate(([0], binFreq, [halfOctaveAbove]))
+    codes = np.searchsorted(breaks, freq, side='left')
+    valid = (codes >= 1) & (codes <= len(breaks) - 1)
+    if not np.any(valid):
+        return (binFreq, np.full((spec.shape[0], len(binFreq)), np.nan))
+    bins = codes[valid] - 1
+    spec = spec[:, valid]
+
+    # Sums and counts of every bin
+    maxBin = bins.max()
+    edges = np.searchsorted(bins, np.arange(maxBin + 2), side='left')
+    counts = np.diff(edges)
+    nonempty = counts > 0
+    binSums = np.zeros((spec.shape[0], maxBin + 1), dtype=np.longdouble)
+    binSums[:, nonempty] = np.add.reduceat(spec.astype(np.longdouble), edges[:-1][nonempty], axis=1)
+
+    # Each 1/8 octave bin averages the frequencies from 4 bins below to 3 bins above
+    binned = np.empty((spec.shape[0], len(binFreq)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i in range(1, len(binFreq) + 1):
+            loBin = max(1, i - 4)
+            hiBin = min(i + 3, maxBin)
+            (loBin, hiBin) = (min(loBin, hiBin), max(loBin, hiBin))
+            binned[:, i - 1] = (binSums[:, loBin:hiBin + 1].sum(axis=1) / counts[loBin:hiBin + 1].sum()).astype(np.float64)
+    return (binFreq, binned)
+
+
+def noiseModels(freq):
+    """
+    Peterson new low and high noise models in dB, as IRISSeismic::noiseModels.
+
+    :return: ``(nlnm, nhnm)`` with NaN outside of the models.
+
+    .. rubric:: Example
+
+    >>> (nlnm, nhnm) = noiseModels(np.array([1.0, 0.1]))
+    >>> nlnm.round(2).tolist(), nhnm.round(2).tolist()
+    ([-166.4, -163.75], [-116.85, -115.79])
+    """
+    period = 1 / np.asarray(freq, dtype=np.float64)
+    models = []
+    for table in (_NLNM, _NHNM):
+        breaks = table[:, 0]
+        rows = np.searchsorted(breaks, period, side='right') - 1
+        rows[period == breaks[-1]] = len(breaks) - 2
+        valid = (period >= breaks[0]) & (period <= breaks[-1])
+        rows = np.where(valid, rows, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            model = table[rows, 1] + table[rows, 2] * np.log10(period)
+        models.append(np.where(valid, model, np.nan))
+    return tuple(models)
+
+
+#     PSD functions     -------------------------------------------------------
+
+
+def _psd_segments(st, merged):
+    """
+    Sub-segment matrices of the PSD segments of a stream, as cut by
+    IRISSeismic::psdList and IRISSeismic::McNamaraPSD.
+
+    :param merged: ``mergeTraces(st, starttime, endtime, fillMethod='fillZero')``
+    :return: dict with the ``snclq``, the spectrum ``key`` shared by streams
+        whose segments can be transformed together and a list of
+        ``(rows, starttime, endtime)`` with the 13 sub-segments of every
+        segment as the rows of a 2-D array. The rows are views of the merged
+        samples.
+    """
+    (data, sampling_rate, trace_start, trace_end) = merged
+    # very occasionally a trace will contain NaN values from the original miniSEED
+    missing = np.isnan(data)
+    if missing.any():
+        data = np.where(missing, 0.0, data)
+
+    channel = st[0].stats.channel
+    (Z, loFreq, alignFreq) = _psd_parameters(channel)
+    hiFreq = 0.5 * sampling_rate
+
+    # R's ts() rounds frequencies within 1e-5 of an integer
+    ts_frequency = round(sampling_rate) if abs(sampling_rate - round(sampling_rate)) < 1e-5 else sampling_rate
+
+    # Segments of Z seconds overlapping by 50%
+    trace_start = trace_start.timestamp
+    trace_end = trace_end.timestamp
+    segments = []
+    start = trace_start
+    end = start + Z
+    while trace_end - start >= 0.99 * Z:
+        (first, last, seg_start, seg_end) = _slice_indexes(len(data), sampling_rate, trace_start, trace_end, start, end)
+        segment = data[first:last]
+        # Skip flatlined segments
+        if len(segment) > 0 and not np.all(segment == segment[0]):
+            # 13 sub-segments of a quarter of the largest power of 2 length, overlapping by 75%
+            truncatedLength = 2**(len(segment).bit_length() - 1)
+            N = truncatedLength // 4
+            step = truncatedLength // 16
+            rows = np.lib.stride_tricks.as_strided(segment, shape=(13, N),
+                                                   strides=(step * segment.strides[0], segment.strides[0]),
+                                                   writeable=False)
+            segments.append((rows, seg_start, seg_end))
+        start = start + Z / 2
+        end = end + Z / 2
+
+    return {'snclq': '.'.join([st[0].id, st[0].stats.mseed.dataquality]),
+            'key': (ts_frequency, loFreq, hiFreq, alignFreq),
+            'segments': segments}
+
+
+def _binned_psds(segmentLists):
+    """
+    Binned McNamara PSDs in dB of the segments of several streams.
+
+    Segments with the same length and spectrum key are transformed together,
+    whichever stream they belong to, in batches of at most
+    ``_FFT_BATCH_SAMPLES`` samples.
+
+    :param segmentLists: list of :func:`_psd_segments` results.
+    :return: list with the binned frequencies and a list of PSDs for every stream.
+    """
+    groups = {}
+    for (i, segmentList) in enumerate(segmentLists):
+        for (j, (rows, _, _)) in enumerate(segmentList['segments']):
+            groups.setdefault((rows.shape[1],) + segmentList['key'], []).append((i, j, rows))
+
+    results = [[None, [None] * len(segmentList['segments'])] for segmentList in segmentLists]
+    for ((N, ts_frequency, loFreq, hiFreq, alignFreq), group) in groups.items():
+        batch = max(1, _FFT_BATCH_SAMPLES // (13 * N))
+        for b in range(0, len(group), batch):
+            members = group[b:b + batch]
+            rows = np.concatenate([rows for (_, _, rows) in members])
+            (pgram_freq, pgram) = _periodograms(rows, ts_frequency)
+            spec = pgram.reshape(len(members), 13, -1).sum(axis=1) / 13
+            (freq, binned) = McNamaraBins(pgram_freq, spec, loFreq, hiFreq, alignFreq)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                binned = 10 * np.log10(binned)
+            for ((i, j, _), psd) in zip(members, binned):
+                results[i][0] = freq
+                results[i][1][j] = psd
+    return results
+
+
+def _psd_list(segmentList, freq, psds):
+    """
+    :func:`psdList` result from the segments of a stream and their PSDs.
+    """
+    segments = segmentList['segments']
+    # PSDs of segments containing zero power are dropped
+    keep = [i for (i, psd) in enumerate(psds) if not np.any(np.isneginf(psd))]
+    if freq is None or len(keep) == 0:
+        spec = np.empty((0, 0))
+    else:
+        spec = np.array([psds[i] for i in keep])
+    return {'freq': freq,
+            'spec': spec,
+            'starttime': [UTCDateTime(segments[i][1]) for i in keep],
+            'endtime': [UTCDateTime(segments[i][2]) for i in keep],
+            'snclq': segmentList['snclq']}
+
+
+def psdLists(streams):
+    """
+    :func:`psdList` of several streams, transforming the segments of all
+    streams that share a sampling rate and band code together.
+
+    :param streams: list of ``(st, starttime, endtime)``.
+    :return: list of :func:`psdList` results.
+    """
+    segmentLists = [_psd_segments(st, mergeTraces(st, starttime, endtime, fillMethod='fillZero'))
+                    for (st, starttime, endtime) in streams]
+    return [_psd_list(segmentList, freq, psds)
+            for (segmentList, (freq, psds)) in zip(segmentLists, _binned_psds(segmentLists))]
+
+
+def psdList(st, starttime, endtime):
+    """
+    McNamara PSDs of overlapping segments of a stream, as IRISSeismic::psdList.
+
+    :type st: :class:`obspy.core.stream.Stream`
+    :param st: Stream of a single SNCLQ.
+    :type starttime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Requested start time of the stream.
+    :type endtime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param endtime: Requested end time of the stream.
+    :rtype: dict
+    :return: ``freq`` (binned frequencies), ``spec`` (2-D array of PSDs in
+        dB, one row per segment), ``starttime`` and ``endtime`` (lists of
+        :class:`~obspy.core.utcdatetime.UTCDateTime`) and ``snclq``.
+    """
+    return psdLists([(st, starttime, endtime)])[0]
+
+
+def psdStatistics(psds, evalresp):
+    """
+    Response corrected PSDs and their statistics, as IRISSeismic::psdStatistics.
+
+    :param psds: :func:`psdList` result.
+    :type evalresp: :class:`pandas.DataFrame`
+    :param evalresp: Acceleration response amplitudes at the PSD frequencies,
+        with columns ``freq`` and ``amp``.
+    :rtype: dict
+    """
+    if not ('amp' in evalresp.columns and 'freq' in evalresp.columns):
+        raise ValueError("error evalresp dataframe does not have columns named 'amp' and 'freq'")
+    if len(evalresp) == 0:
+        raise ValueError("getEvalresp returned no content")
+
+    rawNoiseMatrix = psds['spec']
+    if rawNoiseMatrix.shape[1] != len(evalresp['freq']):
+        raise ValueError("psdList2NoiseMatrix: length(evalresp$freq) = %d and ncol(rawNoiseMatrix) = %d are not equal." %
+                         (len(evalresp['freq']), rawNoiseMatrix.shape[1]))
+
+    correction = 10 * np.log10(np.asarray(evalresp['amp'], dtype=np.float64)) * 2
+    noiseMatrix = rawNoiseMatrix - correction
+
+    freq = psds['freq']
+    (nrow, ncol) = noiseMatrix.shape
+    (nlnm, nhnm) = noiseModels(freq)
+
+    # Percent of PSDs above the high and below the low noise model
+    notNA = ~np.isnan(noiseMatrix[0]) & ~np.isnan(nlnm)
+    with np.errstate(invalid='ignore'):
+        aboveCount = np.where(notNA, (noiseMatrix > nhnm).sum(axis=0), np.nan)
+        belowCount = np.where(notNA, (noiseMatrix < nlnm).sum(axis=0), np.nan)
+
+    # Histogram of the PSDs at every frequency, in 1 dB bins
+    columns = noiseMatrix[:, ~np.isnan(noiseMatrix[0])]
+    lo = int(math.floor(columns.min()))
+    hi = int(math.ceil(columns.max()))
+    pdfBins = np.arange(lo, hi + 1)
+    # .bincode(x, seq(lo - 0.5, hi + 0.5, 1), include.lowest=TRUE)
+    breaks = (lo - 0.5) + np.arange(len(pdfBins) + 1)
+    codes = np.searchsorted(breaks, noiseMatrix, side='left') - 1
+    codes[noiseMatrix == breaks[0]] = 0
+    valid = (codes >= 0) & (codes < len(pdfBins)) & ~np.isnan(noiseMatrix)
+    pdfMatrix = np.zeros((len(pdfBins), ncol), dtype=np.int64)
+    np.add.at(pdfMatrix, (codes[valid], np.nonzero(valid)[1]), 1)
+
+    return {'noiseMatrix': noiseMatrix,
+            'pdfMatrix': pdfMatrix,
+            'freq': freq,
+            'pdfBins': pdfBins,
+            'mean': noiseMatrix.mean(axis=0),
+            'nlnm': nlnm,
+            'nhnm': nhnm,
+            'pct_above': 100 * aboveCount / nrow,
+            'pct_below': 100 * belowCount / nrow}
+
+
+def _getEvalresp(psds):
+    """
+    Acceleration response at the PSD frequencies from the IRIS evalresp web
+    service, as requested by IRISSeismic::psdList2NoiseMatrix.
+    """
+    # Imported here so that PSDs can be calculated without R
+    from . import irisseismic
+
+    (network, station, location, channel, _) = psds['snclq'].split('.')
+    return irisseismic.getEvalresp(network=network, station=station, location=location, channel=channel,
+                                   time=psds['starttime'][0] + 1, minfreq=float(psds['freq'].min()),
+                                   maxfreq=float(psds['freq'].max()), nfreq=len(psds['freq']), units='acc')
+
+
+def _column_range(period, first_period, last_period):
+    """
+    Indexes between the last period at or above ``first_period`` and the first
+    at or below ``last_period``, exclusive, as R's ``first:last`` in PSDMetric.
+    """
+    first = np.flatnonzero(period >= first_period).max() + 1
+    last = np.flatnonzero(period <= last_period).min() - 1
+    return np.arange(min(first, last), max(first, last) + 1)
+
+
+def _check_stream(st, starttime, endtime):
+    """
+    Errors raised by IRISMustangMetrics::PSDMetric before any PSD is calculated.
+
+    :return: ``mergeTraces(st, starttime, endtime, fillMethod='fillZero')``
+    """
+    if sum(len(tr.data) for tr in st) == 1:
+        raise ValueError("PSDMetric: stopping PSD calculation because st length is one sample")
+
+    merged = mergeTraces(st, starttime, endtime, fillMethod='fillZero')
+    data = merged[0]
+    valid = data[~np.isnan(data)] if np.isnan(data).any() else data
+    if np.all(valid == valid[0]):
+        raise ValueError("PSDMetric: stopping PSD calculation because st is flatlined")
+    return merged
+
+
+def PSDMetric(st, starttime, endtime, evalresp=None, linLoPeriod=None, linHiPeriod=100):
+    """
+    PSD derived metrics, corrected PSDs and PDF of a stream, as
+    IRISMustangMetrics::PSDMetric.
+
+    :type st: :class:`obspy.core.stream.Stream`
+    :param st: Stream of a single SNCLQ.
+    :type starttime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Requested start time of the stream.
+    :type endtime: :class:`~obspy.core.utcdatetime.UTCDateTime`
+    :param endtime: Requested end time of the stream.
+    :type evalresp: :class:`pandas.DataFrame`
+    :param evalresp: Acceleration response at the PSD frequencies. The IRIS
+        evalresp web service is used if this is ``None``.
+    :param linLoPeriod: Shortest period of the dead_channel_lin fit,
+        default 4 sample intervals.
+    :param linHiPeriod: Longest period of the dead_channel_lin fit.
+    :return: tuple of GeneralValueMetrics, corrected PSD, and PDF dataframes,
+        as :func:`irismustangmetrics.apply_PSD_metric`.
+    """
+    merged = _check_stream(st, starttime, endtime)
+    segmentList = _psd_segments(st, merged)
+    ((freq, psds),) = _binned_psds([segmentList])
+    return _psd_metric(st, _psd_list(segmentList, freq, psds), evalresp, linLoPeriod, linHiPeriod)
+
+
+def PSDMetrics(streams, evalresps=None, linHiPeriod=100):
+    """
+    :func:`PSDMetric` of several streams, transforming the segments of all
+    streams that share a sampling rate and band code together.
+
+    An error for one stream does not stop the others, it is returned in
+    place of that stream's result.
+
+    :param streams: list of ``(st, starttime, endtime)``.
+    :param evalresps: list with the evalresp dataframe or ``None`` for every stream.
+    :param linHiPeriod: Longest period of the dead_channel_lin fit.
+    :return: list with the :func:`PSDMetric` result or the exception raised
+        for every stream.
+    """
+    if evalresps is None:
+        evalresps = [None] * len(streams)
+
+    results = [None] * len(streams)
+    segmentLists = []
+    for (i, (st, starttime, endtime)) in enumerate(streams):
+        try:
+            segmentLists.append((i, _psd_segments(st, _check_stream(st, starttime, endtime))))
+        except Exception as e:
+            results[i] = e
+
+    binned = _binned_psds([segmentList for (_, segmentList) in segmentLists])
+    for ((i, segmentList), (freq, psds)) in zip(segmentLists, binned):
+        try:
+            results[i] = _psd_metric(streams[i][0], _psd_list(segmentList, freq, psds), evalresps[i], None, linHiPeriod)
+        except Exception as e:
+            results[i] = e
+    return results
+
+
+def _psd_metric(st, psds, evalresp, linLoPeriod, linHiPeriod):
+    """
+    :func:`PSDMetric` result from the :func:`psdList` result of a stream.
+    """
+    sampling_rate = st[0].stats.sampling_rate
+    if linLoPeriod is None:
+        linLoPeriod = 4 / sampling_rate
+
+    if len(psds['spec']) == 0:
+        raise ValueError("PSDMetric: No PSDs returned for %s" % psds['snclq'])
+    snclq = psds['snclq']
+
+    if evalresp is None:
+        evalresp = _getEvalresp(psds)
+
+    try:
+        psdStats = psdStatistics(psds, evalresp)
+    except Exception as e:
+        raise ValueError("PSDMetrics: %s %s" % (str(e).replace('\r', '').replace('\n', ''), snclq))
+
+    freq = psdStats['freq']
+    period = 1 / freq
+    nyquist = sampling_rate / 2
+    with np.errstate(invalid='ignore'):
+        avg_pct_above = np.nanmean(psdStats['pct_above'][freq < nyquist / 1.5])
+        avg_pct_below = np.nanmean(psdStats['pct_below'][freq < nyquist / 1.5])
+
+    # Standard deviation of the residuals of a linear fit of the mean PSD against log10(period)
+    columns = _column_range(period, linHiPeriod, linLoPeriod)
+    psdMean = psdStats['mean'][columns]
+    logPeriod = np.log10(period[columns])
+    fitted = ~np.isnan(psdMean)
+    coefficients = np.polyfit(logPeriod[fitted], psdMean[fitted], 1)
+    residuals = psdMean[fitted] - np.polyval(coefficients, logPeriod[fitted])
+    dead_channel_lin = float(np.std(residuals, ddof=1))
+
+    # Median PSD between 4 and 8 seconds more than 5 dB below the NLNM
+    dead_channel_gsn = None
+    if sampling_rate > 0.999:
+        columns = _column_range(period, 4, 8)
+        psdMedian = np.median(psdStats['noiseMatrix'][:, columns], axis=0)
+        averageDiff = np.mean(psdStats['nlnm'][columns] - psdMedian)
+        if not np.isnan(averageDiff):
+            dead_channel_gsn = 1.0 if averageDiff > 5.0 else 0.0
+
+    channel = st[0].stats.channel
+    values = [('pct_above_nhnm', avg_pct_above),
+              ('pct_below_nlnm', avg_pct_below)]
+    if re.search('BH|HH|CH|DH|FH|BX|HX', channel):
+        values.append(('dead_channel_lin', dead_channel_lin))
+    if dead_channel_gsn is not None and re.search('BH|HH|CH|DH|FH|LH|MH|BX|HX', channel):
+        values.append(('dead_channel_gsn', dead_channel_gsn))
+    df = _metric_df(snclq, st[0].stats.starttime, st[-1].stats.endtime, values)
+
+    # Corrected PSDs, one row per PSD and frequency
+    noiseMatrix = psdStats['noiseMatrix']
+    (nrow, ncol) = noiseMatrix.shape
+    PSDCorrected = pd.DataFrame({'starttime': np.repeat(np.array(psds['starttime'], dtype=object), ncol),
+                                 'endtime': np.repeat(np.array(psds['endtime'], dtype=object), ncol),
+                                 'freq': np.tile(freq, nrow),
+                                 'power': noiseMatrix.ravel()},
+                                columns=['starttime', 'endtime', 'freq', 'power'])
+
+    # PDF hit counts, one row per frequency and power with hits
+    pdfMatrix = psdStats['pdfMatrix']
+    PDF = pd.DataFrame({'freq': np.repeat(freq, pdfMatrix.shape[0]),
+                        'power': np.tile(psdStats['pdfBins'], pdfMatrix.shape[1]),
+                        'hits': pdfMatrix.T.ravel()},
+                       columns=['freq', 'power', 'hits'])
+    PDF = PDF[PDF.hits > 0].reset_index(drop=True)
+
+    return (df, PSDCorrected, PDF)
+
+
+def apply_PSD_metric(r_stream, *args, **kwargs):
+    """
+    Drop-in replacement for :func:`irismustangmetrics.apply_PSD_metric`.
+
+    :param r_stream: IRISSeismic Stream object.
+    :param (optional kwarg) evalresp= pandas dataframe of FAP from evalresp (freq,amp,phase)
+    :return: tuple of GeneralValueMetrics, corrected PSD, and PDF
+    """
+    # Imported here so that PSDs can be calculated without R
+    from . import irisseismic
+
+    (st, starttime, endtime) = irisseismic.py_Stream(r_stream)
+    return PSDMetric(st, starttime, endtime, *args, **kwargs)
+
+
+def apply_PSD_metrics(r_streams, evalresps=None):
+    """
+    :func:`apply_PSD_metric` of several IRISSeismic Stream objects, see :func:`PSDMetrics`.
+
+    :param r_streams: list of IRISSeismic Stream objects.
+    :param evalresps: list with the evalresp dataframe or ``None`` for every stream.
+    :return: list with the tuple of GeneralValueMetrics, corrected PSD, and
+        PDF or the exception raised for every stream.
+    """
+    # Imported here so that PSDs can be calculated without R
+    from . import irisseismic
+
+    return PSDMetrics([irisseismic.py_Stream(r_stream) for r_stream in r_streams], evalresps)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(exclude_empty=True)
@@ -16,13 +16,13 @@ import pandas as pd
 from .concierge import NoAvailableDataError
 
 from . import utils
+from . import geodetics
 from . import irisseismic
 from . import irismustangmetrics
 
 from obspy import UTCDateTime
 from rpy2.robjects import pandas2ri
 import rpy2.robjects as ro
-from rpy2.robjects import numpy2ri
 
 
 def orientationCheck_metrics(concierge):
@@ -157,6 +157,13 @@ def orientationCheck_metrics(concierge):
         # Add sn_lId to the availability dataframe for easy detection
         availability.insert(availability.shape[1],'sn_lId',sn_lIds)
 
+        # Back azimuths and surface distances from the event to all stations in one pass
+        eventDistaz = geodetics.distaz(event.latitude, event.longitude, availability.latitude, availability.longitude)
+        eventBackAzimuth = pd.Series(eventDistaz[2], index=availability.index)
+        eventSurfaceDistance = pd.Series(geodetics.surface_distance(event.latitude, event.longitude,
+                                                                    availability.latitude, availability.longitude),
+                                         index=availability.index)
+
         # ----- All available SNCLs -------------------------------------------------
 
         for idx, sn_lId in enumerate(sorted(list(set(sn_lIds)))):
@@ -184,13 +191,9 @@ def orientationCheck_metrics(concierge):
             ZChannel = sn_lAvailability[Z_mask].iloc[0]
     
             # Calculate various distances and surface travel time
-            numpy2ri.activate()
-#             pandas2ri.activate()
-            distaz = irisseismic.getDistaz(event.latitude,event.longitude,ZChannel.latitude,ZChannel.longitude)
-            surfaceDistance = irisseismic.surfaceDistance(event.latitude,event.longitude,ZChannel.latitude,ZChannel.longitude)[0]
+            backAzimuth = eventBackAzimuth[ZChannel.name]
+            surfaceDistance = eventSurfaceDistance[ZChannel.name]
             surfaceTravelTime = surfaceDistance / 4.0 # km  / (km/sec)
-#             pandas2ri.deactivate()
-            numpy2ri.deactivate()
             
 
             # Get the data -----------------------------------------
@@ -345,11 +348,11 @@ def orientationCheck_metrics(concierge):
             # max_C_zr
             # magnitude
 
-            azimuth_Y_obs = (float(distaz.backAzimuth) - azimuth_R) % 360
+            azimuth_Y_obs = (float(backAzimuth) - azimuth_R) % 360
             azimuth_X_obs = (azimuth_Y_obs + 90.0) % 360
 
             elementNames = ["azimuth_R","backAzimuth","azimuth_Y_obs","azimuth_X_obs","azimuth_Y_meta","azimuth_X_meta","max_Czr","max_C_zr","magnitude"]
-            elementValues = [azimuth_R, float(distaz.backAzimuth), azimuth_Y_obs, azimuth_X_obs,
+            elementValues = [azimuth_R, float(backAzimuth), azimuth_Y_obs, azimuth_X_obs,
                                float(Channel_1.azimuth), float(Channel_2.azimuth), maxCzr, maxC_zr, float(event.magnitude)]
 
             # Create metric
@@ -0,0 +1,145 @@
+"""
+Background reading of waveforms for the ISPAQ Concierge.
+
+Metric modules read one channel at a time and run R metrics on it before
+reading the next.  The Prefetcher reads the next few planned windows on a
+small thread pool while the main thread is busy with R, which must only be
+called from the main thread.
+
+:copyright:
+    Mazama Science
+:license:
+    GNU Lesser General Public License, Version 3
+    (http://www.gnu.org/copyleft/lesser.html)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher(object):
+    """
+    Runs planned read tasks ahead of their use on a bounded thread pool.
+
+    Tasks are expected to be taken in the order they were planned. Taking a
+    task drops any earlier task that was never taken, so that skipped
+    windows do not hold on to memory.
+
+    :type depth: int
+    :param depth: Maximum number of tasks read ahead; 0 disables prefetching.
+    :type max_bytes: int
+    :param max_bytes: Reading ahead pauses while finished results that have
+        not been taken hold more than this many bytes.
+    :type size: callable
+    :param size: Returns the size in bytes of a task result.
+    :type workers: int
+    :param workers: Number of threads, by default ``min(depth, 4)``.
+
+    .. rubric:: Example
+
+    >>> prefetcher = Prefetcher(2, 100, size=len)
+    >>> prefetcher.schedule([(n, str.upper, (s,)) for n, s in enumerate(['a', 'b', 'c'])])
+    >>> prefetcher.take(0), prefetcher.take(2), prefetcher.take(1)
+    ('A', 'C', None)
+    >>> prefetcher.shutdown()
+    """
+    def __init__(self, depth, max_bytes, size=None, workers=None, logger=None):
+        self.depth = int(depth)
+        self.max_bytes = max_bytes
+        self.size = size
+        self.workers = workers if workers is not None else min(self.depth, 4)
+        self.logger = logger
+        self._executor = None
+        self._planned = OrderedDict()
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def schedule(self, tasks):
+        """
+        Replaces the planned tasks and starts reading ahead.
+
+        :type tasks: list
+        :param tasks: ``(key, function, args)`` tuples; ``function(*args)``
+            must not call R.
+        """
+        if self.depth <= 0:
+            return
+        with self._lock:
+            self._cancel()
+            for (key, function, args) in tasks:
+                if key not in self._planned:
+                    self._planned[key] = (function, args)
+        self._fill()
+
+    def take(self, key):
+        """
+        Returns the result of the task planned for ``key``, waiting for it
+        if needed, or ``None`` if the task was not read ahead or failed.
+        """
+        with self._lock:
+            # Drop tasks planned before this one that were never taken
+            if key in self._futures:
+                self._drop_before(self._futures, key)
+            elif key in self._planned:
+                self._drop_before(self._futures, None)
+                self._drop_before(self._planned, key)
+                del self._planned[key]
+            future = self._futures.pop(key, None)
+
+        result = None
+        if future is not None:
+            try:
+                result = future.result()
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.debug("Prefetch of %s failed: %s" % (str(key), e))
+        self._fill()
+        return result
+
+    def shutdown(self):
+        """
+        Cancels planned tasks, drops results that were not taken and stops
+        the thread pool. A new pool is started if tasks are scheduled again,
+        so this is called when each metric group finishes.
+        """
+        with self._lock:
+            self._cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _cancel(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._planned.clear()
+
+    def _drop_before(self, tasks, key):
+        while len(tasks) > 0 and next(iter(tasks)) != key:
+            stale_key, stale = tasks.popitem(last=False)
+            if hasattr(stale, 'cancel'):
+                stale.cancel()
+
+    def _ready_bytes(self):
+        total = 0
+        for future in self._futures.values():
+            if future.done() and not future.cancelled() and future.exception() is None:
+                total += self.size(future.result()) if self.size is not None else 0
+        return total
+
+    def _fill(self):
+        with self._lock:
+            while (len(self._planned) > 0 and len(self._futures) < self.depth and
+                   self._ready_bytes() < self.max_bytes):
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=max(self.workers, 1))
+                key, (function, args) = self._planned.popitem(last=False)
+                self._futures[key] = self._executor.submit(function, *args)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(exclude_empty=True)
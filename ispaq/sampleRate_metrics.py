@@ -90,6 +90,10 @@ def sampleRate_metrics(concierge):
 
         # Apply the channelFilter and drop multiple metadata epochs
         availability = availability[availability.channel.str.contains(channelFilter)].drop_duplicates(['snclId'])
+
+        # Request this day's waveforms together where the data source supports it
+        concierge.prefetch_dataselect([(av.network, av.station, av.location, av.channel, starttime, endtime)
+                                       for av in availability.itertuples()])
         # Loop over rows of the availability dataframe
         logger.info('Calculating sampleRate values for %d SNCLs on %s' % (availability.shape[0],str(starttime).split('T')[0]))
 
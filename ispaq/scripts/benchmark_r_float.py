@@ -0,0 +1,54 @@
+# Benchmark of the numpy --> R conversion used for trace data
+#
+# Compares the element by element FloatVector() copy with the single copy
+# done by irisseismic.R_float() and checks that both give identical R vectors.
+# The same comparison is made for irisseismic.R_Stream() on a day of local
+# miniSEED data, which is what the Concierge calls for every SNCL.
+#
+# Run from the top-level ispaq directory:
+#
+#   python -m ispaq.scripts.benchmark_r_float [miniSEED file]
+
+from __future__ import (absolute_import, division, print_function)
+
+import sys
+import timeit
+
+import numpy as np
+import obspy
+import rpy2.robjects as ro
+
+from ispaq import irisseismic
+
+_R_identical = ro.r('base::identical')
+
+# One day of 100 sps integer counts, as read from miniSEED -------------------
+
+data = np.random.randint(-2**23, 2**23, size=8640000).astype(np.int32)
+
+old = ro.vectors.FloatVector(data)
+new = irisseismic.R_float(data)
+print("identical: %s" % _R_identical(old, new)[0])
+
+for label, function in [("FloatVector", lambda: ro.vectors.FloatVector(data)),
+                        ("R_float", lambda: irisseismic.R_float(data))]:
+    seconds = min(timeit.repeat(function, number=1, repeat=3))
+    print("{0:<12} {1:8.3f} s".format(label, seconds))
+
+# R_Stream() of a day file ----------------------------------------------------
+
+filepath = sys.argv[1] if len(sys.argv) > 1 else 'test_data/II.KAPI.00.BHZ.2013.005.M'
+py_stream = obspy.read(filepath)
+print("\n%s: %d trace(s), %d samples" % (filepath, len(py_stream), sum(tr.stats.npts for tr in py_stream)))
+
+single_copy = irisseismic._R_float_array
+irisseismic._R_float_array = ro.vectors.FloatVector
+old = irisseismic.R_Stream(py_stream)
+old_seconds = min(timeit.repeat(lambda: irisseismic.R_Stream(py_stream), number=1, repeat=3))
+irisseismic._R_float_array = single_copy
+new = irisseismic.R_Stream(py_stream)
+new_seconds = min(timeit.repeat(lambda: irisseismic.R_Stream(py_stream), number=1, repeat=3))
+
+print("identical: %s" % _R_identical(old, new)[0])
+print("{0:<12} {1:8.3f} s".format("FloatVector", old_seconds))
+print("{0:<12} {1:8.3f} s".format("R_Stream", new_seconds))
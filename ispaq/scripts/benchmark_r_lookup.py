@@ -0,0 +1,91 @@
+# Benchmark of R function lookups during a simple metrics run
+#
+# Every SNCL-day of a simple metrics run builds one IRISSeismic Stream and
+# calls six IRISMustangMetrics functions. This runs simple_metrics() on the
+# test_data day files twice: once evaluating the R lookups on every call, as
+# ISPAQ used to, and once reusing the handles that irisseismic and
+# irismustangmetrics resolve once. The time per SNCL-day of both runs and
+# their difference are printed.
+#
+# Run from the top-level ispaq directory:
+#
+#   python -m ispaq.scripts.benchmark_r_lookup
+
+from __future__ import (absolute_import, division, print_function)
+
+import argparse
+import logging
+import timeit
+
+import rpy2.robjects as ro
+
+from ispaq import irisseismic
+from ispaq import irismustangmetrics
+from ispaq.concierge import Concierge
+from ispaq.simple_metrics import simple_metrics
+from ispaq.user_request import UserRequest
+
+# gaps, basicStats, stateOfHealth, STALTA, numSpikes and maxRange
+metrics = 'num_gaps,sample_mean,timing_quality,max_stalta,num_spikes,max_range'
+sncl_days = 3
+
+
+class Arguments(argparse.Namespace):
+    """Command line arguments, ``None`` unless given."""
+    def __getattr__(self, name):
+        return None
+
+
+args = Arguments(metrics=metrics,
+                 stations='II.KAPI.00.BHZ',
+                 starttime='2013-01-05',
+                 endtime='2013-01-08',
+                 preferences_file='preference_files/local_example.txt',
+                 dataselect_url='test_data',
+                 station_url='test_data/II.KAPI_station.xml',
+                 output='csv',
+                 metric_engine='R')
+
+logger = logging.getLogger('benchmark_r_lookup')
+logger.addHandler(logging.NullHandler())
+
+# Lookups as they were made before the handles were kept ---------------------
+
+prototype_expressions = {id(irisseismic._R_TraceHeader_prototype): 'new("TraceHeader")',
+                         id(irisseismic._R_Trace_prototype): 'new("Trace")',
+                         id(irisseismic._R_Stream_prototype): 'new("Stream")'}
+handles = (irismustangmetrics._R_metric_function, irisseismic._R_initialize)
+
+
+def metric_function_each_time(metric_function_name):
+    if metric_function_name == 'numSpikes':
+        return ro.r('IRISMustangMetrics::spikesMetric')
+    return ro.r('IRISMustangMetrics::' + metric_function_name + 'Metric')
+
+
+def initialize_each_time(r_object, *args, **kwargs):
+    expression = prototype_expressions.get(id(r_object))
+    if expression is not None:
+        r_object = ro.r(expression)
+    return handles[1](r_object, *args, **kwargs)
+
+
+def run():
+    concierge = Concierge(user_request=UserRequest(args, logger=logger), logger=logger)
+    try:
+        simple_metrics(concierge)
+    finally:
+        concierge.prefetcher.shutdown()
+
+
+# Read the day files and load the R packages before timing
+run()
+
+seconds = {}
+for label, patched in [("ro.r()", (metric_function_each_time, initialize_each_time)),
+                       ("handles", handles)]:
+    (irismustangmetrics._R_metric_function, irisseismic._R_initialize) = patched
+    seconds[label] = min(timeit.repeat(run, number=1, repeat=3)) / sncl_days
+    print("{0:<8} {1:10.3f} ms per SNCL-day".format(label, seconds[label] * 1000))
+
+print("{0:<8} {1:10.3f} ms per SNCL-day".format("saved", (seconds["ro.r()"] - seconds["handles"]) * 1000))
@@ -0,0 +1,118 @@
+# Parity check of native_metrics against IRISMustangMetrics
+#
+# Every metric with a native implementation is calculated with native_metrics
+# on every day file in test_data and compared with the values that
+# IRISMustangMetrics calculated for the same day file. The R values are kept
+# in test_data/native_metrics_reference.csv so that the comparison runs
+# without R; it is also run by the test harness, test_ispaq. Any metricName,
+# value or time that differs is printed and the script exits with status 1.
+#
+# The reference values are written once, on a machine with R and the
+# IRISMustangMetrics package installed, with --write-reference. Day files
+# are converted to IRISSeismic Streams as the Concierge does for local data.
+#
+# Run from the top-level ispaq directory:
+#
+#   python -m ispaq.scripts.parity_native_metrics [--write-reference] [test_data]
+
+from __future__ import (absolute_import, division, print_function)
+
+import argparse
+import glob
+import os
+import sys
+
+import obspy
+import pandas as pd
+from obspy import UTCDateTime
+
+from ispaq import native_metrics
+
+# Metrics and arguments as used in simple_metrics.py
+# NOTE:  STALTA is compared at every sample, as the native engine runs it
+metrics = [('gaps', (), {}),
+           ('basicStats', (), {}),
+           ('STALTA', (), {'staSecs': 3, 'ltaSecs': 30, 'increment': 1, 'algorithm': 'classic_LR'}),
+           ('numSpikes', (41, 10), {'fixedThreshold': True}),
+           ('maxRange', (300, 150), {})]
+
+REFERENCE_FILE = 'native_metrics_reference.csv'
+COLUMNS = ['file', 'function', 'metricName', 'value', 'time']
+
+
+def day_streams(data_dir):
+    """
+    Yields the file name and ``(st, starttime, endtime)`` of every day file.
+    """
+    for filepath in sorted(glob.glob(os.path.join(data_dir, '*.M'))):
+        py_stream = obspy.read(filepath)
+        starttime = UTCDateTime(py_stream[0].stats.starttime.date)
+        endtime = starttime + 24*60*60 - 0.000001
+        py_stream = py_stream.slice(starttime, endtime, nearest_sample=False)
+        yield (os.path.basename(filepath), (py_stream, starttime, endtime))
+
+
+def metric_rows(filename, name, df):
+    # STALTA also reports the time of the maximum
+    times = df['time'] if 'time' in df.columns else [''] * len(df)
+    return [(filename, name, metricName, str(value), str(time))
+            for (metricName, value, time) in zip(df.metricName, df.value, times)]
+
+
+def write_reference(data_dir):
+    """
+    Calculates the metrics in R and writes them to the reference file.
+    """
+    from ispaq import irisseismic
+    from ispaq import irismustangmetrics
+
+    rows = []
+    for (filename, (py_stream, starttime, endtime)) in day_streams(data_dir):
+        r_stream = irisseismic.R_Stream(py_stream, starttime, endtime)
+        for (name, args, kwargs) in metrics:
+            r_df = irismustangmetrics.apply_simple_metric(r_stream, name, *args, **kwargs)
+            rows.extend(metric_rows(filename, name, r_df))
+    pd.DataFrame(rows, columns=COLUMNS).to_csv(os.path.join(data_dir, REFERENCE_FILE), index=False)
+
+
+def compare(data_dir, printer=print):
+    """
+    Compares the native metrics with the reference file.
+
+    :return: Number of metrics that differ.
+    """
+    path = os.path.join(data_dir, REFERENCE_FILE)
+    if not os.path.exists(path):
+        raise IOError("No R reference values in %s; write them with --write-reference where R is installed" % path)
+    reference = pd.read_csv(path, dtype=str, keep_default_na=False)
+    failures = 0
+    for (filename, stream) in day_streams(data_dir):
+        for (name, args, kwargs) in metrics:
+            selected = reference[(reference.file == filename) & (reference.function == name)]
+            r_values = [tuple(row) for row in selected[COLUMNS].values]
+            if len(r_values) == 0:
+                status = 'NO REFERENCE'
+            else:
+                native_df = native_metrics.apply_py_metric(stream, name, *args, **kwargs)
+                native_values = metric_rows(filename, name, native_df)
+                status = 'OK' if r_values == native_values else 'DIFFERENT'
+            printer("{0:<40} {1:<12} {2}".format(filename, name, status))
+            if status != 'OK':
+                failures += 1
+            if status == 'DIFFERENT':
+                for (r_value, native_value) in zip(r_values, native_values):
+                    if r_value != native_value:
+                        printer("    R: %s  native: %s" % (r_value[2:], native_value[2:]))
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--write-reference', action='store_true',
+                        help='calculate the reference values in R')
+    parser.add_argument('data_dir', nargs='?', default='test_data')
+    args = parser.parse_args()
+
+    if args.write_reference:
+        write_reference(args.data_dir)
+    sys.exit(1 if compare(args.data_dir) > 0 else 0)
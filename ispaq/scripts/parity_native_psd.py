@@ -0,0 +1,153 @@
+# Parity check of native_psd against IRISMustangMetrics::PSDMetric
+#
+# The PSD metrics, corrected PSDs and PDFs of every day file in test_data are
+# calculated with native_psd and compared with the values that
+# IRISMustangMetrics calculated for the same day file. The R values are kept
+# in test_data/native_psd_reference.csv so that the comparison runs without R;
+# it is also run by the test harness, test_ispaq. Both are given the same
+# flat instrument response, with the sensitivity of the StationXML file in
+# test_data, so that neither needs the evalresp web service and the bundled
+# StationXML without response stages is enough. Metric values and PDF hits must be identical and corrected PSD
+# power must agree within 1e-6 dB. Differences are printed and the script
+# exits with status 1.
+#
+# The reference values are written once, on a machine with R and the
+# IRISMustangMetrics package installed, with --write-reference. Day files
+# are converted to IRISSeismic Streams as the Concierge does for local data.
+#
+# Run from the top-level ispaq directory:
+#
+#   python -m ispaq.scripts.parity_native_psd [--write-reference] [test_data]
+
+from __future__ import (absolute_import, division, print_function)
+
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+import obspy
+import pandas as pd
+from obspy import UTCDateTime
+
+from ispaq import native_psd
+from ispaq.scripts.parity_native_metrics import day_streams
+
+REFERENCE_FILE = 'native_psd_reference.csv'
+COLUMNS = ['file', 'table', 'name', 'freq', 'value']
+
+
+def flat_evalresp(data_dir, stream):
+    """
+    Returns a flat velocity response at the PSD frequencies of a day file,
+    converted to acceleration, with the overall sensitivity of the channel
+    in the StationXML files of ``data_dir``.
+    """
+    (st, starttime, endtime) = stream
+    stats = st[0].stats
+    inventory = obspy.Inventory()
+    for filepath in glob.glob(os.path.join(data_dir, '*_station.xml')):
+        inventory.extend(obspy.read_inventory(filepath).select(network=stats.network, station=stats.station,
+                                                               location=stats.location, channel=stats.channel))
+    sensitivity = inventory.get_response(st[0].id, starttime + 1).instrument_sensitivity.value
+    freq = native_psd.psdList(st, starttime, endtime)['freq']
+    return pd.DataFrame({'freq': freq, 'amp': sensitivity / (2 * np.pi * freq), 'phase': np.zeros(len(freq))},
+                        columns=['freq', 'amp', 'phase'])
+
+
+def psd_rows(filename, result):
+    (df, PSDCorrected, PDF) = result
+    rows = [(filename, 'metric', metricName, '', str(value))
+            for (metricName, value) in zip(df.metricName, df.value)]
+    rows.extend((filename, 'psd', str(UTCDateTime(starttime)), repr(float(freq)), repr(float(power)))
+                for (starttime, freq, power) in zip(PSDCorrected.starttime, PSDCorrected.freq, PSDCorrected.power))
+    rows.extend((filename, 'pdf', repr(float(power)), repr(float(freq)), str(int(hits)))
+                for (freq, power, hits) in zip(PDF.freq, PDF.power, PDF.hits))
+    return rows
+
+
+def write_reference(data_dir):
+    """
+    Calculates the PSD metrics in R and writes them to the reference file.
+    """
+    from ispaq import irisseismic
+    from ispaq import irismustangmetrics
+
+    rows = []
+    for (filename, stream) in day_streams(data_dir):
+        r_stream = irisseismic.R_Stream(*stream)
+        result = irismustangmetrics.apply_PSD_metric(r_stream, evalresp=flat_evalresp(data_dir, stream))
+        rows.extend(psd_rows(filename, result))
+    pd.DataFrame(rows, columns=COLUMNS).to_csv(os.path.join(data_dir, REFERENCE_FILE), index=False)
+
+
+def differences(r_rows, native_rows):
+    """
+    Returns the differences between the R and native rows of a day file.
+    """
+    found = []
+    tables = {}
+    for (label, rows) in [('R', r_rows), ('native', native_rows)]:
+        for (_, table, name, freq, value) in rows:
+            tables.setdefault((label, table), []).append((name, freq, value))
+
+    r_metrics = tables.get(('R', 'metric'), [])
+    native_metrics = tables.get(('native', 'metric'), [])
+    if r_metrics != native_metrics:
+        found.append("metrics R: %s  native: %s" % (r_metrics, native_metrics))
+
+    r_psds = tables.get(('R', 'psd'), [])
+    native_psds = tables.get(('native', 'psd'), [])
+    if [row[:2] for row in r_psds] != [row[:2] for row in native_psds]:
+        found.append("corrected PSD rows R: %d  native: %d" % (len(r_psds), len(native_psds)))
+    else:
+        r_power = np.array([float(row[2]) for row in r_psds])
+        native_power = np.array([float(row[2]) for row in native_psds])
+        if not np.allclose(r_power, native_power, rtol=0, atol=1e-6, equal_nan=True):
+            found.append("corrected PSD power differs by up to %g dB" % np.nanmax(np.abs(r_power - native_power)))
+
+    r_pdf = [(float(name), float(freq), value) for (name, freq, value) in tables.get(('R', 'pdf'), [])]
+    native_pdf = [(float(name), float(freq), value) for (name, freq, value) in tables.get(('native', 'pdf'), [])]
+    if r_pdf != native_pdf:
+        found.append("PDF hits differ")
+    return found
+
+
+def compare(data_dir, printer=print):
+    """
+    Compares the native PSD metrics with the reference file.
+
+    :return: Number of day files that differ.
+    """
+    path = os.path.join(data_dir, REFERENCE_FILE)
+    if not os.path.exists(path):
+        raise IOError("No R reference values in %s; write them with --write-reference where R is installed" % path)
+    reference = pd.read_csv(path, dtype=str, keep_default_na=False)
+    failures = 0
+    for (filename, stream) in day_streams(data_dir):
+        r_rows = [tuple(row) for row in reference[reference.file == filename][COLUMNS].values]
+        if len(r_rows) == 0:
+            printer("{0:<40} {1}".format(filename, 'NO REFERENCE'))
+            failures += 1
+            continue
+        (st, starttime, endtime) = stream
+        result = native_psd.PSDMetric(st, starttime, endtime, evalresp=flat_evalresp(data_dir, stream))
+        found = differences(r_rows, psd_rows(filename, result))
+        printer("{0:<40} {1}".format(filename, 'DIFFERENT' if found else 'OK'))
+        for difference in found:
+            printer("    %s" % difference)
+        failures += len(found) > 0
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--write-reference', action='store_true',
+                        help='calculate the reference values in R')
+    parser.add_argument('data_dir', nargs='?', default='test_data')
+    args = parser.parse_args()
+
+    if args.write_reference:
+        write_reference(args.data_dir)
+    sys.exit(1 if compare(args.data_dir) > 0 else 0)
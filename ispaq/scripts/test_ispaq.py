@@ -19,13 +19,15 @@ import os
 import time
 import glob
 import argparse
+import doctest
+import importlib
 import logging
 from ispaq.user_request import UserRequest
 
 ## for elegant SIGTERM handling
 import signal
 def signal_term_handler(signal, frame):
-    print 'got SIGTERM...exit.'
+    print('got SIGTERM...exit.')
     sys.exit(0)
     signal.signal(signal.SIGTERM, signal_term_handler) 
     
@@ -57,6 +59,21 @@ def main():
     ch.setFormatter(formatter) 
     logger.addHandler(ch)
    
+    # Run the doctests of the modules that do not need R ---------------------------
+    logger.info("Running doctests...")
+    for module_name in ['ispaq.cache', 'ispaq.mseed', 'ispaq.native_metrics', 'ispaq.native_psd']:
+        (failed, attempted) = doctest.testmod(importlib.import_module(module_name))
+        logger.info("%s: %d of %d doctests failed" % (module_name, failed, attempted))
+
+    # Compare the native engines with the R reference values in test_data ------
+    logger.info("Comparing native metrics with R...")
+    for module_name in ['ispaq.scripts.parity_native_metrics', 'ispaq.scripts.parity_native_psd']:
+        try:
+            failed = importlib.import_module(module_name).compare('test_data', logger.info)
+            logger.info("%s: %d metrics differ from R" % (module_name, failed))
+        except IOError as e:
+            logger.warning("%s: %s" % (module_name, e))
+
     # Process the preferences file ----------------------------------------------
     logger.info("Processing preferences file...") 
     user_request = UserRequest(args, logger=logger) 
@@ -23,6 +23,7 @@ from .concierge import NoAvailableDataError
 from . import utils
 from . import irisseismic
 from . import irismustangmetrics
+from . import native_metrics
 
 def simple_metrics(concierge):
     """
@@ -79,6 +80,21 @@ def simple_metrics(concierge):
 
     logger.debug("channelFilter %s" % channelFilter)
 
+    # Metrics with a NumPy implementation are calculated without R if requested.
+    # NOTE:  The native engine reads ObsPy Streams and only creates R Streams for
+    # NOTE:  metrics without a native implementation, such as stateOfHealth.
+    native = concierge.metric_engine == 'native'
+    if native:
+        apply_simple_metric = native_metrics.apply_py_metric
+        native_names = [name for name in function_metadata if name in native_metrics.METRIC_FUNCTIONS]
+        need_r_stream = len(native_names) < len(function_metadata)
+        headonly = all(name in native_metrics.HEADONLY_METRICS for name in native_names) and not need_r_stream
+    else:
+        apply_simple_metric = irismustangmetrics.apply_simple_metric
+        native_names = []
+        need_r_stream = True
+        headonly = False
+
     # Loop over days
     for day in range(nday):
         starttime = (start + day * 86400)
@@ -105,6 +121,10 @@ def simple_metrics(concierge):
         # Apply the channelFilter and drop multiple epochs
         availability = availability[availability.channel.str.contains(channelFilter)].drop_duplicates(['snclId'])      
 
+        # Request this day's waveforms together where the data source supports it
+        concierge.prefetch_dataselect([(av.network, av.station, av.location, av.channel, starttime, endtime)
+                                       for av in availability.itertuples()], headonly=headonly)
+
         # Loop over rows of the availability dataframe
         logger.info('Calculating simple metrics for %d SNCLs on %s' % (availability.shape[0], str(starttime).split('T')[0]))
 
@@ -116,7 +136,12 @@ def simple_metrics(concierge):
 
             # NOTE:  Use the requested starttime, not just what is available
             try:
-                r_stream = concierge.get_dataselect(av.network, av.station, av.location, av.channel, starttime, endtime, ignoreEpoch=True, inclusiveEnd=False)
+                if need_r_stream:
+                    r_stream = concierge.get_dataselect(av.network, av.station, av.location, av.channel, starttime, endtime, ignoreEpoch=True, inclusiveEnd=False)
+                if native_names:
+                    stream = concierge.get_py_dataselect(av.network, av.station, av.location, av.channel, starttime, endtime, ignoreEpoch=True, inclusiveEnd=False, headonly=headonly)
+                else:
+                    stream = r_stream
             except Exception as e:
                 if str(e).lower().find('no data') > -1:
                     logger.info('No data available for %s' % (av.snclId))
@@ -128,7 +153,7 @@ def simple_metrics(concierge):
 
             if 'gaps' in function_metadata:
                 try:
-                    df = irismustangmetrics.apply_simple_metric(r_stream, 'gaps')
+                    df = apply_simple_metric(stream, 'gaps')
                     dataframes.append(df)
                 except Exception as e:
                     logger.warning('"gaps" metric calculation failed for %s: %s' % (av.snclId, e))
@@ -149,7 +174,7 @@ def simple_metrics(concierge):
 
             if 'basicStats' in function_metadata:  
                 try:
-                    df = irismustangmetrics.apply_simple_metric(r_stream, 'basicStats')
+                    df = apply_simple_metric(stream, 'basicStats')
                     dataframes.append(df)
                 except Exception as e:
                     logger.warning('"basicStats" metric calculation failed for %s: %s' % (av.snclId, e))
@@ -162,11 +187,21 @@ def simple_metrics(concierge):
             # NOTE:  ahead a few points as determined by the "increment" parameter.
             # NOTE:  An increment that translates to 0.2-0.5 secs seems to be a good compromise
             # NOTE:  between performance and accuracy.
+            # NOTE:  The native engine calculates STA/LTA at every point in linear time.
 
             if 'STALTA' in function_metadata:
                 if av.channel.startswith(('BH','HH','CH','DH','EH','SH','LH','MH','DP','SP','LP','EP','EL','HL','LL','BL','SL','BX','HX')):
+                    # NOTE:  Channels with multiple metadata epochs are skipped. The native engine checks
+                    # NOTE:  the epochs in the metadata; the R stream is requested again and served from
+                    # NOTE:  the Concierge waveform cache.
                     try:
-                        r_stream_stalta = concierge.get_dataselect(av.network, av.station, av.location, av.channel, starttime, endtime, inclusiveEnd=False)
+                        if native:
+                            availability_stalta = concierge.get_availability(av.network, av.station, av.location, av.channel, starttime, endtime - 0.000001)
+                            if availability_stalta is not None and len(availability_stalta) > 1:
+                                raise Exception("Multiple metadata epochs found for %s" % av.snclId)
+                            stream_stalta = stream
+                        else:
+                            stream_stalta = concierge.get_dataselect(av.network, av.station, av.location, av.channel, starttime, endtime, inclusiveEnd=False)
                     except Exception as e:
                         if str(e).lower().find('no data') > -1:
                             logger.info('No data available for %s' % (av.snclId))
@@ -176,11 +211,14 @@ def simple_metrics(concierge):
                             logger.warning('No data available for %s from %s: %s' % (av.snclId, concierge.dataselect_url, e))
                         continue
 
-                    sampling_rate = utils.get_slot(r_stream_stalta, 'sampling_rate')
-                    increment = math.ceil(sampling_rate / 2.0)
+                    if concierge.metric_engine == 'native':
+                        increment = 1
+                    else:
+                        sampling_rate = utils.get_slot(stream_stalta, 'sampling_rate')
+                        increment = math.ceil(sampling_rate / 2.0)
                 
                     try:
-                        df = irismustangmetrics.apply_simple_metric(r_stream_stalta, 'STALTA', staSecs=3, ltaSecs=30, increment=increment, algorithm='classic_LR')
+                        df = apply_simple_metric(stream_stalta, 'STALTA', staSecs=3, ltaSecs=30, increment=increment, algorithm='classic_LR')
                         dataframes.append(df)
                     except Exception as e:
                         logger.warning('"STALTA" metric calculation failed for for %s: %s' % (av.snclId, e))
@@ -199,7 +237,7 @@ def simple_metrics(concierge):
                     thresholdMin = 10
                            
                     try:
-                        df = irismustangmetrics.apply_simple_metric(r_stream, 'numSpikes', windowSize, thresholdMin, fixedThreshold=True)
+                        df = apply_simple_metric(stream, 'numSpikes', windowSize, thresholdMin, fixedThreshold=True)
                         dataframes.append(df)
                     except Exception as e:
                         logger.warning('"numSpikes" metric calculation failed for %s: %s' % (av.snclId, e))            
@@ -215,7 +253,7 @@ def simple_metrics(concierge):
                     increment = 150
                     
                     try:
-                        df = irismustangmetrics.apply_simple_metric(r_stream, 'maxRange', windowSize, increment)
+                        df = apply_simple_metric(stream, 'maxRange', windowSize, increment)
                         dataframes.append(df)
                     except Exception as e:
                         logger.warning('"maxRange" metric calculation failed for for %s: %s' % (av.snclId, e))
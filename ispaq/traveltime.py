@@ -0,0 +1,120 @@
+"""
+Seismic travel times for ISPAQ event-based metrics.
+
+Travel times are obtained from a selectable provider and memoized per event.
+TauP times are memoized per distance bin, so that stations at nearly the same
+distance from an event share one calculation; web service times are memoized
+per station location.
+
+Providers:
+
+* ``taup``: computed locally with ObsPy TauP and the iasp91 model, no network
+  access required
+* ``irisws``: the IRIS DMC traveltime web service, through IRISSeismic
+
+:copyright:
+    Mazama Science
+:license:
+    GNU Lesser General Public License, Version 3
+    (http://www.gnu.org/copyleft/lesser.html)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import pandas as pd
+
+from . import cache
+from . import geodetics
+
+
+PROVIDERS = ('taup', 'irisws')
+
+# Columns of the dataframe returned by irisseismic.getTraveltime()
+_COLUMNS = ('distance', 'depth', 'phaseName', 'travelTime', 'rayParam',
+            'takeoff', 'incident', 'puristDistance', 'puristName')
+
+
+class TravelTimes(object):
+    """
+    Memoizing travel time calculator.
+
+    :type provider: str
+    :param provider: One of ``PROVIDERS``.
+    :type model: str
+    :param model: Velocity model used by the ``taup`` provider.
+    :type distance_bin: float
+    :param distance_bin: Width in degrees of the distance bins that share a
+        ``taup`` calculation.
+    :type maxsize: int
+    :param maxsize: Maximum number of memoized results.
+    """
+    def __init__(self, provider='irisws', model='iasp91', distance_bin=0.01, maxsize=10000, logger=None):
+        if provider not in PROVIDERS:
+            raise ValueError("traveltime provider '%s' is not one of %s" % (provider, ', '.join(PROVIDERS)))
+        self.provider = provider
+        self.model = model
+        self.distance_bin = distance_bin
+        self.logger = logger
+        self._taup_model = None
+        self._results = cache.LRUCache(maxsize)
+
+    def get_traveltime(self, latitude, longitude, depth, staLatitude, staLongitude):
+        """
+        Returns a pandas dataframe of phase arrivals at a station.
+
+        The dataframe has the columns of :func:`irisseismic.getTraveltime`:
+        ``distance, depth, phaseName, travelTime, rayParam, takeoff, incident,
+        puristDistance, puristName``.
+
+        :param latitude: Latitude of seismic event.
+        :param longitude: Longitude of seismic event.
+        :param depth: Depth of seismic event in km.
+        :param staLatitude: Latitude of seismic station.
+        :param staLongitude: Longitude of seismic station.
+        """
+        if self.provider == 'taup':
+            distance = geodetics.distaz(latitude, longitude, staLatitude, staLongitude)[0][0]
+            distance_bin = int(round(distance / self.distance_bin))
+            key = (float(latitude), float(longitude), float(depth), distance_bin)
+        else:
+            # The web service reports the distance to the station it was given
+            key = (float(latitude), float(longitude), float(depth), float(staLatitude), float(staLongitude))
+
+        df = self._results.get(key)
+        if df is None:
+            if self.provider == 'taup':
+                df = self._taup(depth, distance_bin * self.distance_bin)
+            else:
+                # Imported here so that the taup provider does not require R
+                from . import irisseismic
+                df = irisseismic.getTraveltime(latitude, longitude, depth, staLatitude, staLongitude)
+            self._results.put(key, df)
+
+        return df.copy()
+
+    def _taup(self, depth, distance):
+        """
+        Returns travel times computed with ObsPy TauP for a distance in degrees.
+        """
+        if self._taup_model is None:
+            from obspy.taup import TauPyModel
+            if self.logger is not None:
+                self.logger.debug("Loading TauP model %s" % self.model)
+            self._taup_model = TauPyModel(model=self.model)
+
+        # TauP does not accept sources above the surface
+        depth = max(float(depth), 0.0)
+        arrivals = self._taup_model.get_travel_times(source_depth_in_km=depth,
+                                                     distance_in_degree=distance,
+                                                     phase_list=('ttall',))
+        rows = [(a.distance, depth, a.name, a.time, a.ray_param_sec_degree,
+                 a.takeoff_angle, a.incident_angle, a.purist_distance, a.purist_name)
+                for a in arrivals]
+        if len(rows) == 0:
+            raise ValueError("No %s arrivals at %.2f degrees for depth %.1f km" % (self.model, distance, depth))
+        return pd.DataFrame(rows, columns=_COLUMNS)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(exclude_empty=True)
@@ -18,6 +18,7 @@ from obspy import UTCDateTime
 
 # ISPAQ modules
 from . import irismustangmetrics
+from . import native_metrics
 
 from .ispaq import currentispaq
 
@@ -157,6 +158,7 @@ class UserRequest(object):
             self.dataselect_url = args.dataselect_url
             self.event_url = args.event_url
             self.resp_dir = args.resp_dir
+            self.archive_layout = args.archive_layout
             
             self.output = args.output
             self.db_name = args.db_name
@@ -169,6 +171,13 @@ class UserRequest(object):
             self.plot_include = args.plot_include
             self.pdf_dir = args.pdf_dir
             self.psd_dir = args.psd_dir
+            self.cache_dir = args.cache_dir
+            self.waveform_cache_size = args.waveform_cache_size
+            self.traveltime_provider = args.traveltime_provider
+            self.prefetch_depth = args.prefetch_depth
+            self.prefetch_memory = args.prefetch_memory
+            self.metric_engine = args.metric_engine
+            self.psd_engine = args.psd_engine
             
             
 
@@ -274,6 +283,10 @@ class UserRequest(object):
                 if 'resp_dir' in data_access:
                     self.resp_dir = data_access['resp_dir']
 
+            if self.archive_layout is None:
+                if 'archive_layout' in data_access:
+                    self.archive_layout = data_access['archive_layout']
+
             # assign station and metrics aliases 
             try:
                 self.metrics = metric_sets[self.requested_metric_set]  # list assignment
@@ -334,6 +347,69 @@ class UserRequest(object):
             else:
                 self.psd_dir = os.path.abspath(os.path.expanduser(self.psd_dir))
 
+            if self.cache_dir is None:
+                if 'cache_dir' in preferences and preferences['cache_dir'] is not None:
+                    self.cache_dir = os.path.abspath(os.path.expanduser(preferences['cache_dir']))
+            else:
+                self.cache_dir = os.path.abspath(os.path.expanduser(self.cache_dir))
+
+            if self.waveform_cache_size is None:
+                if 'waveform_cache_size' in preferences and preferences['waveform_cache_size'] is not None:
+                    self.waveform_cache_size = preferences['waveform_cache_size']
+                else:
+                    self.waveform_cache_size = 500
+            try:
+                self.waveform_cache_size = float(self.waveform_cache_size)
+            except ValueError:
+                logger.critical('waveform_cache_size %s is not valid' % self.waveform_cache_size)
+                raise SystemExit
+
+            if self.traveltime_provider is None:
+                if 'traveltime_provider' in preferences and preferences['traveltime_provider'] is not None:
+                    self.traveltime_provider = preferences['traveltime_provider']
+                else:
+                    self.traveltime_provider = 'irisws'
+
+            if self.prefetch_depth is None:
+                if 'prefetch_depth' in preferences and preferences['prefetch_depth'] is not None:
+                    self.prefetch_depth = preferences['prefetch_depth']
+                else:
+                    self.prefetch_depth = 4
+            try:
+                self.prefetch_depth = int(self.prefetch_depth)
+            except ValueError:
+                logger.critical('prefetch_depth %s is not valid' % self.prefetch_depth)
+                raise SystemExit
+
+            if self.prefetch_memory is None:
+                if 'prefetch_memory' in preferences and preferences['prefetch_memory'] is not None:
+                    self.prefetch_memory = preferences['prefetch_memory']
+                else:
+                    self.prefetch_memory = 500
+            try:
+                self.prefetch_memory = float(self.prefetch_memory)
+            except ValueError:
+                logger.critical('prefetch_memory %s is not valid' % self.prefetch_memory)
+                raise SystemExit
+
+            if self.metric_engine is None:
+                if 'metric_engine' in preferences and preferences['metric_engine'] is not None:
+                    self.metric_engine = preferences['metric_engine']
+                else:
+                    self.metric_engine = 'R'
+            if self.metric_engine not in native_metrics.ENGINES:
+                logger.critical('metric_engine %s is not one of %s' % (self.metric_engine, ', '.join(native_metrics.ENGINES)))
+                raise SystemExit
+
+            if self.psd_engine is None:
+                if 'psd_engine' in preferences and preferences['psd_engine'] is not None:
+                    self.psd_engine = preferences['psd_engine']
+                else:
+                    self.psd_engine = 'R'
+            if self.psd_engine not in native_metrics.ENGINES:
+                logger.critical('psd_engine %s is not one of %s' % (self.psd_engine, ', '.join(native_metrics.ENGINES)))
+                raise SystemExit
+
             if self.pdf_type is None:
                 if 'pdf_type' in pdf_preferences:
                     self.pdf_type = pdf_preferences['pdf_type']
@@ -522,10 +522,23 @@ def getSpectra(st, sampling_rate, metric, concierge):
     if (math.isnan(sampling_rate)):
        raise Exception("no sampling_rate was passed to getSpectra")   
 
+    channel = get_slot(st,'channel')
+
     # Min and Max frequencies for evalresp will be those used for the cross spectral binning
     alignFreq = 0.1
 
-    if (sampling_rate <= 1):
+    if (metric == "PSD"):
+        # PSD frequencies are binned by band code in IRISSeismic::psdList
+        if channel.startswith('V'):
+            loFreq = 0.0001
+            alignFreq = 0.025
+        elif channel.startswith('L'):
+            loFreq = 0.001
+        elif channel.startswith('M'):
+            loFreq = 0.0025
+        else:
+            loFreq = 0.005
+    elif (sampling_rate <= 1):
         loFreq = 0.001
     elif (sampling_rate > 1 and sampling_rate < 10):
         loFreq = 0.0025
@@ -580,43 +593,13 @@ def getSpectra(st, sampling_rate, metric, concierge):
     network = get_slot(st,'network')
     station = get_slot(st,'station')
     location = get_slot(st,'location')
-    channel = get_slot(st,'channel')
     starttime = get_slot(st,'starttime')
+    if (metric == "PSD"):
+        # IRISSeismic::psdStatistics evaluates the response 1 second after the first PSD starts
+        starttime = starttime + 1
   
-    # REC - invoke evalresp either programmatically from a RESP file or by invoking the web service 
-
-    evalResp = None
-    respDir = concierge.resp_dir
-    
-    if (respDir):
-        # calling local evalresp -- generate the target file based on the SNCL identifier
-        # file pattern:  RESP.<NET>.<STA>.<LOC>.<CHA> or RESP.<STA>.<NET>.<LOC>.<CHA>
-        localFile = os.path.join(respDir,".".join(["RESP", network, station, location, channel])) # attempt to find the RESP file
-        localFile2 = os.path.join(respDir,".".join(["RESP", station, network, location, channel])) # alternate pattern
-        for localFiles in (localFile, localFile + ".txt", localFile2, localFile2 + ".txt"):
-            if (os.path.exists(localFiles)):
-                concierge.logger.debug('Found local RESP file %s' % localFiles)
-                debugMode = False
-
-                try:
-                    evalResp = evresp.getEvalresp(localFiles, network, station, location, channel, starttime,
-                                       minfreq, maxfreq, nfreq, units.upper(), output.upper(), "LOG", debugMode)
-                except Exception as e:
-                    raise 
-
-                if evalResp is not None:
-                    break   # break early from loop if we found a result
-        if evalResp is None:
-            raise EvalrespException('No RESP file found at %s[.txt] or %s[.txt]' % (localFile,localFile2))
-
-    else:    
-        # calling the web service 
-        try:
-            evalResp = irisseismic.getEvalresp(concierge.dataselect_url, concierge.dataselect_type, network, station, location, channel, starttime,
-                                       minfreq, maxfreq, nfreq, units.lower(), output.lower())
-        except Exception as e:
-            raise
-    return(evalResp)
+    return _getEvalresp(network, station, location, channel, starttime,
+                        minfreq, maxfreq, nfreq, units, output, concierge)
 
 
 def getSampleRateSpectra(r_stream,sampling_rate,norm_freq, concierge):
@@ -640,39 +623,82 @@ def getSampleRateSpectra(r_stream,sampling_rate,norm_freq, concierge):
     channel = get_slot(r_stream,'channel')
     starttime = get_slot(r_stream,'starttime')
 
-    evalResp = None
-    respDir = concierge.resp_dir
-
     concierge.logger.debug('minfreq %f, maxfreq %f, nfreq %f' % (minfreq,maxfreq,nfreq))
 
+    return _getEvalresp(network, station, location, channel, starttime,
+                        minfreq, maxfreq, nfreq, units, output, concierge)
+
+
+def _getEvalresp(network, station, location, channel, starttime, minfreq, maxfreq, nfreq, units, output, concierge):
+    # This function returns the evalresp response of a channel, running evalresp on a
+    # local RESP file when concierge.resp_dir is set or invoking the web service otherwise.
+    #
+    # A response never changes within a channel epoch, so responses are cached in memory
+    # and in cache_dir by response source, SNCL, metadata epoch, frequency grid and units.
+    # Channels whose epoch is not in the metadata already read are not cached.
+
+    respDir = concierge.resp_dir
+
     if (respDir):
         # calling local evalresp -- generate the target file based on the SNCL identifier
         # file pattern:  RESP.<NET>.<STA>.<LOC>.<CHA> or RESP.<STA>.<NET>.<LOC>.<CHA>
         localFile = os.path.join(respDir,".".join(["RESP", network, station, location, channel])) # attempt to find the RESP file
         localFile2 = os.path.join(respDir,".".join(["RESP", station, network, location, channel])) # alternate pattern
-        for localFiles in (localFile, localFile + ".txt", localFile2, localFile2 + ".txt"):
-            if (os.path.exists(localFiles)):
-                concierge.logger.debug('Found local RESP file %s' % localFiles)
-                debugMode = False
-
-                try:
-                    evalResp = evresp.getEvalresp(localFiles, network, station, location, channel, starttime,
-                                       minfreq, maxfreq, nfreq, units.upper(), output.upper(), "LOG", debugMode)
-                except Exception as e:
-                    raise
-
-                if evalResp is not None:
-                    break   # break early from loop if we found a result
+        localFiles = [f for f in (localFile, localFile + ".txt", localFile2, localFile2 + ".txt") if os.path.exists(f)]
+        source = tuple((os.path.abspath(f), os.stat(f).st_size, os.stat(f).st_mtime) for f in localFiles)
+    elif concierge.dataselect_type != "ph5ws":
+        # only IRIS hosts irisws/evalresp: local miniSEED files and FDSN data centers use the IrisClient default site
+        source = (None, None)
+    else:
+        source = (concierge.dataselect_url, concierge.dataselect_type)
+
+    epoch = concierge.get_channel_epoch(network, station, location, channel, starttime)
+    key = None
+    if epoch is not None:
+        key = (source, network, station, location, channel, epoch,
+               float(minfreq), float(maxfreq), int(nfreq), units.lower(), output.lower())
+        evalResp = concierge.evalresp_cache.get(key)
+        if evalResp is None:
+            evalResp = concierge.evalresp_disk_cache.get(key)
+            if evalResp is not None:
+                concierge.evalresp_cache.put(key, evalResp)
+        if evalResp is not None:
+            concierge.logger.debug('Using cached evalresp response for %s.%s.%s.%s' % (network, station, location, channel))
+            # Callers are free to modify what they are given
+            return evalResp.copy()
+
+    # REC - invoke evalresp either programmatically from a RESP file or by invoking the web service 
+
+    evalResp = None
+
+    if (respDir):
+        for respFile in localFiles:
+            concierge.logger.debug('Found local RESP file %s' % respFile)
+            debugMode = False
+
+            try:
+                evalResp = evresp.getEvalresp(respFile, network, station, location, channel, starttime,
+                                   minfreq, maxfreq, nfreq, units.upper(), output.upper(), "LOG", debugMode)
+            except Exception as e:
+                raise
+
+            if evalResp is not None:
+                break   # break early from loop if we found a result
         if evalResp is None:
             raise EvalrespException('No RESP file found at %s[.txt] or %s[.txt]' % (localFile,localFile2))
 
     else:
         # calling the web service
         try:
-            evalResp = irisseismic.getEvalresp(concierge.dataselect_url, concierge.dataselect_type, network, station, location, channel, starttime,
+            evalResp = irisseismic.getEvalresp(source[0], source[1], network, station, location, channel, starttime,
                                        minfreq, maxfreq, nfreq, units.lower(), output.lower())
         except Exception as e:
             raise
+
+    if key is not None:
+        concierge.evalresp_cache.put(key, evalResp)
+        concierge.evalresp_disk_cache.put(key, evalResp)
+        evalResp = evalResp.copy()
     return(evalResp)
 
     